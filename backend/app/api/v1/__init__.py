@@ -1,7 +1,9 @@
 from .detect import detect_router
 from .history import history_router
+from .analytics import analytics_router
 
 __all__ = [
     "detect_router",
-    "history_router"
+    "history_router",
+    "analytics_router"
     ]
\ No newline at end of file
@@ -0,0 +1,79 @@
+import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.core.logger import setup_logger, setup_request_logger
+from app.core.models import PeopleCountRollup
+from app.database.db import get_db
+
+logger = setup_logger(__name__)
+request_logger = setup_request_logger(__name__)
+analytics_router = APIRouter()
+
+
+def _rollup_query(query, granularity: str, date_from, date_to):
+    query = query.filter(PeopleCountRollup.granularity == granularity)
+    if date_from is not None:
+        query = query.filter(PeopleCountRollup.bucket_start >= date_from)
+    if date_to is not None:
+        query = query.filter(PeopleCountRollup.bucket_start <= date_to)
+    return query
+
+
+@analytics_router.get("")
+def get_people_analytics(
+    granularity: str = Query("hour", pattern="^(minute|hour|day)$"),
+    date_from: Optional[datetime.datetime] = Query(None),
+    date_to: Optional[datetime.datetime] = Query(None),
+    limit: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_db)
+):
+    """
+    People-count trends per minute, hour or day, answered from the pre-aggregated
+    rollups instead of scanning detection records. Buckets without detections are omitted.
+    """
+    try:
+        request_logger.info("Retrieving analytics: granularity=%s, date_from=%s, date_to=%s, limit=%s",
+                            granularity, date_from, date_to, limit)
+        buckets = _rollup_query(db.query(PeopleCountRollup), granularity, date_from, date_to) \
+            .order_by(PeopleCountRollup.bucket_start).limit(limit).all()
+        detections, people_sum, people_max = _rollup_query(
+            db.query(func.sum(PeopleCountRollup.detections), func.sum(PeopleCountRollup.people_sum),
+                     func.max(PeopleCountRollup.people_max)),
+            granularity, date_from, date_to
+        ).one()
+        detections = int(detections or 0)
+        people_sum = int(people_sum or 0)
+
+        return {
+            "status": "success",
+            "message": "Analytics retrieved successfully",
+            "data": {
+                "granularity": granularity,
+                "buckets": [
+                    {
+                        "bucket_start": bucket.bucket_start,
+                        "detections": bucket.detections,
+                        "people_sum": bucket.people_sum,
+                        "people_avg": round(bucket.people_sum / bucket.detections, 3) if bucket.detections else 0.0,
+                        "people_max": bucket.people_max
+                    }
+                    for bucket in buckets
+                ],
+                "summary": {
+                    "detections": detections,
+                    "people_sum": people_sum,
+                    "people_avg": round(people_sum / detections, 3) if detections else 0.0,
+                    "people_max": people_max or 0
+                }
+            }
+        }
+
+    except Exception as e:
+        logger.error(f"An error occurred: {str(e)}")
+        return {
+            "status": "error",
+            "message": f"An error occurred: {str(e)}",
+            "data": None
+        }
@@ -1,50 +1,159 @@
 import os
-import json
-import shutil
 import uuid
+import asyncio
 import datetime
-import base64
-import cv2
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Query
+import mimetypes
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from typing import List
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query, BackgroundTasks, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from app.core.logger import setup_logger
-from app.core.detector import detect_person
-from app.core.models import DetectionRecord
-from app.database.schema import DetectionResponse
-from app.database.db import get_db
+from app.core.logger import setup_logger, setup_request_logger, logging_stats
+from app.core.detector import detect_person, detect_person_batch, detector_client, CircuitOpenError, CONFIDENT_THRESHOLD
+from app.core.cache import ResultCache, make_cache_key_async, CACHE_ENABLED
+from app.core.archive import is_archive, extract_images
+from app.core.render import renderer, result_extension, RENDER_MODE
+from app.core.detections import Detections
+from app.core.derivatives import derivative_cache
+from app.core.storage import storage
+from app.core.metrics import timed, timed_call, observe_since_start
+from app.core.ingest import (read_upload, decode_image, save_original, downscale_for_detection,
+                             ingest_stats, UploadTooLargeError, UPLOAD_SAVE_MODE, DETECT_MAX_SIDE)
+from app.database.db import get_db, get_write_db
+from app.database.records import persist_records, find_detections
+from app.database.writebehind import write_buffer
+from app.database.counts import count_cache
+from app.database.rollups import rollup_buffer
 
 logger = setup_logger(__name__)
+request_logger = setup_request_logger(__name__)
 detect_router = APIRouter()
 
-@detect_router.post("/")
-async def detect_people(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    # Validate file type
-    if not file.content_type.startswith("image/"):
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", 1000))
+DETECT_BATCH_CHUNK = int(os.getenv("DETECT_BATCH_CHUNK", 64))
+DETECT_MODEL_VERSION = os.getenv("DETECT_MODEL_VERSION", "yolo12s.onnx")
+# Result images never change once written, so clients may keep them for a long time
+IMAGE_CACHE_MAX_AGE = int(os.getenv("IMAGE_CACHE_MAX_AGE", 86400))
+
+# Detection results and annotated images for previously seen uploads
+result_cache = ResultCache() if CACHE_ENABLED else None
+
+# Thumbnails are built as soon as the full image is rendered
+renderer.on_rendered.append(derivative_cache.prebuild)
+
+def detector_unavailable(error: CircuitOpenError):
+    """
+    Builds the 503 response returned while the detector circuit is open.
+    """
+    return HTTPException(
+        status_code=503,
+        detail={
+            "status": "error",
+            "message": "Detector service is temporarily unavailable",
+            "data": None
+        },
+        headers={"Retry-After": str(int(error.retry_after))}
+    )
+
+async def save_records(db, rows: list) -> list:
+    """
+    Persists detection records, through the write-behind buffer when it is enabled.
+    Returns:
+        list: The ids of the records, in the order of `rows`.
+    """
+    if write_buffer is not None:
+        return await write_buffer.submit(rows)
+    return await persist_records(db, rows)
+
+def check_detections(detect_results):
+    """
+    Rejects detections without usable box coordinates, checked on the box arrays.
+    """
+    if not isinstance(detect_results, Detections) or not detect_results.valid:
         raise HTTPException(
-                status_code=400,
-                detail={
-                    "status": "error",
-                    "message": "File must be an image",
-                    "data": None
-                }
-            )
-    
+            status_code=500,
+            detail={
+                "status": "error",
+                "message": "Invalid detection result format: boxes and confidences do not line up",
+                "data": None
+            }
+        )
+
+async def store_original(background_tasks: BackgroundTasks, upload_path: str, contents: bytes):
+    """
+    Persists the original upload according to UPLOAD_SAVE_MODE.
+    """
+    if UPLOAD_SAVE_MODE == "sync":
+        await save_original(upload_path, contents)
+    elif UPLOAD_SAVE_MODE == "async":
+        background_tasks.add_task(save_original, upload_path, contents)
+
+async def store_and_render(background_tasks: BackgroundTasks, upload_path: str, result_path: str, contents: bytes,
+                           detect_results: Detections, img=None):
+    """
+    Stores the original upload and renders the annotated image according to RENDER_MODE:
+    before returning ("sync"), on the render pool ("background") or on its first GET ("lazy").
+    Background renders beyond RENDER_MAX_PENDING are deferred to the lazy path.
+    """
+    if RENDER_MODE == "lazy":
+        # The stored original is what the image is rendered from later
+        await save_original(upload_path, contents)
+        renderer.remember(result_path, detect_results)
+        return
+    await store_original(background_tasks, upload_path, contents)
+    if RENDER_MODE == "sync":
+        await renderer.render(result_path, detect_results, img=img, contents=contents)
+    elif not renderer.submit(result_path, detect_results, img=img, contents=contents) and UPLOAD_SAVE_MODE == "off":
+        # The render backlog is full and falls back to the lazy path, which renders from the stored original
+        await save_original(upload_path, contents)
+
+def upload_too_large(error: UploadTooLargeError):
+    return HTTPException(
+        status_code=413,
+        detail={
+            "status": "error",
+            "message": str(error),
+            "data": None
+        }
+    )
+
+async def process_upload(contents: bytes, original_filename: str, content_type: str, background_tasks: BackgroundTasks):
+    """
+    Runs person detection on an in-memory upload and hands the annotated result image
+    to the renderer. The upload buffer is shared by the detector call and the decode
+    used for annotation, and the original is stored in the background (or not at all)
+    depending on UPLOAD_SAVE_MODE.
+    Returns:
+        tuple: (detections, result_path, result_image_url)
+    """
     # Create unique filename
     file_id = str(uuid.uuid4())
-    original_filename = file.filename
     extension = original_filename.split(".")[-1]
     upload_path = f"uploads/{file_id}.{extension}"
-    result_path = f"results/{file_id}.{extension}"
-    
-    # Save uploaded file
-    with open(upload_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
+    result_name = f"{file_id}.{result_extension(original_filename)}"
+    result_path = f"results/{result_name}"
+
+    # Decode for annotation while the detector works on the same bytes; other
+    # render modes decode on the render pool instead
+    decode_task = (asyncio.ensure_future(run_in_threadpool(timed_call, "decode", decode_image, contents))
+                   if RENDER_MODE == "sync" else None)
+
+    # Optionally send the detector a downscaled copy instead of the full-resolution upload
+    img = None
+    payload, payload_type, scale, payload_bytes = contents, content_type, 1.0, 0
+    if DETECT_MAX_SIDE > 0:
+        img = (await decode_task if decode_task is not None
+               else await run_in_threadpool(timed_call, "decode", decode_image, contents))
+        if img is not None:
+            encoded, scale = await run_in_threadpool(timed_call, "downscale", downscale_for_detection, img)
+            if encoded is not None:
+                payload, payload_type, payload_bytes = encoded, "image/jpeg", len(encoded)
+
     # Run person detection
     try:
-        detection_response = detect_person(upload_path)
+        detection_response = await detect_person(payload, original_filename, payload_type, scale)
         if not isinstance(detection_response, dict) or "data" not in detection_response or "detections" not in detection_response["data"]:
             raise HTTPException(
                 status_code=500,
@@ -55,7 +164,13 @@ async def detect_people(file: UploadFile = File(...), db: Session = Depends(get_
                 }
             )
         detect_results = detection_response["data"]["detections"]
+    except CircuitOpenError as e:
+        if decode_task is not None:
+            decode_task.cancel()
+        raise detector_unavailable(e)
     except Exception as e:
+        if decode_task is not None:
+            decode_task.cancel()
         raise HTTPException(
             status_code=500,
             detail={
@@ -64,37 +179,16 @@ async def detect_people(file: UploadFile = File(...), db: Session = Depends(get_
                 "data": None
             }
         )
-    
-    # Process detections and save cropped images
+    check_detections(detect_results)
+
+    # Store the original and render (or schedule) the annotated image
     try:
-        # Read the image using OpenCV
-        img = cv2.imread(upload_path)
-        if img is None:
-            raise HTTPException(status_code=500, detail="Failed to read the image")
-        
-        for idx, detection in enumerate(detect_results):
-            try:
-                x_min, y_min, x_max, y_max = map(int, [
-                    detection["x_min"], detection["y_min"], detection["x_max"], detection["y_max"]
-                ])
-            except KeyError as e:
-                raise HTTPException(
-                    status_code=500,
-                    detail={
-                        "status": "error",
-                        "message": "Invalid detection result format: " + str(e),
-                        "data": None
-                    }
-                )
-            
-            # Draw bounding box on the image
-            label = f"Person {idx+1}"
-            cv2.rectangle(img, (x_min, y_min), (x_max, y_max), (0, 255, 0), 2)
-            cv2.putText(img, label, (x_min, y_min - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        if decode_task is not None:
+            img = await decode_task
+            if img is None:
+                raise HTTPException(status_code=500, detail="Failed to read the image")
+        await store_and_render(background_tasks, upload_path, result_path, contents, detect_results, img)
 
-        # Save the final image with bounding boxes
-        cv2.imwrite(result_path, img)
-    
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -104,46 +198,322 @@ async def detect_people(file: UploadFile = File(...), db: Session = Depends(get_
                 "data": None
             }
         )
+
+    peak = ingest_stats.record(len(contents), img.nbytes if img is not None else 0, payload_bytes)
+    request_logger.debug("Request held %d bytes in memory for %s", peak, original_filename)
+    return detect_results, result_path, f"/images/{result_name}"
+
+
+@detect_router.post("/")
+async def detect_people(request: Request, background_tasks: BackgroundTasks, file: UploadFile = File(...),
+                        db = Depends(get_write_db)):
+    observe_since_start(request)
+    # Validate file type
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(
+                status_code=400,
+                detail={
+                    "status": "error",
+                    "message": "File must be an image",
+                    "data": None
+                }
+            )
+    
+    original_filename = file.filename
+    try:
+        with timed("upload_read"):
+            contents = await read_upload(file)
+    except UploadTooLargeError as e:
+        raise upload_too_large(e)
+
+    # Byte-identical uploads reuse the stored detections and annotated image
+    cache_key = await make_cache_key_async(contents, "person", CONFIDENT_THRESHOLD, DETECT_MODEL_VERSION)
+    cached = result_cache.get(cache_key) if result_cache is not None else None
+    if cached is not None and await renderer.available(cached["result_path"]):
+        request_logger.info("Cache hit for %s", original_filename)
+        detect_results = cached["detections"]
+        result_path = cached["result_path"]
+        result_image_url = cached["result_image_url"]
+    else:
+        if cached is not None:
+            # The annotated image and its original were removed from storage; the entry is stale
+            result_cache.invalidate(cache_key)
+        detect_results, result_path, result_image_url = await process_upload(contents, original_filename, file.content_type, background_tasks)
+        if result_cache is not None:
+            result_cache.put(cache_key, {
+                "detections": detect_results,
+                "result_path": result_path,
+                "result_image_url": result_image_url
+            })
             
-    # Create database record
-    db_record = DetectionRecord(
-        timestamp=datetime.datetime.now(),
-        people_count=len(detect_results),
-        result_image_url=result_path,
-        original_filename=original_filename,
-    )
-    db.add(db_record)
-    db.commit()
-    db.refresh(db_record)
+    # Create database record; the id comes back without a refresh (RETURNING, or pre-allocated when write-behind is on)
+    db_record = {
+        "timestamp": datetime.datetime.now(),
+        "people_count": len(detect_results),
+        "result_image_url": result_path,
+        "original_filename": original_filename,
+        "detections": detect_results.to_columns(),
+    }
+    record_id, = await save_records(db, [db_record])
     
     # Return response
     return {
         "status": "success",
         "message": "Detection completed successfully",
         "data": {
-            "id": db_record.id,
-            "timestamp": db_record.timestamp,
+            "id": record_id,
+            "timestamp": db_record["timestamp"],
             "people_count": len(detect_results),
-            "result_image_url": f"/images/{file_id}.{extension}",
-            "original_filename": original_filename
+            "result_image_url": result_image_url,
+            "original_filename": original_filename,
+            "detections": detect_results.to_dicts()
         }
     }
 
 
+
+@detect_router.post("/batch")
+async def detect_people_batch(request: Request, background_tasks: BackgroundTasks, files: List[UploadFile] = File(...),
+                              db = Depends(get_write_db)):
+    """
+    Detect people in many images at once. Each part may be an image or a zip/tar
+    archive of images. Results are returned in input order and all history
+    records are written with a single bulk insert.
+    """
+    observe_since_start(request)
+
+    # Collect (filename, bytes, content_type) for every image in the request
+    images = []
+    for upload in files:
+        try:
+            with timed("upload_read"):
+                contents = await read_upload(upload)
+        except UploadTooLargeError as e:
+            raise upload_too_large(e)
+        if is_archive(upload.filename, upload.content_type):
+            try:
+                members = extract_images(contents, BATCH_MAX_FILES)
+            except ValueError as e:
+                raise HTTPException(
+                    status_code=400,
+                    detail={
+                        "status": "error",
+                        "message": str(e),
+                        "data": None
+                    }
+                )
+            images.extend(members)
+        elif upload.content_type and upload.content_type.startswith("image/"):
+            images.append((upload.filename, contents, upload.content_type))
+        else:
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    "status": "error",
+                    "message": f"File '{upload.filename}' must be an image or a zip/tar archive",
+                    "data": None
+                }
+            )
+
+    if not images or len(images) > BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400 if not images else 413,
+            detail={
+                "status": "error",
+                "message": "No images were uploaded" if not images else f"A batch may contain at most {BATCH_MAX_FILES} images",
+                "data": None
+            }
+        )
+
+    # Run person detection, one detector call per chunk
+    detect_results = []
+    for start in range(0, len(images), DETECT_BATCH_CHUNK):
+        chunk = images[start:start + DETECT_BATCH_CHUNK]
+        try:
+            detection_response = await detect_person_batch(chunk)
+        except CircuitOpenError as e:
+            raise detector_unavailable(e)
+        if (not isinstance(detection_response, dict) or not isinstance(detection_response.get("data"), dict)
+                or len(detection_response["data"].get("results") or []) != len(chunk)):
+            raise HTTPException(
+                status_code=500,
+                detail={
+                    "status": "error",
+                    "message": "Invalid detection result format",
+                    "data": None
+                }
+            )
+        detect_results.extend(detection_response["data"]["results"])
+
+    # Save originals and annotated images
+    items = []
+    records = []
+    for (original_filename, contents, _), result in zip(images, detect_results):
+        if result.get("status") != "success":
+            items.append((original_filename, result.get("message") or "Detection failed", None, None, None))
+            continue
+
+        file_id = str(uuid.uuid4())
+        extension = original_filename.split(".")[-1]
+        upload_path = f"uploads/{file_id}.{extension}"
+        result_name = f"{file_id}.{result_extension(original_filename)}"
+        result_path = f"results/{result_name}"
+
+        try:
+            check_detections(result["detections"])
+            await store_and_render(background_tasks, upload_path, result_path, contents, result["detections"])
+        except HTTPException:
+            raise
+        except Exception as e:
+            items.append((original_filename, "Error processing image: " + str(e), None, None, None))
+            continue
+
+        record = {
+            "timestamp": datetime.datetime.now(),
+            "people_count": len(result["detections"]),
+            "result_image_url": result_path,
+            "original_filename": original_filename,
+            "detections": result["detections"].to_columns(),
+        }
+        records.append(record)
+        items.append((original_filename, None, record, f"/images/{result_name}", result["detections"]))
+
+    # Single bulk insert (or buffered); primary keys come back without a refresh
+    ids = iter(await save_records(db, records))
+
+    data = []
+    for index, (original_filename, error, record, image_url, detections) in enumerate(items):
+        if record is None:
+            data.append({
+                "index": index,
+                "status": "error",
+                "message": error,
+                "original_filename": original_filename
+            })
+            continue
+        data.append({
+            "index": index,
+            "status": "success",
+            "id": next(ids),
+            "timestamp": record["timestamp"],
+            "people_count": record["people_count"],
+            "result_image_url": image_url,
+            "original_filename": original_filename,
+            "detections": detections.to_dicts()
+        })
+
+    request_logger.info("Batch detection completed: %d of %d image(s) processed", len(records), len(items))
+    return {
+        "status": "success",
+        "message": "Batch detection completed successfully",
+        "data": data
+    }
+
+
+@detect_router.get("/stats")
+async def get_stats():
+    """
+    Result-cache counters and the state of the detector client.
+    """
+    return {
+        "status": "success",
+        "message": "Statistics retrieved successfully",
+        "data": {
+            "cache": result_cache.stats() if result_cache is not None else None,
+            "ingest": ingest_stats.stats(),
+            "history_count_cache": count_cache.stats(),
+            "write_behind": write_buffer.stats() if write_buffer is not None else None,
+            "rollups": rollup_buffer.stats() if rollup_buffer is not None else None,
+            "render": renderer.stats(),
+            "derivatives": derivative_cache.stats(),
+            "storage": storage.info(),
+            "logging": logging_stats(),
+            "detector_client": detector_client.stats()
+        }
+    }
+
+
+def cache_headers(etag: str, mtime: float) -> dict:
+    return {
+        "ETag": etag,
+        "Last-Modified": formatdate(mtime, usegmt=True),
+        "Cache-Control": f"public, max-age={IMAGE_CACHE_MAX_AGE}",
+    }
+
+def not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """
+    Whether the client's validators (If-None-Match, else If-Modified-Since) still match.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            pass
+    return False
+
+def media_type(path: str) -> str:
+    return mimetypes.guess_type(path)[0] or f"image/{path.split('.')[-1]}"
+
+def image_response(request: Request, file_path: str):
+    """
+    Serves a local image with ETag, Last-Modified and Cache-Control headers, answering
+    conditional requests whose validators still match with 304 Not Modified.
+    """
+    stat = os.stat(file_path)
+    etag = f'"{hashlib.md5(f"{stat.st_mtime}-{stat.st_size}".encode(), usedforsecurity=False).hexdigest()}"'
+    headers = cache_headers(etag, stat.st_mtime)
+    if not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(file_path, media_type=media_type(file_path), headers=headers)
+
+async def stored_image_response(request: Request, key: str):
+    """
+    Serves an image from storage: as a file when the backend is local, otherwise
+    streamed in chunks with the object's own ETag.
+    """
+    local_path = storage.local_path(key)
+    if local_path is not None:
+        return image_response(request, local_path)
+    stored = await storage.stat(key)
+    if stored is None:
+        raise HTTPException(status_code=404, detail=f"Image '{os.path.basename(key)}' not found")
+    etag = stored.etag or f'"{hashlib.md5(f"{stored.mtime}-{stored.size}".encode(), usedforsecurity=False).hexdigest()}"'
+    headers = cache_headers(etag, stored.mtime)
+    if not_modified(request, etag, stored.mtime):
+        return Response(status_code=304, headers=headers)
+    headers["Content-Length"] = str(stored.size)
+    return StreamingResponse(storage.stream(key), media_type=media_type(key), headers=headers)
+
+
 @detect_router.get("/images/{filename}")
-async def get_image(filename: str):
+async def get_image(request: Request, filename: str, size: str = Query("full", pattern="^(thumb|preview|full)$"),
+                    db: Session = Depends(get_db)):
     """
-    Serve image files from the results directory by filename
+    Serve result images from storage by filename. Annotated images that are not
+    stored yet (lazy rendering, or a render still in progress) are rendered on this
+    request and served from storage afterwards. `size=thumb` or `size=preview`
+    serves a downscaled copy from the derivative cache.
     """
-    # Build the file path
+    # Build the storage key
     file_path = f"results/{filename}"
-    
-    # Check if the file exists
-    if not os.path.isfile(file_path):
+
+    async def load_detections():
+        return await run_in_threadpool(find_detections, db, file_path)
+
+    # Check if the file exists, or can be rendered
+    if not await renderer.ensure(file_path, load_detections):
         raise HTTPException(status_code=404, detail=f"Image '{filename}' not found")
-    
-    # Return the file with the appropriate media type
-    return FileResponse(
-        file_path, 
-        media_type=f"image/{filename.split('.')[-1]}"
-    )
\ No newline at end of file
+
+    if size != "full":
+        try:
+            return image_response(request, await derivative_cache.get(filename, size, file_path))
+        except Exception as e:
+            # The full image is still a valid answer
+            logger.error(f"Serving full image for {filename}: {str(e)}")
+
+    return await stored_image_response(request, file_path)
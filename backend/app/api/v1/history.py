@@ -1,15 +1,16 @@
-import os
-from typing import List, Optional
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Query
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
 from sqlalchemy.orm import Session
-from app.core.logger import setup_logger
+from app.core.logger import setup_logger, setup_request_logger
+from app.core.metrics import COUNT_CACHE_LOOKUPS
 from app.core.models import DetectionRecord
-from app.database.schema import DetectionHistory
+from app.core.detections import Detections
 from app.database.db import get_db
+from app.database.counts import count_cache, normalize_filters, COUNT_CACHE_ENABLED
+from app.database.queries import apply_history_filters, keyset_page, decode_cursor, InvalidCursorError
 
 logger = setup_logger(__name__)
+request_logger = setup_request_logger(__name__)
 history_router = APIRouter()
 
 @history_router.get("", response_model=dict)
@@ -20,25 +21,39 @@ def get_history(
     max_people: Optional[int] = Query(None, ge=0),
     date_from: Optional[str] = Query(None),
     date_to: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None, max_length=200),
     db: Session = Depends(get_db)
 ):
+    """
+    Lists detection records, newest first. Pass the `next_cursor` of a response as
+    `cursor` to get the following page; this stays fast however deep the page is,
+    whereas `skip` (used when no cursor is given) gets slower with every page.
+    """
+    if cursor is not None:
+        try:
+            decode_cursor(cursor)
+        except InvalidCursorError as e:
+            logger.error(str(e))
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    "status": "error",
+                    "message": "Invalid cursor",
+                    "data": None
+                }
+            )
+
     try:
         query = db.query(DetectionRecord)
-        logger.info(f"Retrieving history records: skip={skip}, limit={limit}, min_people={min_people}, max_people={max_people}, date_from={date_from}, date_to={date_to}")
+        request_logger.info("Retrieving history records: skip=%s, limit=%s, cursor=%s, min_people=%s, max_people=%s, date_from=%s, date_to=%s",
+                            skip, limit, cursor, min_people, max_people, date_from, date_to)
 
         # Apply filters
-        if min_people is not None:
-            query = query.filter(DetectionRecord.people_count >= min_people)
-        if max_people is not None:
-            query = query.filter(DetectionRecord.people_count <= max_people)
-        if date_from is not None:
-            query = query.filter(DetectionRecord.timestamp >= date_from)
-        if date_to is not None:
-            query = query.filter(DetectionRecord.timestamp <= date_to)
+        query = apply_history_filters(query, min_people, max_people, date_from, date_to)
 
         # Apply pagination
-        records = query.order_by(DetectionRecord.timestamp.desc()).offset(skip).limit(limit).all()
-        logger.info(f"Retrieved {len(records)} history records")
+        records, next_cursor = keyset_page(query, limit, cursor, skip)
+        request_logger.info("Retrieved %d history records", len(records))
         
         # Convert ORM objects to serializable dictionaries
         serialized_records = [
@@ -55,7 +70,8 @@ def get_history(
         return {
             "status": "success",
             "message": "History records retrieved successfully",
-            "data": serialized_records
+            "data": serialized_records,
+            "next_cursor": next_cursor
         }
     
     except Exception as e:
@@ -72,29 +88,50 @@ def get_history_count(
     max_people: Optional[int] = Query(None, ge=0),
     date_from: Optional[str] = Query(None),
     date_to: Optional[str] = Query(None),
+    estimate: bool = Query(False),
     db: Session = Depends(get_db)
 ):
+    """
+    Counts the records matching the filters. Counts are cached per filter set and
+    kept current as new records are committed. With `estimate=true` and no filters,
+    PostgreSQL's planner statistics answer without counting rows.
+    """
     try:
-        query = db.query(DetectionRecord)
-        logger.info(f"Retrieving history record count: min_people={min_people}, max_people={max_people}, date_from={date_from}, date_to={date_to}")
-        
-        # Apply filters
-        if min_people is not None:
-            query = query.filter(DetectionRecord.people_count >= min_people)
-        if max_people is not None:
-            query = query.filter(DetectionRecord.people_count <= max_people)
-        if date_from is not None:
-            query = query.filter(DetectionRecord.timestamp >= date_from)
-        if date_to is not None:
-            query = query.filter(DetectionRecord.timestamp <= date_to)
-        
-        total_count = query.count()
-        logger.info(f"Retrieved total history record count: {total_count}")
+        request_logger.info("Retrieving history record count: min_people=%s, max_people=%s, date_from=%s, date_to=%s, estimate=%s",
+                            min_people, max_people, date_from, date_to, estimate)
+        key = normalize_filters(min_people, max_people, date_from, date_to)
+        unfiltered = all(value is None for value in key)
+
+        if estimate and unfiltered:
+            total_count = count_cache.estimate(db)
+            if total_count is not None:
+                COUNT_CACHE_LOOKUPS.labels("estimate").inc()
+                request_logger.info("Estimated total history record count: %d", total_count)
+                return {
+                    "status": "success",
+                    "message": "Count retrieved successfully.",
+                    "data": {"count": total_count, "estimated": True}
+                }
+
+        total_count = count_cache.get(key) if COUNT_CACHE_ENABLED else None
+        if COUNT_CACHE_ENABLED:
+            COUNT_CACHE_LOOKUPS.labels("hit" if total_count is not None else "miss").inc()
+        if total_count is None:
+            generation = count_cache.generation
+            query = db.query(DetectionRecord)
+
+            # Apply filters
+            query = apply_history_filters(query, min_people, max_people, date_from, date_to)
+
+            total_count = query.count()
+            if COUNT_CACHE_ENABLED:
+                count_cache.put(key, total_count, generation)
+        request_logger.info("Retrieved total history record count: %d", total_count)
         
         return {
             "status": "success",
             "message": "Count retrieved successfully.",
-            "data": {"count": total_count}
+            "data": {"count": total_count, "estimated": False}
         }
     
     except Exception as e:
@@ -108,7 +145,7 @@ def get_history_count(
 @history_router.get("/{record_id}")
 def get_history_item(record_id: int, db: Session = Depends(get_db)):
     record = db.query(DetectionRecord).filter(DetectionRecord.id == record_id).first()
-    logger.info(f"Retrieving history record with ID: {record_id}")
+    request_logger.info("Retrieving history record with ID: %s", record_id)
     if not record:
         logger.error(f"Record not found: {record}")
         raise HTTPException(
@@ -120,7 +157,7 @@ def get_history_item(record_id: int, db: Session = Depends(get_db)):
             }
         )
     
-    logger.info(f"History record retrieved successfully: {record_id}")
+    request_logger.info("History record retrieved successfully: %s", record_id)
     return {
         "status": "success",
         "message": "History record retrieved successfully",
@@ -129,6 +166,7 @@ def get_history_item(record_id: int, db: Session = Depends(get_db)):
             "timestamp": record.timestamp,
             "people_count": record.people_count,
             "result_image_url": record.result_image_url,
-            "original_filename": record.original_filename
+            "original_filename": record.original_filename,
+            "detections": Detections.from_payload(record.detections).to_dicts() if record.detections is not None else None
         }
     }
\ No newline at end of file
@@ -1,7 +1,40 @@
-from .logger import setup_logger
-from .detector import detect_person
+from .logger import setup_logger, setup_request_logger
+from .detector import detect_person, detect_person_batch, detector_client, CircuitOpenError
+from .detections import Detections
+from .cache import ResultCache, make_cache_key
+from .ingest import read_upload, decode_image, save_original, ingest_stats, UploadTooLargeError
+from .archive import is_archive, extract_images
+from .render import renderer, render_image, draw_detections
+from .storage import storage, create_storage, Storage, LocalStorage, S3Storage
+from .metrics import MetricsMiddleware, timed
+from .tracing import TracingMiddleware
 
 __all__ = [
     "setup_logger",
-    "detect_person"
+    "setup_request_logger",
+    "detect_person",
+    "detect_person_batch",
+    "detector_client",
+    "CircuitOpenError",
+    "Detections",
+    "ResultCache",
+    "make_cache_key",
+    "read_upload",
+    "decode_image",
+    "save_original",
+    "ingest_stats",
+    "UploadTooLargeError",
+    "is_archive",
+    "extract_images",
+    "renderer",
+    "render_image",
+    "draw_detections",
+    "storage",
+    "create_storage",
+    "Storage",
+    "LocalStorage",
+    "S3Storage",
+    "MetricsMiddleware",
+    "timed",
+    "TracingMiddleware"
     ]
\ No newline at end of file
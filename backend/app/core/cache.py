@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from fastapi.concurrency import run_in_threadpool
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 1024))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_TTL = float(os.getenv("CACHE_TTL", 3600))
+# Uploads at least this large are hashed on a worker thread instead of the event loop
+CACHE_THREADED_HASH_BYTES = int(os.getenv("CACHE_THREADED_HASH_BYTES", 256 * 1024))
+
+
+def make_cache_key(contents: bytes, class_name: str, conf: float, model_version: str) -> str:
+    """
+    Builds a content-addressed key: identical image bytes with the same
+    detection parameters and model always map to the same entry.
+    """
+    digest = hashlib.sha256(contents).hexdigest()
+    params = hashlib.sha256(f"{class_name}|{float(conf):.6f}|{model_version}".encode("utf-8")).hexdigest()[:16]
+    return f"{digest}-{params}"
+
+
+async def make_cache_key_async(contents: bytes, class_name: str, conf: float, model_version: str) -> str:
+    """
+    `make_cache_key` for the event loop: large uploads (a 20 MB image takes tens of
+    milliseconds to hash) are hashed on a worker thread.
+    """
+    if len(contents) < CACHE_THREADED_HASH_BYTES:
+        return make_cache_key(contents, class_name, conf, model_version)
+    return await run_in_threadpool(make_cache_key, contents, class_name, conf, model_version)
+
+
+def _serialize(value):
+    # Entries hold `Detections`; they are sized as the columns the database stores
+    to_columns = getattr(value, "to_columns", None)
+    return to_columns() if to_columns is not None else str(value)
+
+
+class ResultCache:
+    """
+    In-memory cache of rendered results: an LRU bounded by entry count and total
+    size with a per-entry TTL. Entries point at result images in storage, which
+    retention removes on its own schedule, so they are not persisted; after a
+    restart, a repeated upload still skips inference through the detector's cache.
+    Args:
+        max_entries (int): Maximum number of entries kept.
+        max_bytes (int): Maximum total (serialized) size of the entries.
+        ttl (float): Seconds an entry stays valid. 0 disables expiry.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES,
+                 ttl: float = CACHE_TTL):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl > 0 and time.time() - stored_at > self.ttl
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None or self._expired(entry[2]):
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: str, value):
+        size = len(json.dumps(value, default=_serialize))
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (value, size, time.time())
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, key: str):
+        self._remove(key)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "evictions": self.evictions,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+        }
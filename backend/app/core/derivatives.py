@@ -0,0 +1,257 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from .ingest import decode_image
+from .render import encode_params, RENDER_WORKERS
+from .storage import storage
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Longest side of each derivative; "full" is the rendered result itself
+DERIVATIVE_SIZES = {
+    "thumb": int(os.getenv("THUMBNAIL_MAX_SIDE", 256)),
+    "preview": int(os.getenv("PREVIEW_MAX_SIDE", 1024)),
+}
+DERIVATIVE_DIR = os.getenv("DERIVATIVE_DIR", "derivatives")
+DERIVATIVE_CACHE_MAX_BYTES = int(os.getenv("DERIVATIVE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# Sizes built in the background as soon as a result image is rendered
+DERIVATIVE_PREBUILD = [size for size in os.getenv("DERIVATIVE_PREBUILD", "thumb").split(",") if size.strip()]
+# Derivatives served or built within this many seconds are never evicted, so a path
+# handed out by `get` still exists while its response is being sent
+DERIVATIVE_EVICT_GRACE = float(os.getenv("DERIVATIVE_EVICT_GRACE", 60))
+
+
+def build_derivative(contents: bytes, target_path: str, max_side: int) -> int:
+    """
+    Writes a copy of the encoded image `contents` scaled down to at most `max_side`
+    pixels on its longest side, in the same format as `target_path`. Returns the
+    size of the written file.
+    """
+    img = decode_image(contents)
+    if img is None:
+        raise ValueError(f"Failed to read the image for {target_path}")
+    height, width = img.shape[:2]
+    longest = max(height, width)
+    if longest > max_side:
+        scale = max_side / longest
+        img = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))),
+                         interpolation=cv2.INTER_AREA)
+
+    extension = target_path.rsplit(".", 1)[-1]
+    ok, encoded = cv2.imencode(f".{extension}", img, encode_params(extension))
+    if not ok:
+        raise ValueError(f"Failed to encode the image as {extension}")
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    temp_path = f"{target_path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(encoded.tobytes())
+    os.replace(temp_path, target_path)
+    return len(encoded)
+
+
+def scan_derivatives(directory: str) -> list:
+    """
+    Derivative files left under `directory` by a previous run.
+    Returns:
+        list: (mtime, path, size) tuples, oldest first.
+    """
+    found = []
+    for size in DERIVATIVE_SIZES:
+        folder = os.path.join(directory, size)
+        if not os.path.isdir(folder):
+            continue
+        for entry in os.scandir(folder):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.path, stat.st_size))
+    return sorted(found)
+
+
+def remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class DerivativeCache:
+    """
+    Downscaled copies (thumbnail, preview) of result images, built on a worker
+    pool and kept on disk under `directory`. The cache is bounded by total file
+    size, evicting the least recently served derivatives first. Scanning the
+    directory and removing files happen on the worker pool, not the event loop.
+    Args:
+        directory (str): Root directory; each size gets its own subdirectory.
+        max_bytes (int): Maximum total size of the cached files.
+        workers (int): Number of threads building derivatives.
+        evict_grace (float): Seconds after being served or built during which a
+            derivative is not evicted, even if the cache is over `max_bytes`.
+    """
+
+    def __init__(self, directory: str = DERIVATIVE_DIR, max_bytes: int = DERIVATIVE_CACHE_MAX_BYTES,
+                 workers: int = RENDER_WORKERS, evict_grace: float = DERIVATIVE_EVICT_GRACE):
+        self.directory = directory
+        self.max_bytes = max(1, max_bytes)
+        self.workers = max(1, workers)
+        self.evict_grace = max(0.0, evict_grace)
+        self._executor = None
+        # path -> (file size, monotonic time it was last served or built), least recent first
+        self._entries = None
+        self._loading = None
+        self._bytes = 0
+        self._pending = {}
+        self._removing = {}
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.failed = 0
+        self.evictions = 0
+        self.total_build_ms = 0.0
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="derivative")
+        return self._executor
+
+    async def _ensure_loaded(self):
+        # The first caller scans the directory; concurrent callers wait for the same scan
+        if self._entries is not None:
+            return
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._load())
+        try:
+            await asyncio.shield(self._loading)
+        except Exception:
+            self._loading = None
+            raise
+
+    async def _load(self):
+        # Files left by a previous run join the LRU, oldest first
+        found = await asyncio.get_running_loop().run_in_executor(self._pool(), scan_derivatives, self.directory)
+        entries = OrderedDict((path, (file_size, 0.0)) for _, path, file_size in found)
+        self._entries = entries
+        self._bytes = sum(file_size for file_size, _ in entries.values())
+        self._evict()
+
+    def path(self, filename: str, size: str) -> str:
+        return os.path.join(self.directory, size, filename)
+
+    def _record(self, path: str, file_size: int):
+        previous = self._entries.pop(path, None)
+        self._bytes += file_size - (previous[0] if previous else 0)
+        self._entries[path] = (file_size, time.monotonic())
+        self._evict()
+
+    def _evict(self):
+        # Entries are least recently used first, so eviction stops at the first one in its grace period
+        recent = time.monotonic() - self.evict_grace
+        loop = asyncio.get_running_loop()
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            path, (file_size, touched) = next(iter(self._entries.items()))
+            if touched > recent:
+                break
+            del self._entries[path]
+            self._bytes -= file_size
+            self.evictions += 1
+            removal = loop.run_in_executor(self._pool(), remove_file, path)
+            self._removing[path] = removal
+            removal.add_done_callback(lambda f, path=path: self._removing.pop(path, None)
+                                      if self._removing.get(path) is f else None)
+
+    async def _run_build(self, source_key: str, target_path: str, size: str, contents: bytes = None,
+                         rebuild: bool = True) -> int:
+        await self._ensure_loaded()
+        if not rebuild and target_path in self._entries:
+            return self._entries[target_path][0]
+        # A rebuilt file must not be deleted by the removal of its evicted predecessor
+        removal = self._removing.get(target_path)
+        if removal is not None:
+            await removal
+        if contents is None:
+            contents = await storage.read(source_key)
+        started = time.perf_counter()
+        file_size = await asyncio.get_running_loop().run_in_executor(
+            self._pool(), build_derivative, contents, target_path, DERIVATIVE_SIZES[size]
+        )
+        self.builds += 1
+        self.total_build_ms += (time.perf_counter() - started) * 1000
+        self._record(target_path, file_size)
+        return file_size
+
+    def _build(self, source_key: str, target_path: str, size: str, contents: bytes = None,
+               rebuild: bool = True) -> asyncio.Task:
+        pending = self._pending.get(target_path)
+        if pending is not None:
+            return pending
+        task = asyncio.ensure_future(self._run_build(source_key, target_path, size, contents, rebuild))
+        self._pending[target_path] = task
+
+        def done(t):
+            self._pending.pop(target_path, None)
+            if not t.cancelled() and t.exception() is not None:
+                self.failed += 1
+                logger.error(f"Failed to build {target_path}: {t.exception()}")
+        task.add_done_callback(done)
+        return task
+
+    async def get(self, filename: str, size: str, source_key: str) -> str:
+        """
+        Path of the `size` derivative of the stored result image `source_key`,
+        building it first if it is not cached. The file is not evicted for at least
+        `evict_grace` seconds.
+        """
+        await self._ensure_loaded()
+        target_path = self.path(filename, size)
+        entry = self._entries.get(target_path)
+        if entry is not None and os.path.isfile(target_path):
+            self._entries[target_path] = (entry[0], time.monotonic())
+            self._entries.move_to_end(target_path)
+            self.hits += 1
+            return target_path
+        self.misses += 1
+        await asyncio.shield(self._build(source_key, target_path, size))
+        return target_path
+
+    def prebuild(self, source_key: str, contents: bytes = None):
+        """
+        Schedules the DERIVATIVE_PREBUILD sizes of a freshly rendered result image,
+        from its encoded bytes when given. Sizes already cached are skipped once the
+        cache directory has been scanned.
+        """
+        filename = os.path.basename(source_key)
+        for size in DERIVATIVE_PREBUILD:
+            if size in DERIVATIVE_SIZES and self.path(filename, size) not in (self._entries or ()):
+                self._build(source_key, self.path(filename, size), size, contents, rebuild=False)
+
+    async def close(self):
+        if self._pending:
+            await asyncio.gather(*self._pending.values(), return_exceptions=True)
+        if self._removing:
+            await asyncio.gather(*self._removing.values(), return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "sizes": DERIVATIVE_SIZES,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries or ()),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "builds": self.builds,
+            "failed": self.failed,
+            "evictions": self.evictions,
+            "pending": len(self._pending),
+            "avg_build_ms": round(self.total_build_ms / self.builds, 3) if self.builds else 0.0,
+        }
+
+
+derivative_cache = DerivativeCache()
@@ -0,0 +1,76 @@
+import numpy as np
+
+_BOX_KEYS = ("x_min", "y_min", "x_max", "y_max")
+
+
+class Detections:
+    """
+    The detections of one image as arrays: `boxes` (N, 4) int32 x_min, y_min, x_max,
+    y_max and `confidence` (N,) float32, all of class `class_name`. Detector responses
+    are decoded into these arrays and stay in them through validation, rendering, the
+    result cache and the database (which stores `to_columns`); per-box dicts are only
+    built by `to_dicts`, when an API response is serialized.
+    """
+
+    __slots__ = ("boxes", "confidence", "class_name")
+
+    def __init__(self, boxes, confidence, class_name: str = "person"):
+        self.boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+        self.confidence = np.asarray(confidence, dtype=np.float32).reshape(-1)
+        self.class_name = class_name
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    @classmethod
+    def from_payload(cls, payload, scale: float = 1.0, class_name: str = "person"):
+        """
+        Reads detections in any of the detector's encodings, or as stored by `to_columns`.
+        Args:
+            payload: A list of dicts, or a dict of `boxes` and `confidence` columns, as
+                lists or raw little-endian int32 / float32 buffers.
+            scale (float): Factor applied to the box coordinates, e.g. to map detections
+                on a downscaled payload back to the original image.
+        Raises:
+            KeyError, TypeError, ValueError: If the payload is not an encoding of detections.
+        """
+        if isinstance(payload, list):
+            boxes = [[d[key] for key in _BOX_KEYS] for d in payload]
+            confidence = [d["confidence"] for d in payload]
+            class_name = payload[0].get("class_name", class_name) if payload else class_name
+        else:
+            boxes, confidence = payload["boxes"], payload["confidence"]
+            if isinstance(boxes, (bytes, bytearray)):
+                boxes = np.frombuffer(boxes, dtype="<i4")
+                confidence = np.frombuffer(confidence, dtype="<f4")
+            class_name = payload.get("class_name", class_name)
+        if scale != 1.0:
+            boxes = np.rint(np.asarray(boxes, dtype=np.float64) * scale)
+        return cls(boxes, confidence, class_name)
+
+    @property
+    def valid(self) -> bool:
+        """
+        Whether every box has a confidence and its corners are in order.
+        """
+        return (len(self.boxes) == len(self.confidence)
+                and bool(np.all(self.boxes[:, :2] <= self.boxes[:, 2:]))
+                and bool(np.all(np.isfinite(self.confidence))))
+
+    def to_dicts(self) -> list:
+        return [{
+            "x_min": x_min,
+            "y_min": y_min,
+            "x_max": x_max,
+            "y_max": y_max,
+            "confidence": confidence,
+            "class_name": self.class_name
+        } for (x_min, y_min, x_max, y_max), confidence in zip(self.boxes.tolist(), self.confidence.tolist())]
+
+    def to_columns(self) -> dict:
+        return {
+            "class_name": self.class_name,
+            "count": len(self),
+            "boxes": self.boxes.ravel().tolist(),
+            "confidence": self.confidence.tolist(),
+        }
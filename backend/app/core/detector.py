@@ -1,33 +1,407 @@
 import os
-import requests
-from .logger import setup_logger
+import time
+import importlib.util
+import random
+import asyncio
+from urllib.parse import urlsplit
+import httpx
+from .logger import setup_logger, setup_request_logger
+from .detections import Detections
+from .metrics import timed, DETECTOR_REQUESTS
+from .tracing import outgoing_headers
 
 logger = setup_logger(__name__)
+request_logger = setup_request_logger(__name__)
 
 DETECT_URL = os.getenv("DETECT_URL", "http://localhost:6868/api/v1/detect/")
 CONFIDENT_THRESHOLD = os.getenv("CONFIDENT_THRESHOLD", 0.5)
+DETECT_BATCH_URL = os.getenv("DETECT_BATCH_URL", DETECT_URL.rstrip("/") + "/batch")
+# Comma-separated detect URLs of several detector replicas; replaces DETECT_URL and DETECT_BATCH_URL when set
+DETECT_URLS = os.getenv("DETECT_URLS", "")
 
-def call_detect_objects_api_sync(file_path: str, class_name: str = "person", conf: float = 0.5, api_url: str = "http://localhost:6868/api/v1/detect/"):
-    with open(file_path, "rb") as file:
-        files = {"file": (file_path, file, "image/jpeg")}
-        params = {"class_name": class_name, "conf": conf}
-        
-        logger.info(f"Sending request to {api_url} with params: {params}")
-        response = requests.post(api_url, files=files, params=params)
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            logger.error(f"Error: {response.status_code}, Message: {response.text}")
-            logger.error(f"Request params: {params}")
-            logger.error(f"Request headers: {response.request.headers}")
-            return None
-        
-def detect_person(file_path: str):
+DETECT_CONNECT_TIMEOUT = float(os.getenv("DETECT_CONNECT_TIMEOUT", 5))
+DETECT_READ_TIMEOUT = float(os.getenv("DETECT_READ_TIMEOUT", 60))
+DETECT_MAX_CONNECTIONS = int(os.getenv("DETECT_MAX_CONNECTIONS", 32))
+DETECT_MAX_KEEPALIVE = int(os.getenv("DETECT_MAX_KEEPALIVE", 16))
+DETECT_RETRIES = int(os.getenv("DETECT_RETRIES", 2))
+DETECT_RETRY_BACKOFF = float(os.getenv("DETECT_RETRY_BACKOFF", 0.2))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 30))
+
+# Encoding asked of the detector for detections: msgpack (raw int32/float32 buffers), columnar or json
+DETECT_RESPONSE_FORMAT = os.getenv("DETECT_RESPONSE_FORMAT", "msgpack").lower()
+
+MSGPACK = "application/msgpack"
+COLUMNAR_JSON = "application/vnd.person-detection.columnar+json"
+_ACCEPT = {
+    "msgpack": f"{MSGPACK}, {COLUMNAR_JSON};q=0.9, application/json;q=0.5",
+    "columnar": f"{COLUMNAR_JSON}, application/json;q=0.5",
+    "json": "application/json",
+}
+
+# Statuses worth retrying: the detector is overloaded or a proxy in between failed
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when the detector has failed repeatedly and calls are short-circuited.
+    """
+
+    def __init__(self, retry_after: float):
+        super().__init__("Detector service is unavailable")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls until
+    `reset_timeout` seconds have passed; then a single trial call is let through
+    (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+                 name: str = "Detector"):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allows_call(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._trial_in_flight)
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 1.0
+        return max(1.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def before_call(self) -> bool:
+        """
+        Admits a call or raises CircuitOpenError.
+        Returns:
+            bool: True when the call is the half-open trial; whoever makes it must end it
+                with `record_success`, `record_failure` or `release`.
+        """
+        if not self.allows_call():
+            raise CircuitOpenError(self.retry_after())
+        if self.state == "half_open":
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def release(self):
+        """
+        Ends a call that neither closes nor re-opens the circuit (a retried overload answer).
+        """
+        self._trial_in_flight = False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info(f"{self.name} circuit closed")
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            logger.warning(f"{self.name} circuit opened after {self.failures} consecutive failure(s)")
+
+
+class DetectorEndpoint:
+    """
+    One detector replica: its URLs, its own circuit breaker and the requests in flight to it.
+    """
+
+    def __init__(self, detect_url: str, batch_url: str = None):
+        self.detect_url = detect_url
+        self.batch_url = batch_url or detect_url.rstrip("/") + "/batch"
+        self.name = urlsplit(detect_url).netloc or detect_url
+        self.breaker = CircuitBreaker(name=f"Detector {self.name}")
+        self.in_flight = 0
+        self.requests = 0
+
+    def url(self, batch: bool = False) -> str:
+        return self.batch_url if batch else self.detect_url
+
+    def stats(self) -> dict:
+        return {
+            "endpoint": self.detect_url,
+            "circuit_state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+        }
+
+
+def configured_endpoints() -> list:
+    urls = [url.strip() for url in DETECT_URLS.split(",") if url.strip()]
+    if not urls:
+        return [DetectorEndpoint(DETECT_URL, DETECT_BATCH_URL)]
+    return [DetectorEndpoint(url) for url in urls]
+
+
+class DetectorClient:
+    """
+    Shared, connection-pooled async HTTP client for the detector service.
+    One instance lives for the whole application so keep-alive connections are reused.
+    With several detector endpoints, each call goes to the one with the fewest requests
+    in flight whose circuit is not open (least outstanding requests); retries move on
+    to another endpoint when there is one.
+    """
+
+    def __init__(self, endpoints: list = None):
+        self.endpoints = endpoints or configured_endpoints()
+        self.accept = accept_header()
+        self._client = None
+
+    @property
+    def in_flight(self) -> int:
+        return sum(endpoint.in_flight for endpoint in self.endpoints)
+
+    @property
+    def state(self) -> str:
+        """
+        "closed" while any endpoint takes calls normally, "open" once all of them are open.
+        """
+        states = {endpoint.breaker.state for endpoint in self.endpoints}
+        for state in ("closed", "half_open"):
+            if state in states:
+                return state
+        return "open"
+
+    async def start(self):
+        if self._client is not None:
+            return
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(DETECT_READ_TIMEOUT, connect=DETECT_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=DETECT_MAX_CONNECTIONS, max_keepalive_connections=DETECT_MAX_KEEPALIVE),
+            # DETECT_URL is configured with a trailing slash, which the detector answers with a 307
+            follow_redirects=True,
+        )
+        logger.info(f"Detector client started (endpoints={[e.name for e in self.endpoints]}, accept={self.accept!r}, "
+                    f"max_connections={DETECT_MAX_CONNECTIONS}, retries={DETECT_RETRIES})")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logger.info("Detector client closed")
+
+    def pick(self, previous: DetectorEndpoint = None) -> DetectorEndpoint:
+        """
+        The endpoint with the fewest requests in flight among those whose circuit admits
+        a call, ties broken at random. `previous` (the endpoint a retry is leaving) is
+        only picked again when no other endpoint is available.
+        Raises:
+            CircuitOpenError: If every endpoint's circuit is open.
+        """
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.breaker.allows_call()]
+        if not candidates:
+            raise CircuitOpenError(min(endpoint.breaker.retry_after() for endpoint in self.endpoints))
+        if previous is not None and len(candidates) > 1:
+            candidates = [endpoint for endpoint in candidates if endpoint is not previous] or candidates
+        fewest = min(endpoint.in_flight for endpoint in candidates)
+        return random.choice([endpoint for endpoint in candidates if endpoint.in_flight == fewest])
+
+    async def post(self, files, params: dict, batch: bool = False):
+        """
+        POSTs a multipart request to a detector with retries and circuit breaking.
+        Returns:
+            dict: The decoded body on success, or None when the detector rejected the request.
+        Raises:
+            CircuitOpenError: If the circuit of every endpoint is open.
+            httpx.HTTPError: If every attempt failed at the transport level.
+        """
+        if self._client is None:
+            await self.start()
+
+        with timed("detector_call"):
+            return await self._post(files, params, batch)
+
+    async def _post(self, files, params: dict, batch: bool):
+        # The trace continues on the detector; retries are new spans of the same trace
+        endpoint = None
+        for attempt in range(DETECT_RETRIES + 1):
+            endpoint = self.pick(previous=endpoint)
+            trial = endpoint.breaker.before_call()
+            api_url = endpoint.url(batch)
+            retry_after = None
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            request_logger.debug("Sending request to %s with params: %s", api_url, params)
+            try:
+                response = await self._client.post(api_url, files=files, params=params,
+                                                   headers={**outgoing_headers(), "Accept": self.accept})
+            except httpx.TransportError as e:
+                # An unreachable replica counts against its own circuit on every attempt
+                endpoint.breaker.record_failure()
+                if attempt == DETECT_RETRIES:
+                    DETECTOR_REQUESTS.labels("error", endpoint.name).inc()
+                    raise
+                DETECTOR_REQUESTS.labels("retry", endpoint.name).inc()
+                logger.warning(f"Detector request to {endpoint.name} failed ({e.__class__.__name__}), "
+                               f"attempt {attempt + 1}/{DETECT_RETRIES + 1}")
+            else:
+                if response.status_code == 200:
+                    endpoint.breaker.record_success()
+                    DETECTOR_REQUESTS.labels("success", endpoint.name).inc()
+                    return decode_body(response)
+                # A retryable status with Retry-After is the detector shedding load (its queue is
+                # full), not a broken replica, and must not open the circuit
+                overloaded = response.status_code in RETRY_STATUS_CODES and "Retry-After" in response.headers
+                if response.status_code not in RETRY_STATUS_CODES or attempt == DETECT_RETRIES:
+                    logger.error(f"Error: {response.status_code}, Message: {response.text}")
+                    logger.error(f"Request params: {params}")
+                    if overloaded:
+                        endpoint.breaker.release()
+                        DETECTOR_REQUESTS.labels("rejected", endpoint.name).inc()
+                    elif response.status_code >= 500:
+                        endpoint.breaker.record_failure()
+                        DETECTOR_REQUESTS.labels("error", endpoint.name).inc()
+                    else:
+                        endpoint.breaker.record_success()
+                        DETECTOR_REQUESTS.labels("rejected", endpoint.name).inc()
+                    return None
+                endpoint.breaker.release()
+                DETECTOR_REQUESTS.labels("retry", endpoint.name).inc()
+                logger.warning(f"Detector {endpoint.name} returned {response.status_code}, "
+                               f"attempt {attempt + 1}/{DETECT_RETRIES + 1}")
+                retry_after = response.headers.get("Retry-After")
+            finally:
+                endpoint.in_flight -= 1
+                if trial:
+                    # A trial that ended without an outcome (cancelled by a client disconnect or an
+                    # outer timeout, or any unexpected error) must not leave the circuit half-open
+                    endpoint.breaker.release()
+
+            # Exponential backoff with full jitter, never shorter than the server's Retry-After
+            # unless another replica can take the retry
+            delay = random.uniform(0, DETECT_RETRY_BACKOFF * (2 ** attempt))
+            others = any(e is not endpoint and e.breaker.allows_call() for e in self.endpoints)
+            if retry_after is not None and retry_after.isdigit() and not others:
+                delay = max(delay, float(retry_after))
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "circuit_state": self.state,
+            "in_flight": self.in_flight,
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints],
+        }
+
+
+def accept_header(response_format: str = DETECT_RESPONSE_FORMAT) -> str:
+    """
+    The Accept header for DETECT_RESPONSE_FORMAT. Columnar JSON is asked for instead of
+    msgpack when msgpack is not installed; plain JSON stays acceptable for older detectors.
+    """
+    if response_format == "msgpack" and importlib.util.find_spec("msgpack") is None:
+        response_format = "columnar"
+    return _ACCEPT.get(response_format, _ACCEPT["json"])
+
+
+def decode_body(response: httpx.Response) -> dict:
+    """
+    Decodes a detector response body by its content type. Detections are left in the
+    encoding they came in; `detect_person` and `detect_person_batch` read them into
+    `Detections`.
+    """
+    content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in (MSGPACK, "application/x-msgpack", "application/vnd.msgpack"):
+        import msgpack
+
+        return msgpack.unpackb(response.content, raw=False)
+    return response.json()
+
+
+def decode_detections(detections, scale: float = 1.0) -> Detections:
+    """
+    Reads the detections of one image, in any of the detector's encodings, into
+    `Detections` arrays, with boxes multiplied by `scale` (e.g. to map detections on a
+    downscaled payload back to the original image). Raw buffers are read without
+    copying and no per-box objects are built.
+    Raises:
+        KeyError, TypeError, ValueError: If the payload is not an encoding of detections.
+    """
+    return Detections.from_payload(detections, scale)
+
+
+detector_client = DetectorClient()
+
+
+async def call_detect_objects_api(contents: bytes, filename: str, content_type: str = "image/jpeg", class_name: str = "person", conf: float = 0.5):
+    files = {"file": (filename, contents, content_type)}
+    params = {"class_name": class_name, "conf": conf}
+
+    request_logger.info("Sending %s to the detector with params: %s", filename, params)
+    return await detector_client.post(files, params)
+
+async def detect_person(contents: bytes, filename: str, content_type: str = "image/jpeg", scale: float = 1.0):
+    """
+    Runs person detection on an image that is already held in memory.
+    Args:
+        scale (float): Factor mapping boxes on `contents` back to the original image, e.g.
+            the one returned by `downscale_for_detection`.
+    Returns:
+        dict: The detector response with `data.detections` read into `Detections`, or None on failure.
+    Raises:
+        CircuitOpenError: If the detector is currently considered unavailable.
+    """
+    try:
+        class_name = "person"
+        result = await call_detect_objects_api(contents=contents, filename=filename, content_type=content_type, class_name=class_name, conf=CONFIDENT_THRESHOLD)
+        data = result.get("data") if isinstance(result, dict) else None
+        if isinstance(data, dict) and "detections" in data:
+            data["detections"] = decode_detections(data["detections"], scale)
+        return result
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.error(f"An error occurred: {e}")
+        return None
+
+async def call_detect_objects_batch_api(images: list, class_name: str = "person", conf: float = 0.5):
+    files = [("files", (filename, contents, content_type)) for filename, contents, content_type in images]
+    params = {"class_name": class_name, "conf": conf}
+
+    request_logger.info("Sending batch of %d image(s) to the detector with params: %s", len(images), params)
+    return await detector_client.post(files, params, batch=True)
+
+async def detect_person_batch(images: list):
+    """
+    Runs person detection on several images with a single detector call.
+    Args:
+        images (list): (filename, bytes, content_type) tuples.
+    Returns:
+        dict: The detector response, whose `data.results` keeps the input order with each
+            item's `detections` read into `Detections`, or None on failure.
+    Raises:
+        CircuitOpenError: If the detector is currently considered unavailable.
+    """
     try:
         class_name = "person"
-        result = call_detect_objects_api_sync(file_path=file_path, class_name=class_name, conf=CONFIDENT_THRESHOLD, api_url=DETECT_URL)
+        result = await call_detect_objects_batch_api(images=images, class_name=class_name, conf=CONFIDENT_THRESHOLD)
+        data = result.get("data") if isinstance(result, dict) else None
+        for item in (data.get("results") or []) if isinstance(data, dict) else []:
+            if isinstance(item, dict) and item.get("detections") is not None:
+                item["detections"] = decode_detections(item["detections"])
         return result
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.error(f"An error occurred: {e}")
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,132 @@
+import os
+import cv2
+import numpy as np
+from fastapi import UploadFile
+from .logger import setup_logger
+from .storage import storage
+from .metrics import timed
+
+logger = setup_logger(__name__)
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 50_000_000))
+# "async" writes originals after the response is sent, "sync" before, "off" never
+UPLOAD_SAVE_MODE = os.getenv("UPLOAD_SAVE_MODE", "async").lower()
+# Longest side of the image sent to the detector (0 sends the original bytes)
+DETECT_MAX_SIDE = int(os.getenv("DETECT_MAX_SIDE", 0))
+DETECT_JPEG_QUALITY = int(os.getenv("DETECT_JPEG_QUALITY", 90))
+
+# OpenCV reads this lazily on the first decode, so decoded frames are bounded as well
+os.environ.setdefault("OPENCV_IO_MAX_IMAGE_PIXELS", str(MAX_IMAGE_PIXELS))
+
+_READ_CHUNK = 1024 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """
+    Raised when an upload exceeds MAX_UPLOAD_BYTES.
+    """
+
+    def __init__(self, max_bytes: int = MAX_UPLOAD_BYTES):
+        super().__init__(f"Upload exceeds the maximum size of {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class IngestStats:
+    """
+    Tracks how many bytes each request held in memory: the upload buffer, the
+    decoded image and any re-encoded copy (e.g. the downscaled detector payload).
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.last_bytes = 0
+        self.max_bytes = 0
+        self.total_bytes = 0
+
+    def record(self, upload_bytes: int, decoded_bytes: int, encoded_bytes: int = 0) -> int:
+        peak = upload_bytes + decoded_bytes + encoded_bytes
+        self.requests += 1
+        self.last_bytes = peak
+        self.max_bytes = max(self.max_bytes, peak)
+        self.total_bytes += peak
+        return peak
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "last_request_bytes": self.last_bytes,
+            "max_request_bytes": self.max_bytes,
+            "avg_request_bytes": round(self.total_bytes / self.requests) if self.requests else 0,
+            "max_upload_bytes": MAX_UPLOAD_BYTES,
+            "max_image_pixels": MAX_IMAGE_PIXELS,
+            "upload_save_mode": UPLOAD_SAVE_MODE,
+            "detect_max_side": DETECT_MAX_SIDE,
+        }
+
+
+ingest_stats = IngestStats()
+
+
+async def read_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """
+    Reads an upload into memory exactly once, refusing anything larger than `max_bytes`.
+    Raises:
+        UploadTooLargeError: If the upload is too large.
+    """
+    if file.size is not None:
+        if file.size > max_bytes:
+            raise UploadTooLargeError(max_bytes)
+        return await file.read()
+
+    # Size unknown: read in chunks so an oversized upload is rejected early
+    buffer = bytearray()
+    while True:
+        chunk = await file.read(_READ_CHUNK)
+        if not chunk:
+            break
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            raise UploadTooLargeError(max_bytes)
+    return bytes(buffer)
+
+
+def decode_image(contents: bytes):
+    """
+    Decodes an in-memory image. `np.frombuffer` wraps the upload without copying it.
+    Returns:
+        numpy.ndarray: The BGR image, or None if it could not be decoded.
+    """
+    return cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+
+
+def downscale_for_detection(img, max_side: int = DETECT_MAX_SIDE, quality: int = DETECT_JPEG_QUALITY):
+    """
+    Shrinks a decoded image so its longest side is `max_side` and re-encodes it as JPEG,
+    cutting both the bytes sent to the detector and its decode time.
+    Returns:
+        tuple: (jpeg bytes, scale) where `scale` maps detector coordinates back to the
+               original image, or (None, 1.0) when no downscaling is needed.
+    """
+    height, width = img.shape[:2]
+    longest = max(height, width)
+    if max_side <= 0 or longest <= max_side:
+        return None, 1.0
+    ratio = max_side / longest
+    resized = cv2.resize(img, (max(1, int(round(width * ratio))), max(1, int(round(height * ratio)))),
+                         interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", resized, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        return None, 1.0
+    return encoded.tobytes(), longest / max_side
+
+
+async def save_original(key: str, contents: bytes):
+    """
+    Writes the original upload to storage. Awaited directly or run as a background task.
+    """
+    try:
+        with timed("storage_write"):
+            await storage.write(key, contents)
+    except OSError as e:
+        logger.error(f"Failed to save upload {key}: {e}")
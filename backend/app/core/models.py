@@ -1,12 +1,36 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Index, JSON
+from sqlalchemy.orm import deferred
 from app.database.db import Base
 import datetime
 
 class DetectionRecord(Base):
     __tablename__ = "detection_records"
+    __table_args__ = (
+        # History pages are ordered by (timestamp, id) and cursors seek on the same pair
+        Index("ix_detection_records_timestamp_id", "timestamp", "id"),
+        # people_count range filters, optionally combined with a date range
+        Index("ix_detection_records_people_count_timestamp", "people_count", "timestamp"),
+        # Lazily rendered images are looked up by their result path
+        Index("ix_detection_records_result_image_url", "result_image_url"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
     people_count = Column(Integer, nullable=False)
     result_image_url = Column(String, nullable=False)
-    original_filename = Column(String, nullable=False)
\ No newline at end of file
+    original_filename = Column(String, nullable=False)
+    # Detector boxes as columns (`Detections.to_columns`; older records hold one object per box),
+    # used to render the annotated image; not loaded by history listings
+    detections = deferred(Column(JSON, nullable=True))
+
+class PeopleCountRollup(Base):
+    """
+    Detections aggregated per time bucket, maintained on insert (see app.database.rollups).
+    """
+    __tablename__ = "people_count_rollups"
+
+    granularity = Column(String(10), primary_key=True)  # "minute", "hour" or "day"
+    bucket_start = Column(DateTime, primary_key=True)
+    detections = Column(Integer, nullable=False, default=0)
+    people_sum = Column(BigInteger, nullable=False, default=0)
+    people_max = Column(Integer, nullable=False, default=0)
\ No newline at end of file
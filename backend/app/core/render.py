@@ -0,0 +1,251 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from .ingest import decode_image, UPLOAD_SAVE_MODE
+from .detections import Detections
+from .storage import storage
+from .metrics import timed, observe
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# "sync" renders before responding, "background" right after on a worker pool,
+# "lazy" on the first GET of the image
+RENDER_MODE = os.getenv("RENDER_MODE", "background").lower()
+# Output format of annotated images: "jpg", "webp", or empty to keep the upload's format
+RENDER_FORMAT = os.getenv("RENDER_FORMAT", "").lower().lstrip(".")
+RENDER_QUALITY = int(os.getenv("RENDER_QUALITY", 90))
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", 2))
+# Boxes of recent results kept in memory, so images can be rendered before their record is written
+RENDER_SPEC_CACHE = int(os.getenv("RENDER_SPEC_CACHE", 1024))
+# Background renders waiting or running; each holds the decoded image and the upload in memory.
+# Beyond this, results are rendered lazily from the stored original instead.
+RENDER_MAX_PENDING = int(os.getenv("RENDER_MAX_PENDING", 64))
+
+if RENDER_MODE == "lazy" and UPLOAD_SAVE_MODE == "off":
+    # Lazy rendering needs the stored original
+    logger.warning("RENDER_MODE=lazy requires stored uploads (UPLOAD_SAVE_MODE=off); rendering in the background instead")
+    RENDER_MODE = "background"
+
+_BOX_COLOR = (0, 255, 0)
+
+
+def result_extension(original_filename: str) -> str:
+    if RENDER_FORMAT in ("jpg", "jpeg", "webp", "png"):
+        return RENDER_FORMAT
+    return original_filename.split(".")[-1]
+
+
+def draw_detections(img, detections: Detections):
+    """
+    Draws a labelled bounding box on `img` for every detection. The outlines are built
+    from the box array and drawn with a single polyline call; only the labels are
+    drawn one by one.
+    """
+    boxes = detections.boxes
+    if not len(boxes):
+        return img
+    # Corners (x_min, y_min), (x_max, y_min), (x_max, y_max), (x_min, y_max) of every box
+    outlines = boxes[:, [[0, 1], [2, 1], [2, 3], [0, 3]]]
+    cv2.polylines(img, list(outlines), True, _BOX_COLOR, 2)
+    for idx, (x_min, y_min) in enumerate(boxes[:, :2].tolist()):
+        cv2.putText(img, f"Person {idx+1}", (x_min, y_min - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, _BOX_COLOR, 2)
+    return img
+
+
+def encode_params(extension: str) -> list:
+    extension = extension.lower()
+    if extension in ("jpg", "jpeg"):
+        return [cv2.IMWRITE_JPEG_QUALITY, RENDER_QUALITY]
+    if extension == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, RENDER_QUALITY]
+    return []
+
+
+def render_image(detections: Detections, extension: str, img=None, contents: bytes = None) -> bytes:
+    """
+    Draws `detections` on the image (given decoded, in which case it is drawn on in
+    place, or as encoded bytes) and encodes the result as `extension`.
+    """
+    if img is None:
+        img = decode_image(contents)
+        if img is None:
+            raise ValueError("Failed to read the image")
+    draw_detections(img, detections)
+
+    ok, encoded = cv2.imencode(f".{extension}", img, encode_params(extension))
+    if not ok:
+        raise ValueError(f"Failed to encode the image as {extension}")
+    return encoded.tobytes()
+
+
+async def find_source(result_key: str):
+    """
+    Storage key of the original of a result image; both share the upload's id, not its extension.
+    """
+    file_id = os.path.splitext(os.path.basename(result_key))[0]
+    return await storage.find(f"uploads/{file_id}.")
+
+
+class Renderer:
+    """
+    Renders annotated result images on a worker pool, either right after a detection
+    (`submit`) or on demand when the image is first requested (`ensure`). Concurrent
+    requests for the same image share one render.
+    Args:
+        workers (int): Number of rendering threads.
+        spec_cache (int): Number of recent results whose boxes are kept in memory.
+        max_pending (int): Background renders (with their pixel buffers) allowed in flight.
+    """
+
+    def __init__(self, workers: int = RENDER_WORKERS, spec_cache: int = RENDER_SPEC_CACHE,
+                 max_pending: int = RENDER_MAX_PENDING):
+        self.workers = max(1, workers)
+        self.spec_cache = max(1, spec_cache)
+        self.max_pending = max(1, max_pending)
+        self._executor = None
+        self._pending = {}
+        self._queued = 0
+        self.deferred = 0
+        self._specs = OrderedDict()
+        # Called with the result key and encoded image after every successful render
+        self.on_rendered = []
+        self.rendered = 0
+        self.lazy_renders = 0
+        self.failed = 0
+        self.total_render_ms = 0.0
+        self.max_render_ms = 0.0
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+        return self._executor
+
+    def remember(self, result_key: str, detections: Detections):
+        self._specs[result_key] = detections
+        self._specs.move_to_end(result_key)
+        while len(self._specs) > self.spec_cache:
+            self._specs.popitem(last=False)
+
+    async def _render(self, result_key: str, detections: Detections, img=None, contents: bytes = None,
+                      source_key: str = None):
+        if img is None and contents is None:
+            contents = await storage.read(source_key)
+        started = time.perf_counter()
+        encoded = await asyncio.get_running_loop().run_in_executor(
+            self._pool(), render_image, detections, result_key.rsplit(".", 1)[-1], img, contents
+        )
+        observe("render", time.perf_counter() - started)
+        with timed("storage_write"):
+            await storage.write(result_key, encoded)
+        elapsed = (time.perf_counter() - started) * 1000
+        self.rendered += 1
+        self.total_render_ms += elapsed
+        self.max_render_ms = max(self.max_render_ms, elapsed)
+        for listener in self.on_rendered:
+            listener(result_key, encoded)
+
+    def _start(self, result_key: str, detections: Detections, **source) -> asyncio.Task:
+        task = asyncio.ensure_future(self._render(result_key, detections, **source))
+        self._pending[result_key] = task
+
+        def done(t):
+            self._pending.pop(result_key, None)
+            if not t.cancelled() and t.exception() is not None:
+                self.failed += 1
+                logger.error(f"Failed to render {result_key}: {t.exception()}")
+        task.add_done_callback(done)
+        return task
+
+    async def render(self, result_key: str, detections: Detections, **source):
+        """
+        Renders now and waits for the image (RENDER_MODE=sync).
+        """
+        await self._start(result_key, detections, **source)
+
+    def submit(self, result_key: str, detections: Detections, **source) -> bool:
+        """
+        Queues a background render; the boxes are kept so the image can still be
+        rendered lazily if the background render fails. When RENDER_MAX_PENDING renders
+        are already queued, only the boxes are kept and the pixel buffers are dropped:
+        the image is rendered from the stored original on its first GET.
+        Returns:
+            bool: False when the render was deferred to the lazy path.
+        """
+        self.remember(result_key, detections)
+        if self._queued >= self.max_pending:
+            self.deferred += 1
+            return False
+        self._queued += 1
+        task = self._start(result_key, detections, **source)
+
+        def done(_):
+            self._queued -= 1
+        task.add_done_callback(done)
+        return True
+
+    async def available(self, result_key: str) -> bool:
+        """
+        Whether the image exists or can still be produced.
+        """
+        return (result_key in self._pending or await storage.exists(result_key)
+                or await find_source(result_key) is not None)
+
+    async def ensure(self, result_key: str, load_detections) -> bool:
+        """
+        Makes sure the result image `result_key` is stored, rendering it from the stored
+        original if needed. `load_detections` is awaited for the boxes when they are
+        not in memory.
+        Returns:
+            bool: False when the image cannot be produced.
+        """
+        pending = self._pending.get(result_key)
+        if pending is None:
+            if await storage.exists(result_key):
+                return True
+            detections = self._specs.get(result_key)
+            if detections is None:
+                detections = await load_detections()
+            source_key = await find_source(result_key)
+            if detections is None or source_key is None:
+                return False
+            # Another request may have started the same render while the boxes were loading
+            pending = self._pending.get(result_key)
+            if pending is None:
+                pending = self._start(result_key, detections, source_key=source_key)
+                self.lazy_renders += 1
+        try:
+            await asyncio.shield(pending)
+        except Exception:
+            return False
+        return True
+
+    async def close(self):
+        if self._pending:
+            await asyncio.gather(*self._pending.values(), return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "mode": RENDER_MODE,
+            "format": RENDER_FORMAT or "source",
+            "quality": RENDER_QUALITY,
+            "workers": self.workers,
+            "pending": len(self._pending),
+            "queued": self._queued,
+            "max_pending": self.max_pending,
+            "deferred": self.deferred,
+            "rendered": self.rendered,
+            "lazy_renders": self.lazy_renders,
+            "failed": self.failed,
+            "avg_render_ms": round(self.total_render_ms / self.rendered, 3) if self.rendered else 0.0,
+            "max_render_ms": round(self.max_render_ms, 3),
+        }
+
+
+renderer = Renderer()
@@ -0,0 +1,388 @@
+import os
+import uuid
+import asyncio
+from collections import namedtuple
+from fastapi.concurrency import run_in_threadpool
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# "local" keeps files under STORAGE_ROOT, "s3" in an S3-compatible bucket
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+STORAGE_ROOT = os.getenv("STORAGE_ROOT", ".")
+# Levels of two-character subdirectories per file (results/ab/cd/abcd....jpg); 0 keeps a flat directory
+STORAGE_SHARD_DEPTH = int(os.getenv("STORAGE_SHARD_DEPTH", 2))
+STORAGE_CHUNK_SIZE = int(os.getenv("STORAGE_CHUNK_SIZE", 1024 * 1024))
+S3_BUCKET = os.getenv("S3_BUCKET", "person-detection")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+# e.g. http://localhost:9000 for MinIO or another local stand-in
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION") or None
+# Multipart part size for streamed writes (S3 requires at least 5 MiB)
+S3_PART_SIZE = max(5 * 1024 * 1024, int(os.getenv("S3_PART_SIZE", 8 * 1024 * 1024)))
+
+# `mtime` is a POSIX timestamp; `etag` is None when the backend has none
+StoredObject = namedtuple("StoredObject", ["key", "size", "mtime", "etag"])
+
+
+class Storage:
+    """
+    Stores uploads and rendered results by key ("uploads/<name>", "results/<name>").
+    Keys match the paths kept in `DetectionRecord.result_image_url`. Writes accept
+    bytes or an async iterator of chunks, and reads can be streamed in chunks.
+    """
+
+    name = "base"
+
+    async def write(self, key: str, data):
+        raise NotImplementedError
+
+    async def read(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    def stream(self, key: str, chunk_size: int = STORAGE_CHUNK_SIZE):
+        """
+        Async iterator over the object's bytes, `chunk_size` at a time.
+        """
+        raise NotImplementedError
+
+    async def stat(self, key: str):
+        """
+        Returns:
+            StoredObject: The object's metadata, or None when it does not exist.
+        """
+        raise NotImplementedError
+
+    async def exists(self, key: str) -> bool:
+        return await self.stat(key) is not None
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    def list(self, prefix: str):
+        """
+        Async iterator over the StoredObjects whose key starts with `prefix`.
+        """
+        raise NotImplementedError
+
+    async def find(self, prefix: str):
+        """
+        Key of one object starting with `prefix`, or None.
+        """
+        async for stored in self.list(prefix):
+            return stored.key
+        return None
+
+    def local_path(self, key: str):
+        """
+        Filesystem path of the object when the backend has one, so it can be served
+        or read without copying. None otherwise.
+        """
+        return None
+
+    def info(self) -> dict:
+        return {"backend": self.name}
+
+
+async def _chunks(data):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        yield bytes(data)
+        return
+    async for chunk in data:
+        yield chunk
+
+
+class LocalStorage(Storage):
+    """
+    Files under `root`, spread over sharded subdirectories so no single directory
+    grows too large. Files written before sharding (directly under `results/` or
+    `uploads/`) are still found.
+    Args:
+        root (str): Base directory.
+        shard_depth (int): Levels of two-character subdirectories.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str = STORAGE_ROOT, shard_depth: int = STORAGE_SHARD_DEPTH):
+        self.root = root
+        self.shard_depth = max(0, shard_depth)
+
+    def _path(self, key: str) -> str:
+        folder, _, name = key.rpartition("/")
+        shards = [name[2 * level:2 * level + 2] for level in range(self.shard_depth)]
+        return os.path.join(self.root, folder, *shards, name)
+
+    def _existing_path(self, key: str):
+        for path in (self._path(key), os.path.join(self.root, key)):
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def local_path(self, key: str):
+        return self._existing_path(key)
+
+    async def write(self, key: str, data):
+        path = self._path(key)
+        temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+
+        def open_temp():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            return open(temp_path, "wb")
+
+        f = await run_in_threadpool(open_temp)
+        try:
+            async for chunk in _chunks(data):
+                await run_in_threadpool(f.write, chunk)
+        except BaseException:
+            await run_in_threadpool(f.close)
+            await run_in_threadpool(os.remove, temp_path)
+            raise
+        await run_in_threadpool(f.close)
+        # Readers never see a partial file
+        await run_in_threadpool(os.replace, temp_path, path)
+
+    async def read(self, key: str) -> bytes:
+        path = self._existing_path(key)
+        if path is None:
+            raise FileNotFoundError(key)
+
+        def read_file():
+            with open(path, "rb") as f:
+                return f.read()
+        return await run_in_threadpool(read_file)
+
+    async def stream(self, key: str, chunk_size: int = STORAGE_CHUNK_SIZE):
+        path = self._existing_path(key)
+        if path is None:
+            raise FileNotFoundError(key)
+        f = await run_in_threadpool(open, path, "rb")
+        try:
+            while True:
+                chunk = await run_in_threadpool(f.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            await run_in_threadpool(f.close)
+
+    async def stat(self, key: str):
+        path = self._existing_path(key)
+        if path is None:
+            return None
+        try:
+            result = await run_in_threadpool(os.stat, path)
+        except FileNotFoundError:
+            return None
+        return StoredObject(key, result.st_size, result.st_mtime, None)
+
+    async def delete(self, key: str):
+        for path in (self._path(key), os.path.join(self.root, key)):
+            try:
+                await run_in_threadpool(os.remove, path)
+            except FileNotFoundError:
+                pass
+
+    async def list(self, prefix: str):
+        folder, _, name_prefix = prefix.rpartition("/")
+        # Shard directories are not part of the key, so keys are "<top-level folder>/<name>"
+        pending = [(os.path.join(self.root, folder), folder)]
+        while pending:
+            directory, key_folder = pending.pop()
+
+            def scan():
+                found, subdirectories = [], []
+                try:
+                    with os.scandir(directory) as entries:
+                        for entry in entries:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirectories.append((entry.path, key_folder or entry.name))
+                            elif entry.name.startswith(name_prefix) and not entry.name.endswith(".tmp"):
+                                stat = entry.stat()
+                                found.append(StoredObject(f"{key_folder}/{entry.name}" if key_folder else entry.name,
+                                                          stat.st_size, stat.st_mtime, None))
+                except FileNotFoundError:
+                    pass
+                return found, subdirectories
+
+            found, subdirectories = await run_in_threadpool(scan)
+            pending.extend(subdirectories)
+            for stored in found:
+                yield stored
+
+    async def find(self, prefix: str):
+        # Every file sharing a name prefix of at least the shard width lives in the same shard
+        folder, _, name_prefix = prefix.rpartition("/")
+        if len(name_prefix) < 2 * self.shard_depth:
+            return await super().find(prefix)
+
+        def search():
+            for directory in (os.path.dirname(self._path(prefix + "x")), os.path.join(self.root, folder)):
+                try:
+                    with os.scandir(directory) as entries:
+                        for entry in entries:
+                            if entry.is_file() and entry.name.startswith(name_prefix) and not entry.name.endswith(".tmp"):
+                                return f"{folder}/{entry.name}" if folder else entry.name
+                except FileNotFoundError:
+                    continue
+            return None
+        return await run_in_threadpool(search)
+
+    def info(self) -> dict:
+        return {"backend": self.name, "root": os.path.abspath(self.root), "shard_depth": self.shard_depth}
+
+
+class S3Storage(Storage):
+    """
+    Objects in an S3-compatible bucket, under an optional key prefix. boto3 calls
+    run on worker threads; streamed writes use multipart uploads.
+    Args:
+        bucket (str): Bucket name; it is created on first use if missing.
+        prefix (str): Prefix prepended to every key.
+        endpoint_url (str, optional): Endpoint of a non-AWS service (MinIO, a local stand-in).
+    """
+
+    name = "s3"
+
+    def __init__(self, bucket: str = S3_BUCKET, prefix: str = S3_PREFIX, endpoint_url: str = S3_ENDPOINT_URL,
+                 region: str = S3_REGION):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self._client = None
+        self._lock = asyncio.Lock()
+
+    async def _s3(self):
+        if self._client is not None:
+            return self._client
+        async with self._lock:
+            if self._client is None:
+                def connect():
+                    import boto3
+
+                    client = boto3.client("s3", endpoint_url=self.endpoint_url, region_name=self.region)
+                    try:
+                        client.head_bucket(Bucket=self.bucket)
+                    except client.exceptions.ClientError:
+                        client.create_bucket(Bucket=self.bucket)
+                    return client
+                self._client = await run_in_threadpool(connect)
+                logger.info(f"Using S3 bucket {self.bucket} at {self.endpoint_url or 'AWS'}")
+        return self._client
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    @staticmethod
+    def _missing(error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    async def write(self, key: str, data):
+        client = await self._s3()
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            await run_in_threadpool(client.put_object, Bucket=self.bucket, Key=self._key(key), Body=bytes(data))
+            return
+
+        buffer = bytearray()
+        upload_id = None
+        parts = []
+        try:
+            async for chunk in data:
+                buffer.extend(chunk)
+                if len(buffer) >= S3_PART_SIZE:
+                    if upload_id is None:
+                        upload = await run_in_threadpool(client.create_multipart_upload,
+                                                         Bucket=self.bucket, Key=self._key(key))
+                        upload_id = upload["UploadId"]
+                    part = await run_in_threadpool(client.upload_part, Bucket=self.bucket, Key=self._key(key),
+                                                   UploadId=upload_id, PartNumber=len(parts) + 1, Body=bytes(buffer))
+                    parts.append({"ETag": part["ETag"], "PartNumber": len(parts) + 1})
+                    buffer.clear()
+            if upload_id is None:
+                # Small enough for a single request
+                await run_in_threadpool(client.put_object, Bucket=self.bucket, Key=self._key(key), Body=bytes(buffer))
+                return
+            if buffer:
+                part = await run_in_threadpool(client.upload_part, Bucket=self.bucket, Key=self._key(key),
+                                               UploadId=upload_id, PartNumber=len(parts) + 1, Body=bytes(buffer))
+                parts.append({"ETag": part["ETag"], "PartNumber": len(parts) + 1})
+            await run_in_threadpool(client.complete_multipart_upload, Bucket=self.bucket, Key=self._key(key),
+                                    UploadId=upload_id, MultipartUpload={"Parts": parts})
+        except BaseException:
+            if upload_id is not None:
+                await run_in_threadpool(client.abort_multipart_upload, Bucket=self.bucket, Key=self._key(key),
+                                        UploadId=upload_id)
+            raise
+
+    async def read(self, key: str) -> bytes:
+        client = await self._s3()
+        try:
+            response = await run_in_threadpool(client.get_object, Bucket=self.bucket, Key=self._key(key))
+        except client.exceptions.ClientError as e:
+            if self._missing(e):
+                raise FileNotFoundError(key) from e
+            raise
+        return await run_in_threadpool(response["Body"].read)
+
+    async def stream(self, key: str, chunk_size: int = STORAGE_CHUNK_SIZE):
+        client = await self._s3()
+        try:
+            response = await run_in_threadpool(client.get_object, Bucket=self.bucket, Key=self._key(key))
+        except client.exceptions.ClientError as e:
+            if self._missing(e):
+                raise FileNotFoundError(key) from e
+            raise
+        body = response["Body"]
+        try:
+            while True:
+                chunk = await run_in_threadpool(body.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    async def stat(self, key: str):
+        client = await self._s3()
+        try:
+            response = await run_in_threadpool(client.head_object, Bucket=self.bucket, Key=self._key(key))
+        except client.exceptions.ClientError as e:
+            if self._missing(e):
+                return None
+            raise
+        return StoredObject(key, response["ContentLength"], response["LastModified"].timestamp(),
+                            response.get("ETag"))
+
+    async def delete(self, key: str):
+        client = await self._s3()
+        await run_in_threadpool(client.delete_object, Bucket=self.bucket, Key=self._key(key))
+
+    async def list(self, prefix: str):
+        client = await self._s3()
+        token = None
+        while True:
+            arguments = {"Bucket": self.bucket, "Prefix": self._key(prefix)}
+            if token:
+                arguments["ContinuationToken"] = token
+            page = await run_in_threadpool(client.list_objects_v2, **arguments)
+            for item in page.get("Contents", []):
+                yield StoredObject(item["Key"][len(self.prefix):], item["Size"], item["LastModified"].timestamp(),
+                                   item.get("ETag"))
+            if not page.get("IsTruncated"):
+                break
+            token = page["NextContinuationToken"]
+
+    def info(self) -> dict:
+        return {"backend": self.name, "bucket": self.bucket, "prefix": self.prefix, "endpoint_url": self.endpoint_url}
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    if backend == "local":
+        return LocalStorage()
+    if backend == "s3":
+        return S3Storage()
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+storage = create_storage()
@@ -0,0 +1,84 @@
+import os
+import re
+import secrets
+from contextvars import ContextVar
+
+# Propagates W3C `traceparent` headers (the format OpenTelemetry uses) from incoming
+# requests to the detector, so one request can be followed across both services
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# (trace_id, span_id, flags) of the request being handled
+current_trace = ContextVar("current_trace", default=None)
+
+
+def parse_traceparent(header: str):
+    """
+    Returns:
+        tuple: (trace_id, parent span_id, flags), or None if the header is missing or malformed.
+    """
+    match = _TRACEPARENT.match((header or "").strip().lower())
+    if match is None or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.groups()
+
+
+def start_span(parent=None) -> tuple:
+    """
+    A new span in the trace of `parent`, or the root span of a new, sampled trace.
+    """
+    if parent is None:
+        return secrets.token_hex(16), secrets.token_hex(8), "01"
+    trace_id, _, flags = parent
+    return trace_id, secrets.token_hex(8), flags
+
+
+def format_traceparent(span: tuple) -> str:
+    trace_id, span_id, flags = span
+    return f"00-{trace_id}-{span_id}-{flags}"
+
+
+def outgoing_headers() -> dict:
+    """
+    Headers that continue the current trace on an outgoing request, with a new span id.
+    """
+    span = current_trace.get()
+    if span is None:
+        return {}
+    return {"traceparent": format_traceparent(start_span(span))}
+
+
+def trace_id():
+    span = current_trace.get()
+    return span[0] if span is not None else None
+
+
+class TracingMiddleware:
+    """
+    Pure ASGI middleware continuing the caller's trace (or starting one) for every
+    request, and echoing the request's own `traceparent` in the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(b"traceparent", b"").decode("latin-1")
+        span = start_span(parse_traceparent(incoming))
+        header = format_traceparent(span).encode("latin-1")
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"traceparent", header)]
+            await send(message)
+
+        token = current_trace.set(span)
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            current_trace.reset(token)
@@ -0,0 +1,163 @@
+import os
+import time
+import datetime
+import threading
+from collections import OrderedDict
+from sqlalchemy import text
+from app.core.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+COUNT_CACHE_ENABLED = os.getenv("COUNT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+COUNT_CACHE_MAX_ENTRIES = int(os.getenv("COUNT_CACHE_MAX_ENTRIES", 1024))
+# Bounds staleness from writes this process does not see (other workers, deletes)
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", 300))
+
+
+def _parse_date(value):
+    if value is None:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return value
+    # Records are stored as naive timestamps; offset-aware bounds are left to the database
+    return parsed if parsed.tzinfo is None else value
+
+
+def normalize_filters(min_people=None, max_people=None, date_from=None, date_to=None) -> tuple:
+    """
+    Canonical form of the history filters, so equivalent requests ("2024-01-01" and
+    "2024-01-01T00:00:00") share one cache entry. Unparseable dates are kept as given.
+    """
+    return (min_people, max_people, _parse_date(date_from), _parse_date(date_to))
+
+
+def _matches(key: tuple, timestamp: datetime.datetime, people_count: int) -> bool:
+    min_people, max_people, date_from, date_to = key
+    if min_people is not None and people_count < min_people:
+        return False
+    if max_people is not None and people_count > max_people:
+        return False
+    if date_from is not None and timestamp < date_from:
+        return False
+    if date_to is not None and timestamp > date_to:
+        return False
+    return True
+
+
+class CountCache:
+    """
+    Caches filtered history counts. Instead of being invalidated, entries are
+    adjusted in place when this process commits new records, so a polling client
+    keeps hitting the cache while detections are coming in.
+    Args:
+        max_entries (int): Maximum number of cached filter sets (LRU).
+        ttl (float): Seconds before an entry is recomputed. 0 disables expiry.
+    """
+
+    def __init__(self, max_entries: int = COUNT_CACHE_MAX_ENTRIES, ttl: float = COUNT_CACHE_TTL):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every insert; a count computed across an insert is not cached
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.adjustments = 0
+        self.estimates = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                count, stored_at = entry
+                if self.ttl <= 0 or time.monotonic() - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return count
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, count: int, generation: int):
+        """
+        Stores a count computed while the cache was at `generation`; dropped if
+        records were inserted in the meantime, since the count may or may not include them.
+        """
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (count, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_inserted(self, rows):
+        """
+        Adds committed records, given as (timestamp, people_count) pairs, to every
+        cached count whose filters they match.
+        """
+        rows = [row for row in rows if row[0] is not None]
+        with self._lock:
+            self._generation += 1
+            for key, (count, stored_at) in list(self._entries.items()):
+                if any(isinstance(bound, str) for bound in key[2:]):
+                    # Cannot evaluate an unparsed date filter in Python
+                    del self._entries[key]
+                    continue
+                matched = sum(1 for timestamp, people_count in rows if _matches(key, timestamp, people_count))
+                if matched:
+                    self._entries[key] = (count + matched, stored_at)
+                    self.adjustments += 1
+
+    def estimate(self, db):
+        """
+        Unfiltered total from planner statistics, see `estimate_total`.
+        """
+        estimate = estimate_total(db)
+        if estimate is not None:
+            with self._lock:
+                self.estimates += 1
+        return estimate
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": COUNT_CACHE_ENABLED,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "adjustments": self.adjustments,
+            "estimates": self.estimates,
+            "ttl": self.ttl,
+        }
+
+
+def estimate_total(db, table: str = "detection_records"):
+    """
+    Approximate row count from PostgreSQL planner statistics (pg_class.reltuples),
+    which costs a catalog lookup instead of a table scan.
+    Returns:
+        int: The estimate, or None when it is unavailable (other databases, never analyzed).
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    estimate = db.execute(text("SELECT reltuples FROM pg_class WHERE relname = :table"), {"table": table}).scalar()
+    if estimate is None or estimate < 0:
+        return None
+    return int(estimate)
+
+
+count_cache = CountCache()
@@ -1,5 +1,7 @@
 import os
+from contextlib import asynccontextmanager
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.logger import setup_logger
@@ -12,20 +14,77 @@ POSTGRES_HOST = os.getenv("POSTGRES_HOST", "postgres_db")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
 POSTGRES_DB = os.getenv("POSTGRES_DB", "persondb")
 
-DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+# DATABASE_URL overrides the POSTGRES_* settings (e.g. sqlite:///bench.db for local benchmarks)
+DATABASE_URL = os.getenv("DATABASE_URL") or f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
 
-logger.info(f"Database URL: {DATABASE_URL}")
+# Writes from the async request handlers go through an async engine (asyncpg / aiosqlite)
+# instead of blocking the event loop; DB_ASYNC=false runs them on the sync engine in a thread
+DB_ASYNC = os.getenv("DB_ASYNC", "true").lower() in ("1", "true", "yes")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
 
-engine = create_engine(DATABASE_URL)
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url: str) -> str:
+    """
+    Derives the async driver URL (asyncpg / aiosqlite) from a sync database URL.
+    """
+    parsed = make_url(url)
+    if parsed.drivername not in _ASYNC_DRIVERS:
+        return url
+    return parsed.set(drivername=_ASYNC_DRIVERS[parsed.drivername]).render_as_string(hide_password=False)
+
+
+def pool_options(url: str) -> dict:
+    """
+    Connection pool settings; SQLite uses SQLAlchemy's own pool choice.
+    """
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if not make_url(url).drivername.startswith("sqlite"):
+        options.update({
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+        })
+    return options
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+
+# The password never reaches the logs
+logger.info("Database URL: %s", make_url(DATABASE_URL).render_as_string(hide_password=True))
+
+engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL))
+    # Committed objects stay readable without another round trip
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def init_db():
     """Initialize database tables"""
     # Import here to avoid circular imports
     from app.core.models import DetectionRecord
+    from app.database.migrations import run_migrations
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
 
 def get_db():
     """Database session dependency"""
@@ -35,6 +94,29 @@ def get_db():
     finally:
         db.close()
 
+async def get_write_db():
+    """
+    Session dependency for the async handlers: an AsyncSession when DB_ASYNC is on,
+    otherwise a regular Session (see `app.database.records.persist_records`).
+    """
+    if AsyncSessionLocal is None:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+        return
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# For writers outside a request (e.g. the write-behind buffer)
+write_session = asynccontextmanager(get_write_db)
+
+async def dispose_engines():
+    if async_engine is not None:
+        await async_engine.dispose()
+    engine.dispose()
+
 if __name__ == "__main__":
     init_db()
     print("Database tables created successfully!")
\ No newline at end of file
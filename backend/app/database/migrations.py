@@ -0,0 +1,76 @@
+import datetime
+from sqlalchemy import text, inspect
+from sqlalchemy.exc import IntegrityError
+from app.core.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# `create_all` only creates missing tables, so schema changes to existing tables
+# (indexes, columns) are applied here, in order, and recorded in schema_migrations.
+
+
+def _create_index(name: str, table: str, columns: str):
+    def migrate(connection):
+        if connection.dialect.name == "postgresql":
+            # CONCURRENTLY keeps the table writable while a large index is built
+            connection.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})"))
+        else:
+            connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+    return migrate
+
+
+def _add_column(table: str, column: str, definition: str):
+    def migrate(connection):
+        if column not in {c["name"] for c in inspect(connection).get_columns(table)}:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+    return migrate
+
+
+MIGRATIONS = [
+    ("0001_history_composite_indexes", "Composite indexes for history filters and keyset pagination", [
+        _create_index("ix_detection_records_timestamp_id", "detection_records", "timestamp, id"),
+        _create_index("ix_detection_records_people_count_timestamp", "detection_records", "people_count, timestamp"),
+    ]),
+    ("0002_detection_boxes", "Detector boxes stored with each record for lazy rendering", [
+        _add_column("detection_records", "detections", "JSON"),
+        _create_index("ix_detection_records_result_image_url", "detection_records", "result_image_url"),
+    ]),
+]
+
+
+def applied_migrations(engine) -> set:
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations (version VARCHAR(255) PRIMARY KEY, applied_at TIMESTAMP NOT NULL)"
+        ))
+        return {row[0] for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def run_migrations(engine):
+    """
+    Applies every migration that has not been recorded yet. Steps run in autocommit
+    mode (required for CREATE INDEX CONCURRENTLY) and are idempotent, so a migration
+    interrupted half-way is simply re-run.
+    """
+    done = applied_migrations(engine)
+    for version, description, steps in MIGRATIONS:
+        if version in done:
+            continue
+        logger.info(f"Applying migration {version}: {description}")
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            for step in steps:
+                step(connection)
+            try:
+                connection.execute(text("INSERT INTO schema_migrations (version, applied_at) VALUES (:version, :applied_at)"),
+                                   {"version": version, "applied_at": datetime.datetime.utcnow()})
+            except IntegrityError:
+                # Another process applied it concurrently
+                pass
+        logger.info(f"Migration {version} applied")
+
+
+if __name__ == "__main__":
+    from app.database.db import init_db
+
+    init_db()
+    print("Database migrations applied successfully!")
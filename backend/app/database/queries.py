@@ -0,0 +1,71 @@
+import base64
+import datetime
+from sqlalchemy import tuple_
+from app.core.models import DetectionRecord
+
+
+class InvalidCursorError(ValueError):
+    """
+    Raised when a pagination cursor cannot be decoded.
+    """
+
+
+def apply_history_filters(query, min_people=None, max_people=None, date_from=None, date_to=None):
+    """
+    Applies the history API's optional filters to a `DetectionRecord` query.
+    """
+    if min_people is not None:
+        query = query.filter(DetectionRecord.people_count >= min_people)
+    if max_people is not None:
+        query = query.filter(DetectionRecord.people_count <= max_people)
+    if date_from is not None:
+        query = query.filter(DetectionRecord.timestamp >= date_from)
+    if date_to is not None:
+        query = query.filter(DetectionRecord.timestamp <= date_to)
+    return query
+
+
+def encode_cursor(record) -> str:
+    """
+    Opaque cursor pointing just after `record` in (timestamp, id) descending order.
+    """
+    raw = f"{record.timestamp.isoformat()}|{record.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """
+    Returns:
+        tuple: (timestamp, id) of the last record of the previous page.
+    Raises:
+        InvalidCursorError: If the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        timestamp, record_id = raw.rsplit("|", 1)
+        return datetime.datetime.fromisoformat(timestamp), int(record_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_page(query, limit: int, cursor: str = None, skip: int = 0):
+    """
+    Returns one page of records, newest first, and the cursor of the next page.
+    With a cursor the page starts with a row-value comparison on (timestamp, id),
+    which walks the composite index from the cursor instead of scanning and
+    discarding every earlier row like OFFSET does. `skip` is only used without a cursor.
+    Returns:
+        tuple: (records, next_cursor or None when this is the last page)
+    """
+    query = query.order_by(DetectionRecord.timestamp.desc(), DetectionRecord.id.desc())
+    if cursor is not None:
+        query = query.filter(tuple_(DetectionRecord.timestamp, DetectionRecord.id) < tuple_(*decode_cursor(cursor)))
+    elif skip:
+        query = query.offset(skip)
+
+    # One extra row tells whether another page exists without a COUNT
+    records = query.limit(limit + 1).all()
+    if len(records) <= limit:
+        return records, None
+    records = records[:limit]
+    return records, encode_cursor(records[-1])
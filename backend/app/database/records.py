@@ -0,0 +1,123 @@
+import asyncio
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert, select, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.models import DetectionRecord
+from app.core.detections import Detections
+from app.core.metrics import timed
+from app.core.logger import setup_logger
+from app.database.db import write_session
+from app.database.rollups import apply_rollups, upsert_buckets, rollup_buffer, ROLLUP_FLUSH_INTERVAL
+from app.database.counts import count_cache
+
+logger = setup_logger(__name__)
+
+
+def insert_detection_records(db, rows: list) -> list:
+    """
+    Inserts detection records (dicts of column values) with one INSERT ... RETURNING,
+    without committing. The rollups are updated in the same transaction only with
+    ROLLUP_FLUSH_INTERVAL=0; otherwise `persist_records` hands the records to the
+    rollup buffer after the commit. Works on a plain Session and, through
+    `AsyncSession.run_sync`, on an async one.
+    Returns:
+        list: The new primary keys, in the order of `rows`.
+    """
+    statement = insert(DetectionRecord).returning(DetectionRecord.id, sort_by_parameter_order=True)
+    ids = list(db.execute(statement, rows).scalars())
+    if rollup_buffer is None:
+        apply_rollups(db, [(row["timestamp"], row["people_count"]) for row in rows])
+    return ids
+
+
+def reserve_id_block(db, size: int, after: int = 0) -> list:
+    """
+    Reserves `size` detection record ids ahead of the insert. On PostgreSQL they are
+    drawn from the id sequence, so they are unique across processes. Other databases
+    have no sequence, so the block continues after the highest existing id (and
+    `after`, the last id already handed out), which is only safe with a single writer.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return list(db.execute(
+            text("SELECT nextval(pg_get_serial_sequence('detection_records', 'id')) FROM generate_series(1, :size)"),
+            {"size": size}
+        ).scalars())
+    start = max(db.execute(select(func.max(DetectionRecord.id))).scalar() or 0, after) + 1
+    return list(range(start, start + size))
+
+
+def find_detections(db, result_image_url: str):
+    """
+    Stored boxes of the record that owns `result_image_url`, as `Detections`, or None.
+    """
+    stored = db.execute(
+        select(DetectionRecord.detections).where(DetectionRecord.result_image_url == result_image_url).limit(1)
+    ).scalar()
+    return Detections.from_payload(stored) if stored is not None else None
+
+
+async def run_write(db, fn, *args):
+    """
+    Runs `fn(session, *args)` and commits without blocking the event loop: natively
+    on an AsyncSession, or on a worker thread for a sync Session.
+    """
+    if isinstance(db, AsyncSession):
+        result = await db.run_sync(fn, *args)
+        await db.commit()
+        return result
+
+    def run_and_commit():
+        result = fn(db, *args)
+        db.commit()
+        return result
+    return await run_in_threadpool(run_and_commit)
+
+
+async def persist_records(db, rows: list) -> list:
+    """
+    Inserts and commits detection records, then adds them to the history count cache.
+    Returns:
+        list: The new primary keys, in the order of `rows`.
+    """
+    if not rows:
+        return []
+    with timed("db_commit"):
+        ids = await run_write(db, insert_detection_records, rows)
+    counts = [(row["timestamp"], row["people_count"]) for row in rows]
+    count_cache.record_inserted(counts)
+    if rollup_buffer is not None:
+        rollup_buffer.add(counts)
+    return ids
+
+
+async def flush_rollups():
+    """
+    Adds the aggregates collected by the rollup buffer to the rollup table, in one
+    transaction. They are kept for the next flush when it fails.
+    """
+    if rollup_buffer is None:
+        return
+    buckets = rollup_buffer.take()
+    if not buckets:
+        return
+    try:
+        async with write_session() as db:
+            await run_write(db, upsert_buckets, buckets)
+    except asyncio.CancelledError:
+        rollup_buffer.restore(buckets)
+        raise
+    except Exception as e:
+        rollup_buffer.restore(buckets)
+        rollup_buffer.failed += 1
+        logger.error(f"Rollup flush of {len(buckets)} bucket(s) failed, retrying on the next one: {e}")
+        return
+    rollup_buffer.flushes += 1
+
+
+async def run_rollup_flusher(interval: float = ROLLUP_FLUSH_INTERVAL):
+    """
+    Runs `flush_rollups` every `interval` seconds until cancelled.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        await flush_rollups()
@@ -0,0 +1,118 @@
+import os
+import time
+import asyncio
+import argparse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from app.core.logger import setup_logger
+from app.core.models import DetectionRecord
+from app.core.storage import storage
+from app.database.db import SessionLocal
+
+logger = setup_logger(__name__)
+
+# Stored files older than this many days are deleted; 0 keeps them forever
+RESULT_RETENTION_DAYS = float(os.getenv("RESULT_RETENTION_DAYS", 0))
+UPLOAD_RETENTION_DAYS = float(os.getenv("UPLOAD_RETENTION_DAYS", 0))
+# Unreferenced files younger than this are kept: their record may not be written yet
+STORAGE_GC_MIN_AGE = float(os.getenv("STORAGE_GC_MIN_AGE", 3600))
+# Seconds between garbage collections run by the backend itself; 0 disables them
+STORAGE_GC_INTERVAL = float(os.getenv("STORAGE_GC_INTERVAL", 0))
+STORAGE_GC_BATCH = int(os.getenv("STORAGE_GC_BATCH", 500))
+
+# Result images may be re-encoded, so an upload's result can have another extension
+_RESULT_EXTENSIONS = ("jpg", "jpeg", "png", "webp")
+
+
+def referenced_results(db, keys: list) -> set:
+    rows = db.execute(select(DetectionRecord.result_image_url).where(DetectionRecord.result_image_url.in_(keys)))
+    return set(rows.scalars())
+
+
+def referenced_uploads(db, keys: list) -> set:
+    """
+    Upload keys whose result image (same id, any extension) belongs to a record.
+    """
+    candidates = {}
+    for key in keys:
+        name = os.path.basename(key)
+        file_id, _, extension = name.rpartition(".")
+        for result_extension in {extension, *_RESULT_EXTENSIONS}:
+            candidates[f"results/{file_id}.{result_extension}"] = key
+    return {candidates[key] for key in referenced_results(db, list(candidates))}
+
+
+def _referenced(folder: str, keys: list) -> set:
+    db = SessionLocal()
+    try:
+        return referenced_results(db, keys) if folder == "results" else referenced_uploads(db, keys)
+    finally:
+        db.close()
+
+
+async def _sweep(folder: str, batch: list, retention_days: float, dry_run: bool, report: dict):
+    now = time.time()
+    doomed = []
+    candidates = []
+    for stored in batch:
+        age = now - stored.mtime
+        if retention_days > 0 and age > retention_days * 86400:
+            doomed.append(stored)
+            report["expired"] += 1
+        elif age > STORAGE_GC_MIN_AGE:
+            candidates.append(stored)
+    if candidates:
+        referenced = await run_in_threadpool(_referenced, folder, [stored.key for stored in candidates])
+        orphans = [stored for stored in candidates if stored.key not in referenced]
+        report["orphaned"] += len(orphans)
+        doomed.extend(orphans)
+
+    for stored in doomed:
+        report["deleted_bytes"] += stored.size
+        if not dry_run:
+            await storage.delete(stored.key)
+
+
+async def collect_garbage(dry_run: bool = False) -> dict:
+    """
+    Deletes stored results and uploads that are past their retention period, and
+    those no detection record refers to anymore (once older than STORAGE_GC_MIN_AGE).
+    Files are checked against the database in batches of STORAGE_GC_BATCH.
+    Returns:
+        dict: Files scanned, expired, orphaned and the bytes deleted (or that would be, with `dry_run`).
+    """
+    started = time.perf_counter()
+    report = {"scanned": 0, "expired": 0, "orphaned": 0, "deleted_bytes": 0, "dry_run": dry_run}
+    for folder, retention_days in (("results", RESULT_RETENTION_DAYS), ("uploads", UPLOAD_RETENTION_DAYS)):
+        batch = []
+        async for stored in storage.list(f"{folder}/"):
+            report["scanned"] += 1
+            batch.append(stored)
+            if len(batch) >= STORAGE_GC_BATCH:
+                await _sweep(folder, batch, retention_days, dry_run, report)
+                batch = []
+        if batch:
+            await _sweep(folder, batch, retention_days, dry_run, report)
+    report["elapsed_s"] = round(time.perf_counter() - started, 3)
+    logger.info(f"Storage garbage collection: {report}")
+    return report
+
+
+async def run_periodically(interval: float = STORAGE_GC_INTERVAL):
+    """
+    Runs `collect_garbage` every `interval` seconds until cancelled.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await collect_garbage()
+        except Exception as e:
+            logger.error(f"Storage garbage collection failed: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete expired and unreferenced uploads and result images")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted without deleting")
+    args = parser.parse_args()
+
+    print(asyncio.run(collect_garbage(args.dry_run)))
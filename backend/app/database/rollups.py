@@ -0,0 +1,217 @@
+import os
+import argparse
+import datetime
+from sqlalchemy import func, delete, insert, select, literal, literal_column
+from app.core.logger import setup_logger
+from app.core.models import DetectionRecord, PeopleCountRollup
+
+logger = setup_logger(__name__)
+
+# Seconds between rollup flushes. Records only add to in-memory aggregates, so concurrent inserts
+# never lock the same bucket rows; 0 updates the rollups inside every insert transaction instead.
+ROLLUP_FLUSH_INTERVAL = float(os.getenv("ROLLUP_FLUSH_INTERVAL", 2))
+
+GRANULARITIES = ("minute", "hour", "day")
+BUCKET_LENGTHS = {
+    "minute": datetime.timedelta(minutes=1),
+    "hour": datetime.timedelta(hours=1),
+    "day": datetime.timedelta(days=1),
+}
+
+# SQLite stores DateTime as text with microseconds; buckets computed in SQL must use the same format
+_SQLITE_BUCKET_FORMATS = {
+    "minute": "%Y-%m-%d %H:%M:00.000000",
+    "hour": "%Y-%m-%d %H:00:00.000000",
+    "day": "%Y-%m-%d 00:00:00.000000",
+}
+
+
+def bucket_start(timestamp: datetime.datetime, granularity: str) -> datetime.datetime:
+    if granularity == "minute":
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def _dialect_insert(db):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        return dialect_insert, func.greatest
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        # SQLite's scalar max() takes several arguments, like GREATEST
+        return dialect_insert, func.max
+    raise NotImplementedError(f"Rollups are not supported on {dialect}")
+
+
+def aggregate_buckets(rows, buckets: dict = None) -> dict:
+    """
+    Aggregates records, given as (timestamp, people_count) pairs, per minute/hour/day
+    bucket, into `buckets` when given.
+    Returns:
+        dict: (granularity, bucket start) -> (detections, people sum, people max)
+    """
+    buckets = {} if buckets is None else buckets
+    for timestamp, people_count in rows:
+        for granularity in GRANULARITIES:
+            key = (granularity, bucket_start(timestamp, granularity))
+            detections, people_sum, people_max = buckets.get(key, (0, 0, 0))
+            buckets[key] = (detections + 1, people_sum + people_count, max(people_max, people_count))
+    return buckets
+
+
+def merge_buckets(into: dict, buckets: dict) -> dict:
+    for key, (detections, people_sum, people_max) in buckets.items():
+        total, total_sum, total_max = into.get(key, (0, 0, 0))
+        into[key] = (total + detections, total_sum + people_sum, max(total_max, people_max))
+    return into
+
+
+def apply_rollups(db, rows):
+    """
+    Adds records, given as (timestamp, people_count) pairs, to the minute/hour/day
+    rollups in the caller's transaction, so the rollups commit (or roll back) together
+    with the records. Records are aggregated per bucket first, so a batch costs one
+    upsert per touched bucket. Concurrent transactions that touch the same buckets
+    wait for each other's row locks, which is why this is only used with
+    ROLLUP_FLUSH_INTERVAL=0 (see `RollupBuffer`).
+    """
+    upsert_buckets(db, aggregate_buckets(rows))
+
+
+def upsert_buckets(db, buckets: dict):
+    """
+    Adds aggregates from `aggregate_buckets` to the rollup table with one upsert, without committing.
+    """
+    if not buckets:
+        return
+
+    dialect_insert, greatest = _dialect_insert(db)
+    table = PeopleCountRollup.__table__
+    # Sorted keys give concurrent transactions the same row-lock order, which avoids deadlocks
+    rows = [{"granularity": granularity, "bucket_start": start, "detections": detections,
+             "people_sum": people_sum, "people_max": people_max}
+            for (granularity, start), (detections, people_sum, people_max) in sorted(buckets.items())]
+    statement = dialect_insert(table).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.granularity, table.c.bucket_start],
+        set_={
+            "detections": table.c.detections + statement.excluded.detections,
+            "people_sum": table.c.people_sum + statement.excluded.people_sum,
+            "people_max": greatest(table.c.people_max, statement.excluded.people_max),
+        }
+    )
+    db.execute(statement)
+
+
+class RollupBuffer:
+    """
+    Aggregates committed records per bucket in memory; `take` hands the aggregates to
+    a periodic flush, which adds them to the rollup table in one short transaction.
+    Inserts never touch the hot minute/hour/day rows, so concurrent writers do not
+    serialize on their locks. In exchange, analytics lag by up to ROLLUP_FLUSH_INTERVAL,
+    and aggregates not yet flushed when the process dies are lost (rebuild them with
+    `backfill`).
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self.records = 0
+        self.flushes = 0
+        self.failed = 0
+
+    def add(self, rows):
+        """
+        Adds committed records, given as (timestamp, people_count) pairs.
+        """
+        rows = list(rows)
+        aggregate_buckets(rows, self._pending)
+        self.records += len(rows)
+
+    def take(self) -> dict:
+        buckets, self._pending = self._pending, {}
+        return buckets
+
+    def restore(self, buckets: dict):
+        """
+        Puts back aggregates whose flush failed, for the next one.
+        """
+        merge_buckets(self._pending, buckets)
+
+    def stats(self) -> dict:
+        return {
+            "flush_interval": ROLLUP_FLUSH_INTERVAL,
+            "pending_buckets": len(self._pending),
+            "records": self.records,
+            "flushes": self.flushes,
+            "failed": self.failed,
+        }
+
+
+rollup_buffer = RollupBuffer() if ROLLUP_FLUSH_INTERVAL > 0 else None
+
+
+def _bucket_expression(db, granularity: str):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        # Inlined rather than bound, so the SELECT and GROUP BY expressions are identical
+        return func.date_trunc(literal_column(f"'{granularity}'"), DetectionRecord.timestamp)
+    if dialect == "sqlite":
+        return func.strftime(_SQLITE_BUCKET_FORMATS[granularity], DetectionRecord.timestamp)
+    raise NotImplementedError(f"Rollups are not supported on {dialect}")
+
+
+def backfill(db, date_from: datetime.datetime = None, date_to: datetime.datetime = None):
+    """
+    Rebuilds the rollups from detection_records, for every bucket or only for the
+    buckets between `date_from` and `date_to`, with one GROUP BY per granularity.
+    Run it while no detections are being recorded for that range, or rows inserted
+    during the rebuild (or still waiting in a backend's `RollupBuffer`) may be counted twice.
+    """
+    for granularity in GRANULARITIES:
+        # Whole buckets are rebuilt: the range is widened to bucket boundaries
+        start = bucket_start(date_from, granularity) if date_from is not None else None
+        end = bucket_start(date_to, granularity) if date_to is not None else None
+
+        clear = delete(PeopleCountRollup).where(PeopleCountRollup.granularity == granularity)
+        if start is not None:
+            clear = clear.where(PeopleCountRollup.bucket_start >= start)
+        if end is not None:
+            clear = clear.where(PeopleCountRollup.bucket_start <= end)
+        db.execute(clear)
+
+        bucket = _bucket_expression(db, granularity)
+        aggregate = select(
+            literal(granularity), bucket, func.count(), func.sum(DetectionRecord.people_count),
+            func.max(DetectionRecord.people_count)
+        ).where(DetectionRecord.timestamp.isnot(None)).group_by(bucket)
+        if start is not None:
+            aggregate = aggregate.where(DetectionRecord.timestamp >= start)
+        if end is not None:
+            aggregate = aggregate.where(DetectionRecord.timestamp < end + BUCKET_LENGTHS[granularity])
+        result = db.execute(insert(PeopleCountRollup).from_select(
+            ["granularity", "bucket_start", "detections", "people_sum", "people_max"], aggregate
+        ))
+        logger.info(f"Backfilled {result.rowcount} {granularity} bucket(s)")
+    db.commit()
+
+
+if __name__ == "__main__":
+    from app.database.db import SessionLocal, init_db
+
+    parser = argparse.ArgumentParser(description="Rebuild people-count rollups from detection_records")
+    parser.add_argument("--date-from", type=datetime.datetime.fromisoformat, default=None)
+    parser.add_argument("--date-to", type=datetime.datetime.fromisoformat, default=None)
+    args = parser.parse_args()
+
+    init_db()
+    session = SessionLocal()
+    try:
+        backfill(session, args.date_from, args.date_to)
+    finally:
+        session.close()
+    print("Rollups rebuilt successfully!")
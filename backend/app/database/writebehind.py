@@ -0,0 +1,298 @@
+import os
+import json
+import time
+import asyncio
+import datetime
+from collections import deque
+from app.core.logger import setup_logger
+from app.core.metrics import WRITE_BEHIND_RECORDS
+from app.database.db import write_session
+from app.database.records import persist_records, reserve_id_block, run_write
+
+logger = setup_logger(__name__)
+
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() in ("1", "true", "yes")
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", 500))
+WRITE_BEHIND_FLUSH_MS = float(os.getenv("WRITE_BEHIND_FLUSH_MS", 200))
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", 10000))
+WRITE_BEHIND_ID_BLOCK = int(os.getenv("WRITE_BEHIND_ID_BLOCK", 1000))
+WRITE_BEHIND_RETRIES = int(os.getenv("WRITE_BEHIND_RETRIES", 3))
+# Longest wait between retries of a failing flush; records are never dropped while the app runs
+WRITE_BEHIND_MAX_BACKOFF = float(os.getenv("WRITE_BEHIND_MAX_BACKOFF", 30))
+# Records that still cannot be written at shutdown are appended here and replayed on the next start
+WRITE_BEHIND_SPILL_FILE = os.getenv("WRITE_BEHIND_SPILL_FILE", "write_behind_spill.jsonl")
+
+
+class IdAllocator:
+    """
+    Hands out detection record ids from blocks reserved in the database, so a
+    record's id is known before the record is written.
+    Args:
+        block_size (int): Number of ids reserved per database round trip.
+    """
+
+    def __init__(self, block_size: int = WRITE_BEHIND_ID_BLOCK):
+        self.block_size = max(1, block_size)
+        self.blocks = 0
+        self._ids = deque()
+        self._last = 0
+        self._lock = asyncio.Lock()
+
+    async def reserve(self, count: int) -> list:
+        async with self._lock:
+            while len(self._ids) < count:
+                size = max(self.block_size, count - len(self._ids))
+                async with write_session() as db:
+                    block = await run_write(db, reserve_id_block, size, self._last)
+                self._ids.extend(block)
+                self._last = max(self._last, block[-1])
+                self.blocks += 1
+            return [self._ids.popleft() for _ in range(count)]
+
+    def skip_to(self, last: int):
+        """
+        Makes the next blocks start after `last`, an id that was handed out by an earlier process.
+        """
+        self._last = max(self._last, last)
+
+    def available(self) -> int:
+        return len(self._ids)
+
+
+class WriteBehindBuffer:
+    """
+    Accumulates detection records in memory and writes them in bulk, once
+    `max_batch` records are pending or `flush_ms` after the first one arrived.
+    Ids are assigned on submit, so callers get them back without waiting for the
+    write. Records become visible in the history after the flush, and records
+    still buffered are lost if the process dies (they are flushed on shutdown).
+    A failing flush is retried with backoff until it succeeds, holding its batch;
+    meanwhile the queue fills and submitters wait, which slows down `/detect`
+    instead of losing records whose ids were already handed out. At shutdown, a
+    batch that still fails after `retries` attempts is written to `spill_file`
+    and replayed on the next start; it is only dropped when that fails too.
+    Args:
+        max_batch (int): Upper bound on the number of records per insert.
+        flush_ms (float): How long the first pending record may wait for more.
+        queue_size (int): Maximum number of pending records; submitters wait when it is full.
+        retries (int): Attempts per flush at shutdown before its records are spilled.
+        spill_file (str): JSON lines file for records that could not be written at shutdown.
+    """
+
+    def __init__(self, max_batch: int = WRITE_BEHIND_MAX_BATCH, flush_ms: float = WRITE_BEHIND_FLUSH_MS,
+                 queue_size: int = WRITE_BEHIND_QUEUE_SIZE, retries: int = WRITE_BEHIND_RETRIES,
+                 spill_file: str = WRITE_BEHIND_SPILL_FILE):
+        self.max_batch = max(1, max_batch)
+        self.window = max(0.0, flush_ms) / 1000.0
+        self.queue_size = max(1, queue_size)
+        self.retries = max(1, retries)
+        self.spill_file = spill_file or None
+        self.ids = IdAllocator()
+        self._queue = None
+        self._worker = None
+        self._closed = False
+        self.submitted = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.failed = 0
+        self.retried = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.blocked_submits = 0
+        self.total_flush_ms = 0.0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.max_record_wait_ms = 0.0
+
+    async def start(self):
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._closed = False
+        self._worker = asyncio.create_task(self._run(self._load_spill()))
+        logger.info(f"Write-behind buffer started (max_batch={self.max_batch}, flush_ms={self.window * 1000:.0f}, "
+                    f"queue_size={self.queue_size})")
+
+    async def close(self):
+        """
+        Stops accepting records and waits until every pending record is flushed.
+        """
+        if self._worker is None:
+            return
+        self._closed = True
+        await self._queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        logger.info(f"Write-behind buffer closed ({self.flushed} record(s) flushed, {self.spilled} spilled, "
+                    f"{self.dropped} dropped)")
+
+    async def submit(self, rows: list) -> list:
+        """
+        Assigns ids to `rows` (dicts of DetectionRecord column values) and queues
+        them for the next flush.
+        Returns:
+            list: The ids of the records, in the order of `rows`.
+        """
+        if self._closed:
+            raise RuntimeError("Write-behind buffer is closed")
+        if self._worker is None:
+            await self.start()
+        ids = await self.ids.reserve(len(rows))
+        now = time.perf_counter()
+        for record_id, row in zip(ids, rows):
+            if self._queue.full():
+                self.blocked_submits += 1
+            await self._queue.put(({**row, "id": record_id}, now))
+        self.submitted += len(rows)
+        return ids
+
+    def stats(self) -> dict:
+        return {
+            "backlog": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            "max_batch": self.max_batch,
+            "flush_ms": self.window * 1000,
+            "submitted": self.submitted,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "retries": self.retried,
+            "blocked_submits": self.blocked_submits,
+            "avg_batch_size": round(self.flushed / self.flushes, 3) if self.flushes else 0.0,
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "max_record_wait_ms": round(self.max_record_wait_ms, 3),
+            "id_blocks_reserved": self.ids.blocks,
+            "ids_available": self.ids.available(),
+        }
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0 or self._closed:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self, spilled: list):
+        await self._replay(spilled)
+        while True:
+            batch = await self._collect()
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: list) -> bool:
+        rows = [row for row, _ in batch]
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                async with write_session() as db:
+                    await persist_records(db, rows)
+                break
+            except Exception as e:
+                self.failed += len(rows)
+                if self._closed and attempt >= self.retries:
+                    logger.error(f"Flush of {len(rows)} detection record(s) failed {attempt} time(s) at shutdown: {e}")
+                    self._spill(rows)
+                    return False
+                self.retried += 1
+                WRITE_BEHIND_RECORDS.labels("retried").inc(len(rows))
+                logger.warning(f"Flush of {len(rows)} detection record(s) failed (attempt {attempt}), retrying: {e}")
+                await asyncio.sleep(min(WRITE_BEHIND_MAX_BACKOFF, 0.1 * 2 ** (attempt - 1)))
+
+        flush_ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.flushed += len(rows)
+        WRITE_BEHIND_RECORDS.labels("flushed").inc(len(rows))
+        self.total_flush_ms += flush_ms
+        self.last_flush_ms = flush_ms
+        self.max_flush_ms = max(self.max_flush_ms, flush_ms)
+        self.max_record_wait_ms = max(self.max_record_wait_ms, (started - min(queued for _, queued in batch)) * 1000)
+        logger.debug("Flushed %d detection record(s) in %.1f ms", len(rows), flush_ms)
+        return True
+
+    def _spill(self, rows: list):
+        if self.spill_file is None:
+            self.dropped += len(rows)
+            WRITE_BEHIND_RECORDS.labels("dropped").inc(len(rows))
+            logger.error(f"Dropping {len(rows)} detection record(s): no WRITE_BEHIND_SPILL_FILE")
+            return
+        try:
+            with open(self.spill_file, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps({**row, "timestamp": row["timestamp"].isoformat()}) + "\n")
+        except OSError as e:
+            self.dropped += len(rows)
+            WRITE_BEHIND_RECORDS.labels("dropped").inc(len(rows))
+            logger.error(f"Dropping {len(rows)} detection record(s), could not write {self.spill_file}: {e}")
+            return
+        self.spilled += len(rows)
+        WRITE_BEHIND_RECORDS.labels("spilled").inc(len(rows))
+        logger.warning(f"Spilled {len(rows)} detection record(s) to {self.spill_file}")
+
+    def _load_spill(self) -> list:
+        """
+        Reads the records spilled at the last shutdown and removes the file, so they
+        are not inserted twice. Their ids are handed out already: on databases without
+        an id sequence, new ids continue after them.
+        """
+        if self.spill_file is None or not os.path.exists(self.spill_file):
+            return []
+        try:
+            with open(self.spill_file, encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+            os.remove(self.spill_file)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not replay spilled detection records from {self.spill_file}: {e}")
+            return []
+        for row in rows:
+            row["timestamp"] = datetime.datetime.fromisoformat(row["timestamp"])
+        if rows:
+            self.ids.skip_to(max(row["id"] for row in rows))
+            logger.info(f"Replaying {len(rows)} spilled detection record(s) from {self.spill_file}")
+        return rows
+
+    async def _replay(self, rows: list):
+        """
+        Writes the spilled records before any new ones; the ones still unwritten when
+        the buffer closes are spilled again.
+        """
+        now = time.perf_counter()
+        done = 0
+        try:
+            while done < len(rows):
+                chunk = rows[done:done + self.max_batch]
+                written = await self._flush([(row, now) for row in chunk])
+                done += len(chunk)
+                if written:
+                    self.replayed += len(chunk)
+                    WRITE_BEHIND_RECORDS.labels("replayed").inc(len(chunk))
+        except asyncio.CancelledError:
+            self._spill(rows[done:])
+            raise
+
+
+write_buffer = WriteBehindBuffer() if WRITE_BEHIND_ENABLED else None
@@ -1,10 +1,20 @@
-import os
+import asyncio
+import contextlib
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from app.api.v1 import detect_router, history_router
-from app.database.db import init_db
+from app.api.v1 import detect_router, history_router, analytics_router
+from app.api.v1.detect import get_image
+from app.database.db import init_db, dispose_engines
+from app.database.writebehind import write_buffer
+from app.database.records import flush_rollups, run_rollup_flusher
+from app.database.rollups import rollup_buffer
+from app.database.retention import run_periodically, STORAGE_GC_INTERVAL
 from app.core.logger import setup_logger
+from app.core.detector import detector_client
+from app.core.render import renderer
+from app.core.derivatives import derivative_cache
+from app.core.metrics import MetricsMiddleware, metrics_endpoint, queue_gauge, CIRCUIT_STATE
+from app.core.tracing import TracingMiddleware, TRACING_ENABLED
 
 logger = setup_logger(__name__)
 
@@ -19,13 +29,24 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+if TRACING_ENABLED:
+    # Added last so it runs first: the metrics and handlers of a request see its trace
+    app.add_middleware(TracingMiddleware)
 
-# Create uploads and results directories if they don't exist
-os.makedirs("uploads", exist_ok=True)
-os.makedirs("results", exist_ok=True)
+# Prometheus scrape endpoint; queue depths and the circuit state are read at scrape time
+app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+queue_gauge("detector_in_flight", lambda: detector_client.in_flight)
+queue_gauge("render_pending", lambda: renderer.stats()["pending"])
+queue_gauge("derivative_pending", lambda: derivative_cache.stats()["pending"])
+if write_buffer is not None:
+    queue_gauge("write_behind_backlog", lambda: write_buffer.stats()["backlog"])
+for endpoint in detector_client.endpoints:
+    CIRCUIT_STATE.labels(endpoint.name).set_function(
+        lambda breaker=endpoint.breaker: ("closed", "half_open", "open").index(breaker.state))
 
-# Mount static files
-app.mount("/images", StaticFiles(directory="results"), name="images")
+# Result images are served from storage (local or object storage), with lazy rendering and sizes
+app.add_api_route("/images/{filename}", get_image, methods=["GET"], include_in_schema=False)
 
 # Initialize the database on startup
 @app.on_event("startup")
@@ -33,10 +54,55 @@ async def startup_db_client():
     logger.info("Initializing database...")
     init_db()
     logger.info("Database initialized successfully!")
+    if write_buffer is not None:
+        await write_buffer.start()
+    if rollup_buffer is not None:
+        app.state.rollup_flusher = asyncio.create_task(run_rollup_flusher())
+
+@app.on_event("startup")
+async def startup_storage_gc():
+    if STORAGE_GC_INTERVAL > 0:
+        app.state.storage_gc = asyncio.create_task(run_periodically(STORAGE_GC_INTERVAL))
+
+@app.on_event("startup")
+async def startup_detector_client():
+    await detector_client.start()
+
+@app.on_event("shutdown")
+async def shutdown_detector_client():
+    await detector_client.close()
+
+@app.on_event("shutdown")
+async def shutdown_db_client():
+    if write_buffer is not None:
+        # Pending records are written before the engines go away
+        await write_buffer.close()
+    task = getattr(app.state, "rollup_flusher", None)
+    if task is not None:
+        task.cancel()
+        # A flush in progress puts its aggregates back when cancelled; wait for that
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    # Includes the records the write-behind buffer just flushed
+    await flush_rollups()
+    await dispose_engines()
+
+@app.on_event("shutdown")
+async def shutdown_storage_gc():
+    task = getattr(app.state, "storage_gc", None)
+    if task is not None:
+        task.cancel()
+
+@app.on_event("shutdown")
+async def shutdown_renderer():
+    # Finish background renders so no result image is left half-written
+    await renderer.close()
+    await derivative_cache.close()
 
 # Include routers
 app.include_router(detect_router, prefix="/api/v1/detect", tags=["detection"])
 app.include_router(history_router, prefix="/api/v1/history", tags=["history"])
+app.include_router(analytics_router, prefix="/api/v1/analytics", tags=["analytics"])
 
 @app.get("/")
 async def root():
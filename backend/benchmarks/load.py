@@ -0,0 +1,358 @@
+"""
+Drives the backend with concurrent clients and reports latency percentiles,
+throughput and memory per endpoint, as a JSON file that can be diffed between
+releases.
+
+    python -m benchmarks.load --concurrency 1 8 32 --duration 20 --output load.json
+    python -m benchmarks.load --concurrency 32 --env WRITE_BEHIND_ENABLED=true --baseline load.json
+
+By default, both services run locally in a scratch directory:
+- a stub detector (`benchmarks.stub_detector`, --stub-latency-ms, --stub-boxes);
+- the backend with uvicorn, on a SQLite database.
+So the numbers describe the backend itself. --url points the load at a running
+backend instead, and --detect-url a spawned backend at a real detector.
+
+Each client loops over a weighted mix of operations (--mix):
+- detect: POST /api/v1/detect/ with a sample image;
+- history: the first history page;
+- count: /api/v1/history/count;
+- image: a thumbnail of a recent result.
+Every concurrency level runs for --duration seconds after --warmup seconds whose
+requests are not counted. Run from the backend directory.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import datetime
+import platform
+import tempfile
+import subprocess
+from collections import deque
+import httpx
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+DEFAULT_IMAGES = [os.path.join(BACKEND_DIR, "..", "experiment"), os.path.join(BACKEND_DIR, "..", "resource")]
+IMAGE_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
+OPERATIONS = ("detect", "history", "count", "image")
+
+
+def parse_mix(spec: str) -> dict:
+    weights = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"Unknown operation in --mix: {name} (choose from {', '.join(OPERATIONS)})")
+        weights[name.strip()] = float(weight or 1)
+    return {name: weight for name, weight in weights.items() if weight > 0}
+
+
+def load_images(directories: list) -> list:
+    images = []
+    for directory in directories:
+        for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+            content_type = IMAGE_TYPES.get(os.path.splitext(name)[1].lower())
+            if content_type:
+                with open(os.path.join(directory, name), "rb") as f:
+                    images.append((name, f.read(), content_type))
+    if not images:
+        raise SystemExit(f"No images found in {directories}")
+    return images
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid: int):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def summarize(samples_ms: list, elapsed: float) -> dict:
+    if not samples_ms:
+        return {"requests": 0}
+    samples = np.asarray(samples_ms)
+    return {
+        "requests": int(samples.size),
+        "throughput_rps": round(samples.size / elapsed, 2),
+        "mean_ms": round(float(samples.mean()), 3),
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "p99_ms": round(float(np.percentile(samples, 99)), 3),
+        "max_ms": round(float(samples.max()), 3),
+    }
+
+
+class Services:
+    """
+    Starts the stub detector and the backend as subprocesses in a scratch
+    directory, and stops them on exit.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.processes = {}
+        self.workdir = tempfile.mkdtemp(prefix="person-detection-bench-")
+
+    def _spawn(self, name: str, argv: list, env: dict):
+        log = open(os.path.join(self.workdir, f"{name}.log"), "wb")
+        self.processes[name] = subprocess.Popen(argv, cwd=self.workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    def start(self) -> str:
+        env = {**os.environ, "PYTHONPATH": BACKEND_DIR + os.pathsep + os.environ.get("PYTHONPATH", "")}
+        detect_url = self.args.detect_url
+        if detect_url is None:
+            port = free_port()
+            self._spawn("stub_detector", [sys.executable, "-m", "benchmarks.stub_detector", "--port", str(port),
+                                          "--latency-ms", str(self.args.stub_latency_ms),
+                                          "--boxes", str(self.args.stub_boxes)], env)
+            detect_url = f"http://127.0.0.1:{port}/api/v1/detect/"
+
+        port = free_port()
+        backend_env = {
+            **env,
+            "DATABASE_URL": self.args.database_url or f"sqlite:///{os.path.join(self.workdir, 'bench.db')}",
+            "DETECT_URL": detect_url,
+            "STORAGE_ROOT": self.workdir,
+            "LOG_FILE": "",
+            "LOG_LEVEL": "WARNING",
+        }
+        for item in self.args.env:
+            key, _, value = item.partition("=")
+            backend_env[key] = value
+        self._spawn("backend", [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                                "--port", str(port), "--log-level", "warning"], backend_env)
+        return f"http://127.0.0.1:{port}"
+
+    def pids(self) -> dict:
+        return {name: process.pid for name, process in self.processes.items()}
+
+    def stop(self):
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise SystemExit("The backend did not start; see the logs in the scratch directory")
+        await asyncio.sleep(0.2)
+
+
+class LoadRun:
+    """
+    One concurrency level: `concurrency` clients issuing operations back to back.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, images: list, mix: dict, recent: deque, seed: int):
+        self.client = client
+        self.images = images
+        self.operations = list(mix)
+        self.weights = list(mix.values())
+        self.recent = recent
+        self.seed = seed
+        self.samples = {name: [] for name in mix}
+        self.errors = {name: 0 for name in mix}
+        self.recording = False
+
+    async def call(self, operation: str, rng: random.Random) -> bool:
+        if operation == "detect":
+            filename, contents, content_type = self.images[rng.randrange(len(self.images))]
+            response = await self.client.post("/api/v1/detect/", files={"file": (filename, contents, content_type)})
+            if response.status_code == 200:
+                self.recent.append(response.json()["data"]["result_image_url"])
+        elif operation == "history":
+            response = await self.client.get("/api/v1/history", params={"limit": 20})
+        elif operation == "count":
+            response = await self.client.get("/api/v1/history/count")
+        else:
+            if not self.recent:
+                return True
+            response = await self.client.get(self.recent[rng.randrange(len(self.recent))], params={"size": "thumb"})
+        return response.status_code < 400
+
+    async def worker(self, index: int, deadline: float):
+        rng = random.Random(self.seed * 1000 + index)
+        while time.perf_counter() < deadline:
+            operation = rng.choices(self.operations, self.weights)[0]
+            started = time.perf_counter()
+            try:
+                ok = await self.call(operation, rng)
+            except httpx.HTTPError:
+                ok = False
+            if self.recording:
+                self.samples[operation].append((time.perf_counter() - started) * 1000)
+                self.errors[operation] += not ok
+
+    async def run(self, concurrency: int, warmup: float, duration: float, pids: dict) -> dict:
+        started = time.perf_counter()
+        deadline = started + warmup + duration
+        workers = [asyncio.create_task(self.worker(i, deadline)) for i in range(concurrency)]
+
+        await asyncio.sleep(warmup)
+        self.recording = True
+        measured_from = time.perf_counter()
+        memory = {name: [] for name in pids}
+        while time.perf_counter() < deadline:
+            for name, pid in pids.items():
+                value = rss_mb(pid)
+                if value is not None:
+                    memory[name].append(value)
+            await asyncio.sleep(0.25)
+        await asyncio.gather(*workers)
+        elapsed = time.perf_counter() - measured_from
+
+        endpoints = {}
+        for name in self.operations:
+            endpoints[name] = summarize(self.samples[name], elapsed)
+            endpoints[name]["errors"] = self.errors[name]
+        overall = summarize([sample for samples in self.samples.values() for sample in samples], elapsed)
+        overall["errors"] = sum(self.errors.values())
+        return {
+            "concurrency": concurrency,
+            "duration_s": round(elapsed, 3),
+            "overall": overall,
+            "endpoints": endpoints,
+            "memory_mb": {name: {"peak": max(values), "end": values[-1]} for name, values in memory.items() if values},
+        }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline_path: str):
+    """
+    Prints the change of every latency percentile and of throughput against an earlier report.
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {level["concurrency"]: level for level in json.load(f)["levels"]}
+    print(f"\nChange against {baseline_path}")
+    print("| concurrency | endpoint | metric | baseline | current | change |")
+    print("|---|---|---|---|---|---|")
+    for level in report["levels"]:
+        previous = baseline.get(level["concurrency"])
+        if previous is None:
+            continue
+        for endpoint, current in [("overall", level["overall"]), *level["endpoints"].items()]:
+            before = previous["overall"] if endpoint == "overall" else previous["endpoints"].get(endpoint)
+            if not before:
+                continue
+            for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+                if metric in current and before.get(metric):
+                    change = (current[metric] - before[metric]) / before[metric] * 100
+                    print(f"| {level['concurrency']} | {endpoint} | {metric} | {before[metric]} | {current[metric]} "
+                          f"| {change:+.1f}% |")
+
+
+async def run(args) -> dict:
+    images = load_images(args.images)
+    mix = parse_mix(args.mix)
+    services = None
+    url = args.url
+    if url is None:
+        services = Services(args)
+        url = services.start()
+        print(f"Services started in {services.workdir}")
+
+    levels = []
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    try:
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=args.timeout, follow_redirects=True) as client:
+            await wait_ready(client)
+            recent = deque(maxlen=256)
+            for index, concurrency in enumerate(args.concurrency):
+                result = await LoadRun(client, images, mix, recent, args.seed + index).run(
+                    concurrency, args.warmup, args.duration, services.pids() if services else {})
+                levels.append(result)
+                overall = result["overall"]
+                print(f"concurrency={concurrency}: {overall.get('throughput_rps', 0)} req/s, "
+                      f"p50={overall.get('p50_ms')} ms, p95={overall.get('p95_ms')} ms, "
+                      f"p99={overall.get('p99_ms')} ms, errors={overall['errors']}")
+            server_stats = (await client.get("/api/v1/detect/stats")).json().get("data")
+    finally:
+        if services is not None:
+            services.stop()
+
+    return {
+        "started_at": datetime.datetime.now().astimezone().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {
+            "url": args.url,
+            "detect_url": args.detect_url,
+            "stub_latency_ms": args.stub_latency_ms if args.detect_url is None else None,
+            "stub_boxes": args.stub_boxes if args.detect_url is None else None,
+            "mix": mix,
+            "images": len(images),
+            "warmup_s": args.warmup,
+            "duration_s": args.duration,
+            "env": args.env,
+        },
+        "levels": levels,
+        "server_stats": server_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="A running backend to load instead of starting one")
+    parser.add_argument("--detect-url", help="Detector for the started backend (default: a stub detector)")
+    parser.add_argument("--database-url", help="Database for the started backend (default: SQLite in the scratch directory)")
+    parser.add_argument("--env", nargs="*", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the started backend, e.g. WRITE_BEHIND_ENABLED=true")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Concurrent clients, one run per value")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds per concurrency level")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Unmeasured seconds before each level")
+    parser.add_argument("--mix", default="detect=1,history=2,count=1,image=1", help="Weighted operations")
+    parser.add_argument("--images", nargs="+", default=DEFAULT_IMAGES)
+    parser.add_argument("--stub-latency-ms", type=float, default=2.0)
+    parser.add_argument("--stub-boxes", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seeds the operation and image choice of every client")
+    parser.add_argument("--baseline", help="An earlier report to compare against")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"Report written to {args.output}")
+    if args.baseline:
+        compare(report, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+A stand-in for the detector service that answers with fixed boxes after an
+optional delay, so backend load tests measure the backend rather than the model.
+
+    python -m benchmarks.stub_detector --port 6869 --latency-ms 5 --boxes 3
+
+It speaks the detector's API (`POST /api/v1/detect`, `POST /api/v1/detect/batch`)
+and reads the whole multipart body, as the real service does. Run from the
+backend directory; `benchmarks.load` starts it automatically unless --detect-url
+is given.
+"""
+import asyncio
+import argparse
+from typing import List
+from fastapi import FastAPI, UploadFile, File, Query
+
+# Boxes fit in a 64x64 corner so they are valid for any sample image
+_BOX_SIZE = 16
+
+app = FastAPI(title="Stub Person Detector")
+app.state.latency_ms = 0.0
+app.state.boxes = 1
+
+
+def detections(count: int, class_name: str) -> list:
+    return [{
+        "x_min": 4 * i,
+        "y_min": 4 * i,
+        "x_max": 4 * i + _BOX_SIZE,
+        "y_max": 4 * i + _BOX_SIZE,
+        "confidence": 0.9,
+        "class_name": class_name,
+    } for i in range(count)]
+
+
+async def simulate_inference():
+    if app.state.latency_ms > 0:
+        await asyncio.sleep(app.state.latency_ms / 1000)
+
+
+@app.post("/api/v1/detect")
+@app.post("/api/v1/detect/", include_in_schema=False)
+async def detect(file: UploadFile = File(...), class_name: str = Query("person"), conf: float = Query(0.5)):
+    await file.read()
+    await simulate_inference()
+    return {
+        "status": "success",
+        "message": "Detection completed successfully",
+        "data": {"detections": detections(app.state.boxes, class_name)}
+    }
+
+
+@app.post("/api/v1/detect/batch")
+async def detect_batch(files: List[UploadFile] = File(...), class_name: str = Query("person"),
+                       conf: float = Query(0.5)):
+    for upload in files:
+        await upload.read()
+    await simulate_inference()
+    return {
+        "status": "success",
+        "message": "Batch detection completed successfully",
+        "data": {"results": [{
+            "index": index,
+            "filename": upload.filename,
+            "status": "success",
+            "message": None,
+            "detections": detections(app.state.boxes, class_name)
+        } for index, upload in enumerate(files)]}
+    }
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6869)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated inference time per call")
+    parser.add_argument("--boxes", type=int, default=1, help="Detections returned per image")
+    args = parser.parse_args()
+
+    app.state.latency_ms = args.latency_ms
+    app.state.boxes = args.boxes
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
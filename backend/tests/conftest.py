@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Settings are read when the app modules are imported (the engines are created then),
+# so the scratch database and storage are chosen here
+_scratch = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch, 'test.db')}"
+os.environ["STORAGE_ROOT"] = _scratch
+os.environ["DERIVATIVE_DIR"] = os.path.join(_scratch, "derivatives")
+os.environ.setdefault("LOG_FILE", "")
+
+
+@pytest.fixture
+def db():
+    """
+    A session on empty detection_records and people_count_rollups tables.
+    """
+    from app.core.models import DetectionRecord, PeopleCountRollup
+    from app.database.db import SessionLocal, init_db
+
+    init_db()
+    session = SessionLocal()
+    session.query(DetectionRecord).delete()
+    session.query(PeopleCountRollup).delete()
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client(db):
+    """
+    A TestClient on the backend app whose detector is `benchmarks.stub_detector`,
+    reached in-process through the shared detector client.
+    """
+    import httpx
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.core.detector import detector_client
+    from benchmarks import stub_detector
+
+    with TestClient(app) as test_client:
+        async def use_stub():
+            await detector_client.close()
+            detector_client._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=stub_detector.app),
+                                                         follow_redirects=True)
+        test_client.portal.call(use_stub)
+        yield test_client
@@ -0,0 +1,52 @@
+import io
+import tarfile
+import zipfile
+import pytest
+from app.core.archive import extract_images, is_archive
+
+
+def zip_bytes(members: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def tar_bytes(members: dict) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("pack", [zip_bytes, tar_bytes])
+def test_returns_images_in_order_with_content_types(pack):
+    contents = pack({"frames/b.png": b"png", "notes.txt": b"skip", "a.jpg": b"jpg"})
+
+    assert extract_images(contents) == [("b.png", b"png", "image/png"), ("a.jpg", b"jpg", "image/jpeg")]
+
+
+def test_members_are_bounded_like_single_uploads():
+    contents = zip_bytes({"big.jpg": bytes(11)})
+
+    with pytest.raises(ValueError, match="larger than 10 bytes"):
+        extract_images(contents, max_member_bytes=10)
+
+
+def test_total_size_and_file_count_are_bounded():
+    contents = zip_bytes({"a.jpg": bytes(8), "b.jpg": bytes(8)})
+
+    with pytest.raises(ValueError, match="contents are larger"):
+        extract_images(contents, max_total_bytes=12)
+    with pytest.raises(ValueError, match="more than 1 images"):
+        extract_images(contents, max_files=1)
+
+
+def test_corrupt_archive_is_rejected():
+    with pytest.raises(ValueError, match="corrupt"):
+        extract_images(b"PK\x03\x04 not really a zip")
+    assert is_archive("frames.tar.gz") and not is_archive("frame.jpg", "image/jpeg")
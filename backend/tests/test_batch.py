@@ -0,0 +1,58 @@
+import io
+import zipfile
+import cv2
+import numpy as np
+import pytest
+from app.core.ingest import MAX_UPLOAD_BYTES
+from app.core.models import DetectionRecord
+
+
+def jpeg(shade: int = 127) -> bytes:
+    return cv2.imencode(".jpg", np.full((96, 128, 3), shade, np.uint8))[1].tobytes()
+
+
+def zip_bytes(members: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def test_batch_keeps_order_and_stores_every_record(client, db):
+    files = [("files", ("first.jpg", jpeg(10), "image/jpeg")),
+             ("files", ("frames.zip", zip_bytes({"second.jpg": jpeg(20), "notes.txt": b"x", "third.png": jpeg(30)}),
+                        "application/zip"))]
+
+    response = client.post("/api/v1/detect/batch", files=files)
+
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert [item["original_filename"] for item in data] == ["first.jpg", "second.jpg", "third.png"]
+    assert all(item["status"] == "success" and item["people_count"] == 1 for item in data)
+    stored = {record.id: record.original_filename for record in db.query(DetectionRecord)}
+    assert stored == {item["id"]: item["original_filename"] for item in data}
+
+
+def test_batch_rejects_archives_over_the_limits(client, db):
+    bomb = zip_bytes({"bomb.jpg": bytes(MAX_UPLOAD_BYTES + 1)})
+
+    response = client.post("/api/v1/detect/batch", files={"files": ("bomb.zip", bomb, "application/zip")})
+
+    assert response.status_code == 400
+    assert "larger than" in response.json()["detail"]["message"]
+    assert db.query(DetectionRecord).count() == 0
+
+
+@pytest.mark.parametrize("files, status", [
+    ([("files", ("notes.txt", b"hello", "text/plain"))], 400),
+    ([("files", (f"{i}.jpg", jpeg(i), "image/jpeg")) for i in range(3)], 413),
+])
+def test_batch_rejects_invalid_requests(client, monkeypatch, files, status):
+    import app.api.v1.detect as detect
+
+    monkeypatch.setattr(detect, "BATCH_MAX_FILES", 2)
+
+    response = client.post("/api/v1/detect/batch", files=files)
+
+    assert response.status_code == status
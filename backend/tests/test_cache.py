@@ -0,0 +1,44 @@
+from app.core import cache as cache_module
+from app.core.cache import ResultCache
+
+
+def entry(name: str) -> dict:
+    return {"detections": [[10, 20, 110, 220, 0.9]], "result_path": f"{name}.jpg", "result_image_url": f"/{name}.jpg"}
+
+
+def test_evicts_least_recently_used_entry():
+    cache = ResultCache(max_entries=2, ttl=0)
+    cache.put("a", entry("a"))
+    cache.put("b", entry("b"))
+    cache.get("a")
+    cache.put("c", entry("c"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") == entry("a")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_stays_within_max_bytes():
+    size = len(cache_module.json.dumps(entry("a")))
+    cache = ResultCache(max_bytes=size * 2, ttl=0)
+    for name in "abc":
+        cache.put(name, entry(name))
+
+    assert cache.stats()["bytes"] <= size * 2
+    assert cache.get("a") is None
+
+
+def test_expired_and_invalidated_entries_miss(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    cache = ResultCache(ttl=10)
+    cache.put("a", entry("a"))
+    cache.put("b", entry("b"))
+
+    cache.invalidate("b")
+    now[0] += 11
+
+    assert cache.get("a") is None
+    assert cache.get("b") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (0, 2, 0)
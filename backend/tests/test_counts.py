@@ -0,0 +1,63 @@
+import datetime
+from app.database.counts import CountCache, normalize_filters
+
+DAY = datetime.datetime(2024, 1, 1)
+
+
+def test_record_inserted_adjusts_matching_counts():
+    cache = CountCache(ttl=0)
+    everything = normalize_filters()
+    crowded = normalize_filters(min_people=3)
+    january = normalize_filters(date_from="2024-01-01", date_to="2024-01-31")
+    for key, count in ((everything, 10), (crowded, 4), (january, 7)):
+        cache.put(key, count, cache.generation)
+
+    cache.record_inserted([(DAY, 5), (DAY + datetime.timedelta(days=40), 1), (None, 9)])
+
+    assert cache.get(everything) == 12
+    assert cache.get(crowded) == 5
+    assert cache.get(january) == 8
+    assert cache.stats()["adjustments"] == 3
+
+
+def test_record_inserted_drops_unparsed_date_filters():
+    cache = CountCache(ttl=0)
+    key = normalize_filters(date_from="2024-01-01T00:00:00+02:00")
+    cache.put(key, 3, cache.generation)
+
+    cache.record_inserted([(DAY, 1)])
+
+    assert cache.get(key) is None
+
+
+def test_count_computed_across_an_insert_is_not_cached():
+    cache = CountCache(ttl=0)
+    key = normalize_filters()
+    generation = cache.generation
+
+    cache.record_inserted([(DAY, 1)])
+    cache.put(key, 10, generation)
+
+    assert cache.get(key) is None
+
+
+def test_equivalent_filters_share_an_entry():
+    assert normalize_filters(date_from="2024-01-01") == normalize_filters(date_from="2024-01-01T00:00:00")
+
+
+def test_count_endpoint_reports_lookups(client, monkeypatch):
+    from prometheus_client import REGISTRY
+    from app.api.v1 import history
+
+    monkeypatch.setattr(history, "count_cache", CountCache(ttl=0))
+
+    def lookups(result):
+        return REGISTRY.get_sample_value("backend_count_cache_lookups_total", {"result": result}) or 0
+
+    before = {result: lookups(result) for result in ("hit", "miss")}
+    for _ in range(2):
+        response = client.get("/api/v1/history/count", params={"min_people": 2})
+        assert response.json()["data"] == {"count": 0, "estimated": False}
+
+    assert lookups("miss") - before["miss"] == 1
+    assert lookups("hit") - before["hit"] == 1
@@ -0,0 +1,102 @@
+import os
+import asyncio
+import cv2
+import numpy as np
+from app.core.derivatives import DerivativeCache, build_derivative, DERIVATIVE_SIZES
+from app.core.storage import storage
+
+
+def jpeg(width: int = 800, height: int = 400, shade: int = 127) -> bytes:
+    return cv2.imencode(".jpg", np.full((height, width, 3), shade, np.uint8))[1].tobytes()
+
+
+def test_build_derivative_scales_the_longest_side(tmp_path):
+    target = str(tmp_path / "thumb" / "a.jpg")
+
+    written = build_derivative(jpeg(800, 400), target, 256)
+
+    assert written == os.path.getsize(target)
+    assert cv2.imread(target).shape[:2] == (128, 256)
+
+
+def test_get_builds_once_then_hits(tmp_path):
+    cache = DerivativeCache(directory=str(tmp_path), workers=1)
+
+    async def scenario():
+        await storage.write("results/hit.jpg", jpeg())
+        paths = await asyncio.gather(*(cache.get("hit.jpg", "thumb", "results/hit.jpg") for _ in range(3)))
+        again = await cache.get("hit.jpg", "thumb", "results/hit.jpg")
+        await cache.close()
+        return paths, again
+
+    paths, again = asyncio.run(scenario())
+
+    assert set(paths) == {again} and max(cv2.imread(again).shape[:2]) == DERIVATIVE_SIZES["thumb"]
+    stats = cache.stats()
+    assert (stats["builds"], stats["hits"], stats["misses"]) == (1, 1, 3)
+
+
+def test_least_recently_served_copies_are_evicted(tmp_path):
+    size = len(cv2.imencode(".jpg", cv2.resize(np.full((400, 800, 3), 127, np.uint8), (256, 128),
+                                               interpolation=cv2.INTER_AREA))[1])
+    cache = DerivativeCache(directory=str(tmp_path), max_bytes=size * 2, workers=1, evict_grace=0)
+
+    async def scenario():
+        for name in ("a", "b", "c"):
+            await storage.write(f"results/{name}.jpg", jpeg())
+        await cache.get("a.jpg", "thumb", "results/a.jpg")
+        await cache.get("b.jpg", "thumb", "results/b.jpg")
+        await cache.get("a.jpg", "thumb", "results/a.jpg")
+        await cache.get("c.jpg", "thumb", "results/c.jpg")
+        await cache.close()
+
+    asyncio.run(scenario())
+
+    assert sorted(os.listdir(tmp_path / "thumb")) == ["a.jpg", "c.jpg"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_copies_in_their_grace_period_are_kept(tmp_path):
+    cache = DerivativeCache(directory=str(tmp_path), max_bytes=1, workers=1, evict_grace=60)
+
+    async def scenario():
+        for name in ("d", "e"):
+            await storage.write(f"results/{name}.jpg", jpeg())
+            await cache.get(f"{name}.jpg", "thumb", f"results/{name}.jpg")
+        await cache.close()
+
+    asyncio.run(scenario())
+
+    assert sorted(os.listdir(tmp_path / "thumb")) == ["d.jpg", "e.jpg"]
+
+
+def test_files_from_a_previous_run_join_the_cache(tmp_path):
+    build_derivative(jpeg(), str(tmp_path / "preview" / "old.jpg"), DERIVATIVE_SIZES["preview"])
+    cache = DerivativeCache(directory=str(tmp_path), workers=1)
+
+    async def scenario():
+        path = await cache.get("old.jpg", "preview", "results/never-read.jpg")
+        await cache.close()
+        return path
+
+    assert asyncio.run(scenario()) == str(tmp_path / "preview" / "old.jpg")
+    assert cache.stats()["hits"] == 1
+
+
+def test_images_answer_conditional_requests_with_304(client):
+    response = client.post("/api/v1/detect", files={"file": ("etag.jpg", jpeg(shade=60), "image/jpeg")})
+    filename = os.path.basename(response.json()["data"]["result_image_url"])
+
+    for size in ("full", "thumb"):
+        image = client.get(f"/api/v1/detect/images/{filename}", params={"size": size})
+        assert image.status_code == 200
+        etag, last_modified = image.headers["ETag"], image.headers["Last-Modified"]
+        assert image.headers["Cache-Control"].startswith("public, max-age=")
+
+        cached = client.get(f"/api/v1/detect/images/{filename}", params={"size": size},
+                            headers={"If-None-Match": f'W/{etag}, "other"'})
+        assert cached.status_code == 304 and cached.headers["ETag"] == etag and not cached.content
+        assert client.get(f"/api/v1/detect/images/{filename}", params={"size": size},
+                          headers={"If-Modified-Since": last_modified}).status_code == 304
+        assert client.get(f"/api/v1/detect/images/{filename}", params={"size": size},
+                          headers={"If-None-Match": '"stale"'}).status_code == 200
@@ -0,0 +1,102 @@
+import os
+import sys
+import httpx
+import numpy as np
+import pytest
+from app.core.detections import Detections
+from app.core.detector import decode_body, decode_detections, accept_header, MSGPACK, COLUMNAR_JSON
+from app.core.models import DetectionRecord
+from app.database.records import find_detections
+
+# The detector's encoder, to check the backend decodes exactly what the detector sends
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                "detector", "app"))
+encoding = pytest.importorskip("core.encoding")
+
+BOXES = [[10, 20, 110, 220], [5, 6, 7, 8]]
+CONFIDENCE = [0.91, 0.5]
+
+
+def over_the_wire(accept: str, content: dict) -> dict:
+    sent = encoding.encode_response(content, encoding.negotiate(accept))
+    return decode_body(httpx.Response(200, headers={"content-type": sent.media_type}, content=sent.body))
+
+
+@pytest.mark.parametrize("response_format", ["msgpack", "columnar", "json"])
+def test_decode_detections_round_trip(response_format):
+    detections = encoding.Detections(np.array(BOXES), np.array(CONFIDENCE))
+
+    body = over_the_wire(accept_header(response_format), {"data": {"detections": detections}})
+    decoded = decode_detections(body["data"]["detections"])
+
+    assert isinstance(decoded, Detections) and decoded.class_name == "person"
+    assert decoded.boxes.dtype == np.int32 and decoded.boxes.tolist() == BOXES
+    np.testing.assert_allclose(decoded.confidence, CONFIDENCE, rtol=1e-6)
+    assert decoded.to_dicts() == detections.to_dicts()
+
+
+@pytest.mark.parametrize("response_format", ["msgpack", "columnar", "json"])
+def test_decode_detections_scales_every_encoding_alike(response_format):
+    detections = encoding.Detections(np.array(BOXES), np.array(CONFIDENCE))
+
+    body = over_the_wire(accept_header(response_format), {"data": {"detections": detections}})
+    decoded = decode_detections(body["data"]["detections"], scale=2.5)
+
+    assert decoded.boxes.tolist() == [[25, 50, 275, 550], [12, 15, 18, 20]]
+    assert all(isinstance(d["x_min"], int) for d in decoded.to_dicts())
+
+
+def test_decode_detections_empty():
+    empty = encoding.Detections(np.empty((0, 4)), np.empty(0))
+
+    for response_format in ("msgpack", "columnar", "json"):
+        body = over_the_wire(accept_header(response_format), {"data": {"detections": empty}})
+        decoded = decode_detections(body["data"]["detections"], scale=2.0)
+        assert len(decoded) == 0 and decoded.to_dicts() == []
+
+
+def test_malformed_detections_are_rejected():
+    with pytest.raises(ValueError):
+        decode_detections({"boxes": [1, 2, 3], "confidence": [0.5]})
+    with pytest.raises(KeyError):
+        decode_detections([{"x_min": 1, "confidence": 0.5}])
+    assert not Detections(BOXES, [0.9]).valid
+    assert not Detections([[50, 0, 10, 10]], [0.9]).valid
+    assert Detections(BOXES, CONFIDENCE).valid
+
+
+def test_accept_header_prefers_requested_format():
+    assert accept_header("msgpack").startswith(MSGPACK)
+    assert accept_header("columnar").startswith(COLUMNAR_JSON)
+    assert accept_header("unknown") == "application/json"
+
+
+def test_records_store_columns_and_responses_carry_objects(client, db, monkeypatch):
+    import cv2
+    from benchmarks import stub_detector
+
+    monkeypatch.setattr(stub_detector.app.state, "boxes", 3)
+    image = cv2.imencode(".jpg", np.full((64, 64, 3), 77, np.uint8))[1].tobytes()
+
+    response = client.post("/api/v1/detect", files={"file": ("columns.jpg", image, "image/jpeg")})
+
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert {"x_min", "y_min", "x_max", "y_max", "confidence", "class_name"} <= set(data["detections"][0])
+    stored = db.get(DetectionRecord, data["id"]).detections
+    assert stored["count"] == len(data["detections"]) == 3
+    assert stored["boxes"][:4] == [data["detections"][0][key] for key in ("x_min", "y_min", "x_max", "y_max")]
+    history = client.get(f"/api/v1/history/{data['id']}").json()["data"]
+    assert history["detections"] == data["detections"]
+
+
+def test_records_from_before_columns_still_load(db):
+    boxes = [{"x_min": 1, "y_min": 2, "x_max": 3, "y_max": 4, "confidence": 0.75, "class_name": "person"}]
+    db.add(DetectionRecord(people_count=1, result_image_url="results/old.jpg", original_filename="old.jpg",
+                           detections=boxes))
+    db.commit()
+
+    detections = find_detections(db, "results/old.jpg")
+
+    assert detections.boxes.tolist() == [[1, 2, 3, 4]] and detections.to_dicts() == boxes
+    assert find_detections(db, "results/none.jpg") is None
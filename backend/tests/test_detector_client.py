@@ -0,0 +1,149 @@
+import asyncio
+import httpx
+import pytest
+from app.core import detector
+from app.core.detector import CircuitBreaker, CircuitOpenError, DetectorClient, DetectorEndpoint
+
+
+def test_breaker_opens_after_threshold_and_half_opens_after_timeout(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(detector.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError) as rejected:
+        breaker.before_call()
+    assert rejected.value.retry_after == 30
+
+    now[0] += 30
+    assert breaker.state == "half_open"
+    assert breaker.before_call() is True
+    # Only one trial call at a time
+    assert not breaker.allows_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    now[0] += 30
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+    assert breaker.before_call() is False
+
+
+def make_client(handler, *names) -> DetectorClient:
+    client = DetectorClient([DetectorEndpoint(f"http://{name}/api/v1/detect/") for name in names or ("detector",)])
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+async def post(client, batch: bool = False):
+    try:
+        return await client.post({"file": ("a.jpg", b"jpeg", "image/jpeg")}, {"conf": 0.5}, batch)
+    finally:
+        await client.close()
+
+
+def ok(request):
+    return httpx.Response(200, json={"status": "success", "data": {"detections": [], "host": request.url.host}})
+
+
+def test_cancelled_half_open_trial_does_not_wedge_the_circuit():
+    started = asyncio.Event()
+
+    async def hang(request):
+        started.set()
+        await asyncio.sleep(60)
+
+    async def scenario():
+        client = make_client(hang)
+        breaker = client.endpoints[0].breaker
+        breaker.opened_at = detector.time.monotonic() - breaker.reset_timeout
+        assert breaker.state == "half_open"
+
+        call = asyncio.ensure_future(post(client))
+        await started.wait()
+        assert not breaker.allows_call()
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        return breaker
+
+    breaker = asyncio.run(scenario())
+
+    assert breaker.allows_call()
+    assert breaker.state == "half_open"
+    assert breaker.failures == 0
+
+
+def test_overload_with_retry_after_does_not_open_the_circuit(monkeypatch):
+    monkeypatch.setattr(detector, "DETECT_RETRY_BACKOFF", 0)
+    calls = []
+
+    def busy(request):
+        calls.append(request)
+        return httpx.Response(503, headers={"Retry-After": "0"}, json={"status": "error"})
+
+    client = make_client(busy)
+    client.endpoints[0].breaker.failure_threshold = 1
+
+    assert asyncio.run(post(client)) is None
+    assert len(calls) == detector.DETECT_RETRIES + 1
+    assert client.endpoints[0].breaker.state == "closed"
+    assert client.endpoints[0].breaker.failures == 0
+
+
+def test_server_errors_open_the_circuit(monkeypatch):
+    monkeypatch.setattr(detector, "DETECT_RETRY_BACKOFF", 0)
+    client = make_client(lambda request: httpx.Response(500, text="boom"))
+    client.endpoints[0].breaker.failure_threshold = 1
+
+    assert asyncio.run(post(client)) is None
+    assert client.endpoints[0].breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(post(client))
+
+
+def test_retries_move_to_another_endpoint(monkeypatch):
+    monkeypatch.setattr(detector, "DETECT_RETRY_BACKOFF", 0)
+    hosts = []
+
+    def handler(request):
+        hosts.append(request.url.host)
+        if request.url.host == "down":
+            raise httpx.ConnectError("refused", request=request)
+        return ok(request)
+
+    client = make_client(handler, "down", "up")
+    # The least loaded endpoint is picked first, so make "down" the only choice at the start
+    client.endpoints[1].in_flight = 1
+
+    body = asyncio.run(post(client))
+
+    assert body["data"]["host"] == "up"
+    assert hosts == ["down", "up"]
+    assert client.endpoints[0].breaker.failures == 1
+    assert client.endpoints[1].in_flight == 1
+
+
+def test_pick_prefers_fewest_in_flight_and_skips_open_circuits():
+    client = DetectorClient([DetectorEndpoint(f"http://{name}/api/v1/detect/") for name in ("a", "b", "c")])
+    a, b, c = client.endpoints
+    a.in_flight, b.in_flight, c.in_flight = 3, 1, 2
+    assert client.pick() is b
+
+    b.breaker.failure_threshold = 1
+    b.breaker.record_failure()
+    assert client.pick() is c
+    # A retry leaves the endpoint it just tried when another one is available
+    assert client.pick(previous=c) is a
+
+    for endpoint in (a, c):
+        endpoint.breaker.failure_threshold = 1
+        endpoint.breaker.record_failure()
+    assert client.state == "open"
+    with pytest.raises(CircuitOpenError):
+        client.pick()
@@ -0,0 +1,66 @@
+import datetime
+import pytest
+from app.core.models import DetectionRecord
+from app.database.queries import (encode_cursor, decode_cursor, keyset_page, apply_history_filters,
+                                  InvalidCursorError)
+
+
+def add_records(db, count: int, start=datetime.datetime(2024, 1, 1)):
+    # Pairs of records share a timestamp, so pages have to break ties on id
+    db.add_all([DetectionRecord(timestamp=start + datetime.timedelta(minutes=i // 2), people_count=i % 5,
+                                result_image_url=f"results/{i}.jpg", original_filename=f"{i}.jpg")
+                for i in range(count)])
+    db.commit()
+
+
+def test_cursor_round_trip():
+    record = DetectionRecord(id=42, timestamp=datetime.datetime(2024, 5, 6, 7, 8, 9, 123456))
+
+    cursor = encode_cursor(record)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (record.timestamp, 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "MjAyNC0wMS0wMQ", "!!!"])
+def test_decode_cursor_rejects_malformed(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor)
+
+
+def test_keyset_page_walks_all_records_once(db):
+    add_records(db, 23)
+    expected = [record.id for record in db.query(DetectionRecord).order_by(
+        DetectionRecord.timestamp.desc(), DetectionRecord.id.desc())]
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        records, cursor = keyset_page(db.query(DetectionRecord), 5, cursor)
+        seen.extend(record.id for record in records)
+        pages += 1
+        if cursor is None:
+            break
+
+    assert seen == expected
+    assert pages == 5
+
+
+def test_keyset_page_matches_offset_and_filters(db):
+    add_records(db, 20)
+    query = apply_history_filters(db.query(DetectionRecord), min_people=2)
+
+    first, cursor = keyset_page(query, 4)
+    by_cursor, _ = keyset_page(query, 4, cursor)
+    by_offset, _ = keyset_page(query, 4, skip=4)
+
+    assert all(record.people_count >= 2 for record in first + by_cursor)
+    assert [r.id for r in by_cursor] == [r.id for r in by_offset]
+
+
+def test_keyset_page_last_page_has_no_cursor(db):
+    add_records(db, 4)
+
+    records, cursor = keyset_page(db.query(DetectionRecord), 4)
+
+    assert len(records) == 4
+    assert cursor is None
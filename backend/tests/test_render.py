@@ -0,0 +1,98 @@
+import os
+import asyncio
+import cv2
+import numpy as np
+from app.core.detections import Detections
+from app.core.render import Renderer, render_image
+from app.core.storage import storage
+
+DETECTIONS = Detections([[10, 20, 60, 80]], [0.9])
+
+
+def jpeg(shade: int) -> bytes:
+    return cv2.imencode(".jpg", np.full((96, 128, 3), shade, np.uint8))[1].tobytes()
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_render_image_draws_the_boxes():
+    img = cv2.imdecode(np.frombuffer(render_image(DETECTIONS, "png", contents=jpeg(0)), np.uint8), cv2.IMREAD_COLOR)
+
+    assert img[20, 30, 1] > 200 and img[20, 30, 2] < 50
+    assert img[50, 100].max() < 50
+
+
+def test_sync_render_is_stored_before_returning():
+    renderer = Renderer(workers=1)
+
+    async def scenario():
+        await renderer.render("results/sync.png", DETECTIONS, contents=jpeg(10))
+        stored = await storage.exists("results/sync.png")
+        await renderer.close()
+        return stored
+
+    assert run(scenario())
+    assert renderer.stats()["rendered"] == 1
+
+
+def test_background_renders_past_max_pending_are_deferred_to_first_get():
+    renderer = Renderer(workers=1, max_pending=1)
+
+    async def scenario():
+        await storage.write("uploads/deferred.jpg", jpeg(20))
+        queued = renderer.submit("results/queued.jpg", DETECTIONS, contents=jpeg(30))
+        deferred = renderer.submit("results/deferred.jpg", DETECTIONS, contents=jpeg(20))
+        await renderer.close()
+        before_get = await storage.exists("results/deferred.jpg")
+
+        async def no_record():
+            return None
+
+        # The boxes kept in memory and the stored original are enough to render it now
+        ensured = await renderer.ensure("results/deferred.jpg", no_record)
+        await renderer.close()
+        return queued, deferred, before_get, ensured
+
+    assert run(scenario()) == (True, False, False, True)
+    stats = renderer.stats()
+    assert (stats["deferred"], stats["lazy_renders"], stats["rendered"]) == (1, 1, 2)
+
+
+def test_concurrent_gets_share_one_lazy_render():
+    renderer = Renderer(workers=2)
+    loads = []
+
+    async def load_detections():
+        loads.append(1)
+        await asyncio.sleep(0.01)
+        return DETECTIONS
+
+    async def scenario():
+        await storage.write("uploads/lazy.jpg", jpeg(40))
+        results = await asyncio.gather(*(renderer.ensure("results/lazy.jpg", load_detections) for _ in range(4)))
+        missing = await renderer.ensure("results/missing.jpg", load_detections)
+        await renderer.close()
+        return results, missing
+
+    results, missing = run(scenario())
+
+    assert results == [True] * 4 and missing is False
+    assert renderer.stats()["lazy_renders"] == 1
+
+
+def test_lazy_mode_renders_on_the_first_get(client, monkeypatch):
+    from app.api.v1 import detect
+
+    monkeypatch.setattr(detect, "RENDER_MODE", "lazy")
+
+    response = client.post("/api/v1/detect", files={"file": ("lazy.jpg", jpeg(50), "image/jpeg")})
+
+    assert response.status_code == 200
+    filename = os.path.basename(response.json()["data"]["result_image_url"])
+    assert storage.local_path(f"results/{filename}") is None
+    image = client.get(f"/api/v1/detect/images/{filename}")
+    assert image.status_code == 200
+    assert image.headers["content-type"] == "image/jpeg"
+    assert storage.local_path(f"results/{filename}") is not None
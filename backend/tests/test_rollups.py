@@ -0,0 +1,119 @@
+import asyncio
+import datetime
+import contextlib
+from app.core.models import PeopleCountRollup
+from app.database import records
+from app.database.db import async_engine
+from app.database.rollups import aggregate_buckets, merge_buckets, upsert_buckets, RollupBuffer
+
+T0 = datetime.datetime(2024, 1, 1, 10, 15, 30)
+ROWS = [(T0, 2), (T0 + datetime.timedelta(seconds=20), 5), (T0 + datetime.timedelta(minutes=1), 1)]
+
+
+def run(coroutine):
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            # Pooled async connections belong to this event loop
+            if async_engine is not None:
+                await async_engine.dispose()
+    return asyncio.run(main())
+
+
+def stored(db) -> dict:
+    db.expire_all()
+    return {(row.granularity, row.bucket_start): (row.detections, row.people_sum, row.people_max)
+            for row in db.query(PeopleCountRollup)}
+
+
+def test_aggregate_buckets():
+    buckets = aggregate_buckets(ROWS)
+
+    assert buckets[("minute", datetime.datetime(2024, 1, 1, 10, 15))] == (2, 7, 5)
+    assert buckets[("minute", datetime.datetime(2024, 1, 1, 10, 16))] == (1, 1, 1)
+    assert buckets[("hour", datetime.datetime(2024, 1, 1, 10))] == (3, 8, 5)
+    assert buckets[("day", datetime.datetime(2024, 1, 1))] == (3, 8, 5)
+
+
+def test_merge_buckets_adds_counts_and_keeps_the_max():
+    merged = merge_buckets(aggregate_buckets(ROWS[:1]), aggregate_buckets(ROWS[1:]))
+
+    assert merged == aggregate_buckets(ROWS)
+
+
+def test_upserts_add_to_existing_buckets(db):
+    upsert_buckets(db, aggregate_buckets(ROWS[:1]))
+    upsert_buckets(db, aggregate_buckets(ROWS[1:]))
+    db.commit()
+
+    assert stored(db) == aggregate_buckets(ROWS)
+
+
+def test_buffer_take_and_restore():
+    buffer = RollupBuffer()
+    buffer.add(ROWS[:2])
+
+    taken = buffer.take()
+    buffer.add(ROWS[2:])
+    buffer.restore(taken)
+
+    assert buffer.take() == aggregate_buckets(ROWS)
+    assert buffer.records == 3
+
+
+def test_flush_writes_pending_aggregates(db, monkeypatch):
+    buffer = RollupBuffer()
+    monkeypatch.setattr(records, "rollup_buffer", buffer)
+    buffer.add(ROWS)
+
+    run(records.flush_rollups())
+
+    assert stored(db) == aggregate_buckets(ROWS)
+    assert buffer.stats()["pending_buckets"] == 0
+    assert buffer.flushes == 1
+
+
+def test_failed_flush_keeps_aggregates_for_the_next_one(db, monkeypatch):
+    buffer = RollupBuffer()
+    monkeypatch.setattr(records, "rollup_buffer", buffer)
+    buffer.add(ROWS)
+
+    def fail(db, buckets):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(records, "upsert_buckets", fail)
+    run(records.flush_rollups())
+
+    assert buffer.failed == 1
+    assert buffer.take() == aggregate_buckets(ROWS)
+    assert stored(db) == {}
+
+
+def test_cancelled_flush_puts_aggregates_back(monkeypatch):
+    buffer = RollupBuffer()
+    monkeypatch.setattr(records, "rollup_buffer", buffer)
+    buffer.add(ROWS)
+    started = None
+
+    @contextlib.asynccontextmanager
+    async def stuck_session():
+        started.set()
+        await asyncio.Event().wait()
+        yield
+
+    monkeypatch.setattr(records, "write_session", stuck_session)
+
+    async def scenario():
+        nonlocal started
+        started = asyncio.Event()
+        task = asyncio.create_task(records.flush_rollups())
+        await started.wait()
+        # What the shutdown hook does before its final flush
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+
+    assert buffer.take() == aggregate_buckets(ROWS)
@@ -0,0 +1,121 @@
+import os
+import asyncio
+import pytest
+from app.core.storage import LocalStorage, S3Storage, S3_PART_SIZE
+
+
+async def chunked(data: bytes, size: int, fail_after: int = None):
+    for index, start in enumerate(range(0, len(data), size)):
+        if fail_after is not None and index == fail_after:
+            raise ConnectionError("client went away")
+        yield data[start:start + size]
+
+
+async def collect(iterator) -> list:
+    return [item async for item in iterator]
+
+
+def test_local_storage_round_trip(tmp_path):
+    store = LocalStorage(str(tmp_path), shard_depth=2)
+    data = os.urandom(10_000)
+
+    async def scenario():
+        await store.write("results/abcdef.jpg", data)
+        await store.write("uploads/abcdef.png", chunked(data, 3000))
+        chunks = await collect(store.stream("results/abcdef.jpg", chunk_size=4096))
+        stat = await store.stat("results/abcdef.jpg")
+        listed = sorted(stored.key for stored in await collect(store.list("uploads/abc")))
+        found = await store.find("uploads/abcdef.")
+        await store.delete("results/abcdef.jpg")
+        return chunks, stat, listed, found, await store.exists("results/abcdef.jpg"), await store.read("uploads/abcdef.png")
+
+    chunks, stat, listed, found, exists, uploaded = asyncio.run(scenario())
+
+    assert store.local_path("uploads/abcdef.png") == str(tmp_path / "uploads" / "ab" / "cd" / "abcdef.png")
+    assert [len(chunk) for chunk in chunks] == [4096, 4096, 1808] and b"".join(chunks) == data
+    assert (stat.key, stat.size, stat.etag) == ("results/abcdef.jpg", 10_000, None)
+    assert listed == ["uploads/abcdef.png"] and found == "uploads/abcdef.png"
+    assert exists is False and uploaded == data
+
+
+def test_local_storage_finds_unsharded_files(tmp_path):
+    store = LocalStorage(str(tmp_path), shard_depth=2)
+    os.makedirs(tmp_path / "results")
+    (tmp_path / "results" / "legacy.jpg").write_bytes(b"old")
+
+    async def scenario():
+        return await store.read("results/legacy.jpg"), await store.find("results/leg"), await store.stat("results/nope.jpg")
+
+    assert asyncio.run(scenario()) == (b"old", "results/legacy.jpg", None)
+
+
+def test_local_storage_failed_write_leaves_nothing(tmp_path):
+    store = LocalStorage(str(tmp_path), shard_depth=1)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(store.write("uploads/broken.jpg", chunked(b"x" * 100, 10, fail_after=3)))
+
+    assert [names for _, _, names in os.walk(tmp_path) if names] == []
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(store.read("uploads/broken.jpg"))
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    moto = pytest.importorskip("moto")
+    for name, value in (("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing"),
+                        ("AWS_DEFAULT_REGION", "us-east-1")):
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        yield S3Storage(bucket="test-bucket", prefix="app/", endpoint_url=None, region="us-east-1")
+
+
+def test_s3_storage_round_trip(s3):
+    data = os.urandom(3000)
+
+    async def scenario():
+        await s3.write("results/a.jpg", data)
+        await s3.write("results/b.jpg", chunked(data, 1000))
+        chunks = await collect(s3.stream("results/a.jpg", chunk_size=1024))
+        stat = await s3.stat("results/a.jpg")
+        listed = sorted(stored.key for stored in await collect(s3.list("results/")))
+        await s3.delete("results/a.jpg")
+        return chunks, stat, listed, await s3.stat("results/a.jpg"), await s3.read("results/b.jpg")
+
+    chunks, stat, listed, deleted, streamed_write = asyncio.run(scenario())
+
+    assert [len(chunk) for chunk in chunks] == [1024, 1024, 952] and b"".join(chunks) == data
+    assert stat.size == 3000 and stat.etag
+    assert listed == ["results/a.jpg", "results/b.jpg"]
+    assert deleted is None and streamed_write == data
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(s3.read("results/a.jpg"))
+
+
+def test_s3_streamed_writes_use_multipart_uploads(s3):
+    data = os.urandom(S3_PART_SIZE * 2 + 1234)
+
+    async def scenario():
+        await s3.write("uploads/big.mp4", chunked(data, 1024 * 1024))
+        client = await s3._s3()
+        head = await asyncio.to_thread(client.head_object, Bucket="test-bucket", Key="app/uploads/big.mp4")
+        return head["ETag"], await s3.read("uploads/big.mp4")
+
+    etag, stored = asyncio.run(scenario())
+
+    # Multipart ETags end with the number of parts
+    assert etag.strip('"').endswith("-3")
+    assert stored == data
+
+
+def test_s3_failed_streamed_write_aborts_the_upload(s3):
+    data = os.urandom(S3_PART_SIZE * 2)
+
+    async def scenario():
+        with pytest.raises(ConnectionError):
+            await s3.write("uploads/broken.mp4", chunked(data, 1024 * 1024, fail_after=7))
+        client = await s3._s3()
+        uploads = await asyncio.to_thread(client.list_multipart_uploads, Bucket="test-bucket")
+        return uploads.get("Uploads", []), await s3.exists("uploads/broken.mp4")
+
+    assert asyncio.run(scenario()) == ([], False)
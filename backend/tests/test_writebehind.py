@@ -0,0 +1,114 @@
+import asyncio
+import datetime
+import pytest
+from app.core.models import DetectionRecord
+from app.database import writebehind
+from app.database.db import async_engine
+from app.database.writebehind import WriteBehindBuffer
+
+
+def make_rows(count: int, prefix: str = "img") -> list:
+    return [{"timestamp": datetime.datetime(2024, 1, 1) + datetime.timedelta(seconds=i), "people_count": i,
+             "result_image_url": f"results/{prefix}{i}.jpg", "original_filename": f"{prefix}{i}.jpg",
+             "detections": []} for i in range(count)]
+
+
+def run(coroutine):
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            # Pooled async connections belong to this event loop
+            if async_engine is not None:
+                await async_engine.dispose()
+    return asyncio.run(main())
+
+
+def stored(db) -> dict:
+    db.expire_all()
+    return {record.id: record.original_filename for record in db.query(DetectionRecord)}
+
+
+def test_close_flushes_every_submitted_record(db, tmp_path):
+    buffer = WriteBehindBuffer(max_batch=3, flush_ms=50, spill_file=str(tmp_path / "spill.jsonl"))
+
+    async def scenario():
+        ids = []
+        rows = make_rows(7)
+        for start in range(0, 7, 2):
+            ids += await buffer.submit(rows[start:start + 2])
+        await buffer.close()
+        return ids
+
+    ids = run(scenario())
+
+    assert ids == sorted(ids) and len(set(ids)) == 7
+    assert stored(db) == {record_id: f"img{i}.jpg" for i, record_id in enumerate(ids)}
+    stats = buffer.stats()
+    assert stats["flushed"] == 7 and stats["backlog"] == 0 and stats["dropped"] == 0
+    assert stats["flushes"] >= 3
+
+
+def test_flushes_keep_submission_order_and_close_waits(db, tmp_path, monkeypatch):
+    flushed = []
+    real_persist = writebehind.persist_records
+
+    async def slow_persist(session, rows):
+        await asyncio.sleep(0.05)
+        result = await real_persist(session, rows)
+        flushed.append([row["id"] for row in rows])
+        return result
+
+    monkeypatch.setattr(writebehind, "persist_records", slow_persist)
+    buffer = WriteBehindBuffer(max_batch=2, flush_ms=10, spill_file=str(tmp_path / "spill.jsonl"))
+
+    async def scenario():
+        ids = await buffer.submit(make_rows(5))
+        await buffer.close()
+        with pytest.raises(RuntimeError):
+            await buffer.submit(make_rows(1))
+        return ids
+
+    ids = run(scenario())
+
+    assert [record_id for batch in flushed for record_id in batch] == ids
+    assert all(len(batch) <= 2 for batch in flushed)
+    assert sorted(stored(db)) == ids
+
+
+def test_failed_flush_at_shutdown_is_spilled_and_replayed(db, tmp_path, monkeypatch):
+    spill_file = tmp_path / "spill.jsonl"
+    real_persist = writebehind.persist_records
+
+    async def failing_persist(session, rows):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(writebehind, "persist_records", failing_persist)
+    buffer = WriteBehindBuffer(max_batch=10, flush_ms=10, retries=1, spill_file=str(spill_file))
+
+    async def fail():
+        ids = await buffer.submit(make_rows(3))
+        await buffer.close()
+        return ids
+
+    ids = run(fail())
+
+    assert buffer.stats()["spilled"] == 3 and buffer.stats()["dropped"] == 0
+    assert spill_file.exists()
+    assert stored(db) == {}
+
+    monkeypatch.setattr(writebehind, "persist_records", real_persist)
+    restarted = WriteBehindBuffer(max_batch=10, flush_ms=10, spill_file=str(spill_file))
+
+    async def replay():
+        # New records get ids after the spilled ones and are written after them
+        new_ids = await restarted.submit(make_rows(1, prefix="new"))
+        await restarted.close()
+        return new_ids
+
+    new_ids = run(replay())
+
+    assert not spill_file.exists()
+    assert restarted.stats()["replayed"] == 3
+    assert new_ids[0] > max(ids)
+    assert stored(db) == {**{record_id: f"img{i}.jpg" for i, record_id in enumerate(ids)}, new_ids[0]: "new0.jpg"}
@@ -1,33 +1,103 @@
+import os
+import json
+import shutil
+import asyncio
+import tempfile
+from typing import List, Optional
+from urllib.parse import urlsplit
 import cv2
 import numpy as np
-from fastapi import Request, APIRouter, UploadFile, File, Query
-from fastapi.responses import JSONResponse
-from fastapi.exceptions import RequestValidationError
-from ultralytics import YOLO
-from core.logger import setup_logger
+from fastapi import Request, APIRouter, UploadFile, File, Query, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from fastapi.concurrency import run_in_threadpool
+from core.logger import setup_logger, setup_request_logger, logging_stats
 from core.models import ResponseFormat
-from core.detector import predict_and_detect
-import torch
+from core.encoding import Detections, negotiate, encode_response
+from core.engine import resolve_model_path
+from core.archive import is_archive, extract_images
+from core.preprocess import preprocess
+from core.tiling import split_image, TILE_SIZE, TILE_OVERLAP, TILE_SKIP_EMPTY
+from core.video import VideoPipeline, FrameSampler, VIDEO_FRAME_STRIDE, VIDEO_MOTION_THRESHOLD
+from core.runtime import DetectorRuntime, NotReadyError
+from core.executor import QueueFullError
+from core.cache import ResultCache, make_cache_key_async, CACHE_ENABLED
+from core.metrics import timed, timed_call, observe_since_start, CACHE_LOOKUPS
 
 logger = setup_logger(__name__)
+request_logger = setup_request_logger(__name__)
 router = APIRouter()
 
-# Load model (ensure correct path) with explicit CPU device
-try:
-    model = YOLO("yolo12s.onnx") 
-    logger.info("YOLO model loaded successfully")
-except Exception as e:
-    logger.error(f"Error loading YOLO model: {e}")
-    raise RuntimeError("Failed to load YOLO model")
+BATCH_REQUEST_MAX_FILES = int(os.getenv("BATCH_REQUEST_MAX_FILES", 256))
+VIDEO_SOURCE_DIR = os.getenv("VIDEO_SOURCE_DIR") or None
+STREAM_SCHEMES = ("rtsp://", "rtsps://", "http://", "https://")
+# Network streams a client may ask for, comma-separated: `name=url` entries are requested by name,
+# `host` or `host:port` entries allow any stream URL on that host. Empty allows no network streams.
+VIDEO_STREAM_ALLOWLIST = os.getenv("VIDEO_STREAM_ALLOWLIST", "")
+# Concurrent video requests; each one also holds an inference slot while it streams
+VIDEO_MAX_STREAMS = int(os.getenv("VIDEO_MAX_STREAMS", 4))
+MODEL_PATH = resolve_model_path(os.getenv("MODEL_PATH", "yolo12s.onnx"))
+MODEL_VERSION = os.getenv("MODEL_VERSION", os.path.basename(MODEL_PATH))
+
+# The model is loaded by the app's lifespan hook, not on import; the engine and its device are chosen once there.
+# Blocking inference runs on a bounded worker pool; concurrent requests are grouped into batched model calls
+runtime = DetectorRuntime(MODEL_PATH)
+pool = runtime.pool
+batcher = runtime.batcher
+
+# Results for byte-identical images are served from cache instead of re-running the model
+cache = ResultCache() if CACHE_ENABLED else None
+
+def require_warm_model():
+    """
+    Raises `NotReadyError` (answered with 503 + Retry-After) until the model is warmed up,
+    see `DetectorRuntime.accepting`.
+    """
+    if not runtime.accepting:
+        raise NotReadyError(pool.retry_after)
+
+def inference_slot():
+    """
+    Admits the request into the inference pool for its whole lifetime.
+    Raises `QueueFullError` (answered with 503 + Retry-After) when the pool is saturated
+    or the model is still warming up.
+    """
+    require_warm_model()
+    pool.admit()
+    try:
+        yield
+    finally:
+        pool.release()
+
+async def cache_lookup(contents: bytes, class_name: str, conf: float, model_version: str = MODEL_VERSION):
+    """
+    Hashes large uploads and reads the disk tier off the event loop.
+    Returns:
+        tuple: (cache key, cached detections or None)
+    """
+    with timed("cache_lookup"):
+        cache_key = await make_cache_key_async(contents, class_name, conf, model_version)
+        cached = await cache.get_async(cache_key) if cache is not None else None
+    if cache is not None:
+        CACHE_LOOKUPS.labels("hit" if cached is not None else "miss").inc()
+    return cache_key, cached
 
 @router.post("")
 async def detect_objects(
+    request: Request,
     file: UploadFile = File(...),
     class_name: str = Query("person", min_length=1, max_length=50),
-    conf: float = Query(0.5, ge=0.0, le=1.0)
+    conf: float = Query(0.5, ge=0.0, le=1.0),
+    tile: bool = Query(False, description="Sliced inference on overlapping full-resolution tiles"),
+    tile_size: int = Query(TILE_SIZE, ge=160, le=4096),
+    tile_overlap: float = Query(TILE_OVERLAP, ge=0.0, le=0.5),
+    skip_empty_tiles: bool = Query(TILE_SKIP_EMPTY),
+    _slot: None = Depends(inference_slot)
 ):
+    observe_since_start(request)
     try:
-        logger.info(f"Received file: {file.filename} | Class: {class_name} | Confidence: {conf}")
+        request_logger.info("Received file: %s | Class: %s | Confidence: %s | Tiled: %s", file.filename, class_name,
+                            conf, f"{tile_size} px, {tile_overlap} overlap" if tile else "no")
 
         # Read image as numpy array
         contents = await file.read()
@@ -44,7 +114,28 @@ async def detect_objects(
                 status_code=400
             )
 
-        img = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
+        # Boxes are encoded as the client asked: JSON objects, columnar JSON or msgpack buffers
+        media_type = negotiate(request.headers.get("accept"))
+        model_version = f"{MODEL_VERSION}|tiles:{tile_size}:{tile_overlap}:{skip_empty_tiles}" if tile else MODEL_VERSION
+        cache_key, cached = await cache_lookup(contents, class_name, conf, model_version)
+        if cached is not None:
+            request_logger.info("Cache hit for %s", file.filename)
+            return encode_response(
+                ResponseFormat(
+                    status="success",
+                    message="Detection completed successfully",
+                    data={"detections": Detections.from_payload(cached, class_name), "cached": True}
+                ).dict(),
+                media_type
+            )
+
+        # Reduced-resolution decode + letterbox to the model input size, or full-resolution tiles
+        if tile:
+            tiled = await run_in_threadpool(timed_call, "preprocess", split_image, contents, tile_size, tile_overlap,
+                                            skip_empty_tiles)
+            img, transform = tiled, None
+        else:
+            img, transform = await run_in_threadpool(timed_call, "preprocess", preprocess, contents)
 
         if img is None:
             logger.error(f"Failed to decode image: {file.filename}")
@@ -57,11 +148,16 @@ async def detect_objects(
                 status_code=400
             )
 
-        # Perform detection
-        results = await predict_and_detect(model, img, class_name, conf)
+        # Perform detection; the tiles of an image are queued together so they share batches
+        if tile:
+            results = await batcher.submit_many(tiled.images, class_name, conf)
+            with timed("postprocess"):
+                results = [tiled.merge(results)]
+        else:
+            results = await batcher.submit(img, class_name, conf)
 
         if not results:
-            logger.warning(f"No detections found for {class_name} in {file.filename}")
+            request_logger.info("No detections found for %s in %s", class_name, file.filename)
             return JSONResponse(
                 content=ResponseFormat(
                     status="success",
@@ -71,25 +167,23 @@ async def detect_objects(
             )
 
         # Extract bounding box details
-        detections = []
-        for result in results:
-            for box in result.boxes:
-                detections.append({
-                    "x_min": int(box.xyxy[0][0]),
-                    "y_min": int(box.xyxy[0][1]),
-                    "x_max": int(box.xyxy[0][2]),
-                    "y_max": int(box.xyxy[0][3]),
-                    "confidence": float(box.conf[0]),
-                    "class_name": class_name
-                })
-
-        logger.info(f"Detection completed successfully for {file.filename}")
-        return JSONResponse(
-            content=ResponseFormat(
+        with timed("postprocess"):
+            detections = Detections.from_results(results, class_name, transform)
+        if cache is not None:
+            await cache.put_async(cache_key, detections.to_columns())
+
+        data = {"detections": detections}  # Ensure `data` is a dictionary
+        if tile:
+            data["tiles"] = tiled.stats()
+
+        request_logger.info("Detection completed successfully for %s", file.filename)
+        return encode_response(
+            ResponseFormat(
                 status="success",
                 message="Detection completed successfully",
-                data={"detections": detections}  # Ensure `data` is a dictionary
-            ).dict()  # Convert to dictionary
+                data=data
+            ).dict(),  # Convert to dictionary
+            media_type
         )
 
     except cv2.error as cv_error:
@@ -124,3 +218,295 @@ async def detect_objects(
             ).dict(),  # Convert to dictionary
             status_code=500
         )
+
+
+
+async def _detect_one(index: int, filename: str, contents: bytes, class_name: str, conf: float):
+    """
+    Decodes one image of a batch request and waits for its detections.
+    Failures are reported per image so one bad file does not fail the whole batch.
+    """
+    cache_key, cached = await cache_lookup(contents, class_name, conf)
+    if cached is not None:
+        return {"index": index, "filename": filename, "status": "success", "message": None,
+                "detections": Detections.from_payload(cached, class_name)}
+
+    img, transform = await run_in_threadpool(timed_call, "preprocess", preprocess, contents)
+    if img is None:
+        logger.error(f"Failed to decode image in batch: {filename}")
+        return {"index": index, "filename": filename, "status": "error",
+                "message": "Could not decode image file", "detections": Detections([], [], class_name)}
+
+    results = await batcher.submit(img, class_name, conf)
+    with timed("postprocess"):
+        detections = Detections.from_results(results, class_name, transform)
+    if cache is not None:
+        await cache.put_async(cache_key, detections.to_columns())
+    return {"index": index, "filename": filename, "status": "success", "message": None,
+            "detections": detections}
+
+
+@router.post("/batch")
+async def detect_objects_batch(
+    request: Request,
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    class_name: str = Query("person", min_length=1, max_length=50),
+    conf: float = Query(0.5, ge=0.0, le=1.0),
+    _slot: None = Depends(inference_slot)
+):
+    """
+    Runs detection on many images in one request. Images may be sent as repeated
+    `files` parts and/or as a single zip/tar `archive`. Results keep the input order.
+    The request holds one inference slot per image (at most INFERENCE_QUEUE_SIZE), so
+    a large batch counts against the queue like that many single requests.
+    """
+    observe_since_start(request)
+    extra_slots = 0
+    try:
+        images = []
+        for upload in files or []:
+            contents = await upload.read()
+            if is_archive(upload.filename, upload.content_type):
+                images.extend(extract_images(contents, BATCH_REQUEST_MAX_FILES))
+            else:
+                images.append((upload.filename, contents))
+        if archive is not None:
+            images.extend(extract_images(await archive.read(), BATCH_REQUEST_MAX_FILES))
+
+        if not images:
+            return JSONResponse(
+                content=ResponseFormat(
+                    status="error",
+                    message="No images were uploaded",
+                    data=None
+                ).dict(),
+                status_code=400
+            )
+        if len(images) > BATCH_REQUEST_MAX_FILES:
+            return JSONResponse(
+                content=ResponseFormat(
+                    status="error",
+                    message=f"A batch request may contain at most {BATCH_REQUEST_MAX_FILES} images",
+                    data=None
+                ).dict(),
+                status_code=413
+            )
+
+        # `inference_slot` already admitted the first image
+        extra_slots = pool.admit(min(len(images), pool.max_pending) - 1)
+        request_logger.info("Received batch of %d image(s) | Class: %s | Confidence: %s", len(images), class_name, conf)
+
+        # The scheduler groups these submissions into model-sized batches; gather keeps input order
+        results = await asyncio.gather(*[
+            _detect_one(index, filename, contents, class_name, conf)
+            for index, (filename, contents) in enumerate(images)
+        ])
+
+        request_logger.info("Batch detection completed for %d image(s)", len(results))
+        return encode_response(
+            ResponseFormat(
+                status="success",
+                message="Batch detection completed successfully",
+                data={"results": results}
+            ).dict(),
+            negotiate(request.headers.get("accept"))
+        )
+
+    except QueueFullError:
+        raise
+
+    except ValueError as ve:
+        logger.error(f"Value error while processing batch: {ve}")
+        return JSONResponse(
+            content=ResponseFormat(
+                status="error",
+                message=f"Invalid input or processing error: {ve}",
+                data=None
+            ).dict(),
+            status_code=400
+        )
+
+    except Exception as e:
+        logger.exception(f"Unexpected error processing batch: {e}")
+        return JSONResponse(
+            content=ResponseFormat(
+                status="error",
+                message="An unexpected error occurred during batch detection",
+                data=None
+            ).dict(),
+            status_code=500
+        )
+
+    finally:
+        pool.release(extra_slots)
+
+
+
+def _parse_stream_allowlist(value: str):
+    """
+    Returns:
+        tuple: ({name: url} of the named streams, set of allowed hosts)
+    """
+    named, hosts = {}, set()
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, separator, url = entry.partition("=")
+        if separator:
+            named[name.strip()] = url.strip()
+        else:
+            hosts.add(entry.lower())
+    return named, hosts
+
+
+_NAMED_STREAMS, _STREAM_HOSTS = _parse_stream_allowlist(VIDEO_STREAM_ALLOWLIST)
+# Video requests currently streaming
+_video_streams = asyncio.Semaphore(max(1, VIDEO_MAX_STREAMS))
+
+
+def _resolve_video_source(source: str) -> str:
+    """
+    Accepts streams named in VIDEO_STREAM_ALLOWLIST, stream URLs on a host it lists, and
+    local files only when they live under VIDEO_SOURCE_DIR. Anything else is rejected,
+    so clients cannot make the detector connect to arbitrary (e.g. internal) addresses.
+    """
+    if source in _NAMED_STREAMS:
+        return _NAMED_STREAMS[source]
+    if source.lower().startswith(STREAM_SCHEMES):
+        parts = urlsplit(source)
+        host = (parts.hostname or "").lower()
+        if host and (host in _STREAM_HOSTS or f"{host}:{parts.port}" in _STREAM_HOSTS):
+            return source
+        raise ValueError(f"Stream host is not allowed: {host or source}")
+    if VIDEO_SOURCE_DIR:
+        root = os.path.realpath(VIDEO_SOURCE_DIR)
+        path = os.path.realpath(os.path.join(root, source))
+        if path.startswith(root + os.sep) and os.path.isfile(path):
+            return path
+    raise ValueError(f"Video source is not allowed or does not exist: {source}")
+
+
+@router.post("/video")
+async def detect_video(
+    file: Optional[UploadFile] = File(None),
+    source: Optional[str] = Query(None, min_length=1, max_length=2048),
+    class_name: str = Query("person", min_length=1, max_length=50),
+    conf: float = Query(0.5, ge=0.0, le=1.0),
+    sample: str = Query("stride", pattern="^(stride|motion)$"),
+    stride: int = Query(VIDEO_FRAME_STRIDE, ge=1, le=10000),
+    motion_threshold: float = Query(VIDEO_MOTION_THRESHOLD, ge=0.0, le=1.0),
+    max_frames: Optional[int] = Query(None, ge=1),
+    include_boxes: bool = Query(False),
+    format: str = Query("ndjson", pattern="^(ndjson|sse)$")
+):
+    """
+    Streams per-frame people counts for an uploaded video file or a stream `source`
+    (a name or host from VIDEO_STREAM_ALLOWLIST, or a file under VIDEO_SOURCE_DIR). Frames
+    are sampled every `stride` frames, optionally only when there is motion, and results
+    are emitted as NDJSON lines or server-sent events, ending with a summary event.
+    At most VIDEO_MAX_STREAMS videos are processed at once, and each holds an inference
+    slot until its stream ends; both limits are answered with 503 + Retry-After.
+    """
+    if (file is None) == (source is None):
+        return JSONResponse(
+            content=ResponseFormat(
+                status="error",
+                message="Provide either a video file or a source, not both",
+                data=None
+            ).dict(),
+            status_code=400
+        )
+
+    if _video_streams.locked():
+        logger.warning(f"Video stream limit reached ({VIDEO_MAX_STREAMS}), rejecting request")
+        raise QueueFullError(pool.retry_after)
+    require_warm_model()
+    pool.admit()
+    await _video_streams.acquire()
+    released = False
+    tmp_path = None
+
+    def release():
+        # Runs when the stream ends and again as the response's background task, which
+        # also covers clients that disconnect before the stream starts
+        nonlocal released
+        if released:
+            return
+        released = True
+        _video_streams.release()
+        pool.release()
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    try:
+        if file is not None:
+            # cv2.VideoCapture needs a path; the upload is spooled to a private temp file
+            # that lives as long as the streaming response
+            suffix = os.path.splitext(file.filename or "")[1] or ".mp4"
+            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+                tmp_path = tmp.name
+                await run_in_threadpool(shutil.copyfileobj, file.file, tmp)
+            video_source = tmp_path
+        else:
+            video_source = _resolve_video_source(source)
+
+        sampler = FrameSampler(sample, stride, motion_threshold)
+    except ValueError as ve:
+        release()
+        logger.error(f"Invalid video request: {ve}")
+        return JSONResponse(
+            content=ResponseFormat(
+                status="error",
+                message=str(ve),
+                data=None
+            ).dict(),
+            status_code=400
+        )
+    except BaseException:
+        release()
+        raise
+
+    pipeline = VideoPipeline(video_source, batcher, sampler, class_name, conf, max_frames, include_boxes)
+    logger.info(f"Starting video detection: {file.filename if file is not None else source} | sample={sample} stride={stride}")
+
+    async def _stream():
+        try:
+            async for event in pipeline.run():
+                if format == "sse":
+                    yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+                else:
+                    yield json.dumps(event) + "\n"
+        finally:
+            release()
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(_stream(), media_type=media_type, headers={"Cache-Control": "no-cache"},
+                             background=BackgroundTask(release))
+
+@router.get("/stats")
+async def get_stats():
+    return JSONResponse(
+        content=ResponseFormat(
+            status="success",
+            message="Detector statistics retrieved successfully",
+            data={
+                "batching": batcher.stats(),
+                "inference_pool": pool.stats(),
+                "cache": cache.stats() if cache is not None else None,
+                "logging": logging_stats(),
+                "startup": runtime.stats()
+            }
+        ).dict()
+    )
+
+@router.get("/engine")
+async def get_engine():
+    return JSONResponse(
+        content=ResponseFormat(
+            status="success",
+            message="Inference engine retrieved successfully",
+            data=runtime.engine.info()
+        ).dict()
+    )
@@ -1,8 +1,56 @@
-from .detector import predict_and_detect
-from .logger import setup_logger
+from .detector import predict_and_detect, predict_batch, format_detections
+from .engine import InferenceEngine, OnnxRuntimeEngine, UltralyticsEngine, load_engine, resolve_model_path
+from .postprocess import nms, decode_predictions
+from .tiling import TiledImage, split_image, tile_grid
+from .encoding import Detections, negotiate, encode_response
+from .cache import ResultCache, make_cache_key
+from .preprocess import preprocess, letterbox, restore_boxes, decode_image
+from .video import VideoPipeline, FrameSampler
+from .archive import is_archive, extract_images
+from .batcher import BatchScheduler
+from .executor import InferencePool, QueueFullError
+from .runtime import DetectorRuntime, NotReadyError
+from .metrics import MetricsMiddleware, timed
+from .tracing import TracingMiddleware
+from .logger import setup_logger, setup_request_logger
 from .models import ResponseFormat
 
 __all__ = [
     "predict_and_detect",
-    "setup_logger"
+    "predict_batch",
+    "format_detections",
+    "InferenceEngine",
+    "OnnxRuntimeEngine",
+    "UltralyticsEngine",
+    "load_engine",
+    "resolve_model_path",
+    "nms",
+    "decode_predictions",
+    "TiledImage",
+    "split_image",
+    "tile_grid",
+    "Detections",
+    "negotiate",
+    "encode_response",
+    "ResultCache",
+    "make_cache_key",
+    "preprocess",
+    "letterbox",
+    "restore_boxes",
+    "decode_image",
+    "VideoPipeline",
+    "FrameSampler",
+    "is_archive",
+    "extract_images",
+    "BatchScheduler",
+    "InferencePool",
+    "QueueFullError",
+    "DetectorRuntime",
+    "NotReadyError",
+    "MetricsMiddleware",
+    "timed",
+    "TracingMiddleware",
+    "setup_logger",
+    "setup_request_logger",
+    "ResponseFormat"
     ]
\ No newline at end of file
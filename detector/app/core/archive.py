@@ -0,0 +1,83 @@
+import io
+import os
+import tarfile
+import zipfile
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff"}
+# Decompressed size limits, so a small archive cannot expand into gigabytes in memory
+ARCHIVE_MAX_MEMBER_BYTES = int(os.getenv("ARCHIVE_MAX_MEMBER_BYTES", 20 * 1024 * 1024))
+ARCHIVE_MAX_TOTAL_BYTES = int(os.getenv("ARCHIVE_MAX_TOTAL_BYTES", 256 * 1024 * 1024))
+
+
+def is_archive(filename: str, content_type: str = None) -> bool:
+    """
+    Returns True when the upload looks like a zip or tar archive rather than a single image.
+    """
+    name = (filename or "").lower()
+    if name.endswith((".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")):
+        return True
+    return content_type in ("application/zip", "application/x-zip-compressed", "application/x-tar",
+                            "application/gzip", "application/x-gzip")
+
+
+def extract_images(contents: bytes, max_files: int = None, max_member_bytes: int = ARCHIVE_MAX_MEMBER_BYTES,
+                   max_total_bytes: int = ARCHIVE_MAX_TOTAL_BYTES):
+    """
+    Extracts image members from a zip or tar archive held in memory. Sizes are checked
+    against the headers before a member is read, and every read is bounded, since the
+    headers can lie.
+    Args:
+        contents (bytes): The raw archive bytes.
+        max_files (int, optional): Stop with a ValueError once more than this many images are found.
+        max_member_bytes (int): Largest decompressed image allowed.
+        max_total_bytes (int): Largest decompressed total of all images allowed.
+    Returns:
+        list: (filename, bytes) tuples in archive order. Non-image members are skipped without being read.
+    Raises:
+        ValueError: If the archive is corrupt or exceeds one of the limits.
+    """
+    images = []
+    total = 0
+    buffer = io.BytesIO(contents)
+
+    def _wanted(name, size):
+        if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+            return False
+        if max_files is not None and len(images) >= max_files:
+            raise ValueError(f"Archive contains more than {max_files} images")
+        _check(name, size)
+        return True
+
+    def _check(name, size):
+        if size > max_member_bytes:
+            raise ValueError(f"Archive member {os.path.basename(name)} is larger than {max_member_bytes} bytes")
+        if total + size > max_total_bytes:
+            raise ValueError(f"Archive contents are larger than {max_total_bytes} bytes")
+
+    def _add(name, stream):
+        nonlocal total
+        data = stream.read(max_member_bytes + 1)
+        _check(name, len(data))
+        total += len(data)
+        images.append((os.path.basename(name), data))
+
+    if zipfile.is_zipfile(buffer):
+        try:
+            with zipfile.ZipFile(buffer) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir() and _wanted(info.filename, info.file_size):
+                        with archive.open(info) as stream:
+                            _add(info.filename, stream)
+        except (zipfile.BadZipFile, NotImplementedError) as e:
+            raise ValueError(f"Unsupported or corrupt archive: {e}")
+        return images
+
+    buffer.seek(0)
+    try:
+        with tarfile.open(fileobj=buffer, mode="r:*") as archive:
+            for member in archive:
+                if member.isfile() and _wanted(member.name, member.size):
+                    _add(member.name, archive.extractfile(member))
+    except tarfile.TarError as e:
+        raise ValueError(f"Unsupported or corrupt archive: {e}")
+    return images
@@ -0,0 +1,218 @@
+import asyncio
+import os
+import time
+from .detector import predict_batch
+from .executor import InferencePool
+from .metrics import observe, BATCH_SIZE
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 8))
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", 5))
+
+
+class BatchMetrics:
+    """
+    Running counters describing how requests were grouped into batches.
+    """
+
+    def __init__(self):
+        self.batches = 0
+        self.requests = 0
+        self.size_histogram = {}
+        self.last_batch_size = 0
+        self.total_inference_ms = 0.0
+        self.max_inference_ms = 0.0
+        self.last_inference_ms = 0.0
+        self.total_queue_wait_ms = 0.0
+        self.max_queue_wait_ms = 0.0
+
+    def record(self, batch_size: int, inference_ms: float, queue_waits_ms: list):
+        self.batches += 1
+        self.requests += batch_size
+        self.size_histogram[batch_size] = self.size_histogram.get(batch_size, 0) + 1
+        self.last_batch_size = batch_size
+        self.total_inference_ms += inference_ms
+        self.last_inference_ms = inference_ms
+        self.max_inference_ms = max(self.max_inference_ms, inference_ms)
+        self.total_queue_wait_ms += sum(queue_waits_ms)
+        self.max_queue_wait_ms = max([self.max_queue_wait_ms] + queue_waits_ms)
+
+    def snapshot(self) -> dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": round(self.requests / self.batches, 3) if self.batches else 0.0,
+            "last_batch_size": self.last_batch_size,
+            "batch_size_histogram": {str(size): count for size, count in sorted(self.size_histogram.items())},
+            "avg_inference_ms": round(self.total_inference_ms / self.batches, 3) if self.batches else 0.0,
+            "last_inference_ms": round(self.last_inference_ms, 3),
+            "max_inference_ms": round(self.max_inference_ms, 3),
+            "avg_queue_wait_ms": round(self.total_queue_wait_ms / self.requests, 3) if self.requests else 0.0,
+            "max_queue_wait_ms": round(self.max_queue_wait_ms, 3),
+        }
+
+
+class BatchScheduler:
+    """
+    Collects detection requests that arrive within a short window and runs them
+    through the model as a single batched `predict` call. Each caller awaits its
+    own future and receives only the results for the image it submitted.
+    Batches run on the inference pool, with at most one batch per pool worker in flight.
+    Args:
+        model (InferenceEngine): The inference engine used for detection.
+        pool (InferencePool, optional): Where the blocking model calls run. A private pool is created if omitted.
+        max_batch_size (int): Upper bound on the number of images per batch.
+        window_ms (float): How long to wait for more requests after the first one arrives.
+    """
+
+    def __init__(self, model, pool: InferencePool = None, max_batch_size: int = BATCH_MAX_SIZE,
+                 window_ms: float = BATCH_WINDOW_MS):
+        self.model = model
+        self.pool = pool if pool is not None else InferencePool()
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.window = max(0.0, float(window_ms)) / 1000.0
+        self.metrics = BatchMetrics()
+        self._queue = None
+        self._worker = None
+        self._slots = None
+        self._inflight = set()
+
+    async def start(self):
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.pool.workers)
+        self._worker = asyncio.create_task(self._run())
+        logger.info(f"Batch scheduler started (max_batch_size={self.max_batch_size}, window_ms={self.window * 1000:.1f})")
+
+    async def stop(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+        # Fail anything still waiting so callers don't hang on shutdown
+        while not self._queue.empty():
+            _, _, _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Batch scheduler stopped"))
+        logger.info("Batch scheduler stopped")
+
+    async def submit(self, img, class_name: str = "person", conf: float = 0.5):
+        """
+        Queues an image for detection and waits for its batch to finish.
+        Returns:
+            list: The detection array for this image, in the same shape as `predict_and_detect`.
+        """
+        if self._worker is None:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((img, class_name, conf, future, time.perf_counter()))
+        return [await future]
+
+    async def submit_many(self, imgs: list, class_name: str = "person", conf: float = 0.5) -> list:
+        """
+        Queues several images at once, e.g. the tiles of one image, so they fill the
+        same batches, and waits for all of them.
+        Returns:
+            list: One detection array per image, in the same order as `imgs`.
+        """
+        if self._worker is None:
+            await self.start()
+        loop = asyncio.get_running_loop()
+        queued = time.perf_counter()
+        futures = []
+        for img in imgs:
+            future = loop.create_future()
+            self._queue.put_nowait((img, class_name, conf, future, queued))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    def stats(self) -> dict:
+        data = self.metrics.snapshot()
+        data.update({
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.window * 1000,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "inflight_batches": len(self._inflight),
+        })
+        return data
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            # Only pull the next batch once a worker is free, so requests keep
+            # accumulating in the queue (and batches grow) while the pool is busy
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._run_batch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _run_batch(self, batch: list):
+        try:
+            await self._dispatch(batch)
+        except Exception as e:
+            logger.exception(f"Unexpected error while dispatching batch: {e}")
+            for _, _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+
+    async def _dispatch(self, batch: list):
+        # `classes` and `conf` are per-call arguments, so requests are grouped by them
+        groups = {}
+        for item in batch:
+            groups.setdefault((item[1], item[2]), []).append(item)
+
+        for (class_name, conf), items in groups.items():
+            started = time.perf_counter()
+            queue_waits_ms = [(started - item[4]) * 1000 for item in items]
+            try:
+                results = await self.pool.run(predict_batch, self.model, [item[0] for item in items], class_name, conf)
+            except Exception as e:
+                for item in items:
+                    if not item[3].done():
+                        item[3].set_exception(e)
+                continue
+
+            inference_ms = (time.perf_counter() - started) * 1000
+            self.metrics.record(len(items), inference_ms, queue_waits_ms)
+            observe("inference", inference_ms / 1000)
+            BATCH_SIZE.observe(len(items))
+            for wait_ms in queue_waits_ms:
+                observe("queue_wait", wait_ms / 1000)
+            logger.debug("Batch of %d processed in %.1f ms", len(items), inference_ms)
+
+            for item, result in zip(items, results):
+                if not item[3].done():
+                    item[3].set_result(result)
@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from fastapi.concurrency import run_in_threadpool
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 1024))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_TTL = float(os.getenv("CACHE_TTL", 3600))
+CACHE_DIR = os.getenv("CACHE_DIR") or None
+# Size cap of the on-disk tier; a sweep removes expired entries, then the oldest ones
+CACHE_DIR_MAX_BYTES = int(os.getenv("CACHE_DIR_MAX_BYTES", 1024 * 1024 * 1024))
+# Uploads at least this large are hashed on a worker thread instead of the event loop
+CACHE_THREADED_HASH_BYTES = int(os.getenv("CACHE_THREADED_HASH_BYTES", 256 * 1024))
+
+
+def make_cache_key(contents: bytes, class_name: str, conf: float, model_version: str) -> str:
+    """
+    Builds a content-addressed key: identical image bytes with the same
+    detection parameters and model always map to the same entry.
+    """
+    digest = hashlib.sha256(contents).hexdigest()
+    params = hashlib.sha256(f"{class_name}|{float(conf):.6f}|{model_version}".encode("utf-8")).hexdigest()[:16]
+    return f"{digest}-{params}"
+
+
+async def make_cache_key_async(contents: bytes, class_name: str, conf: float, model_version: str) -> str:
+    """
+    `make_cache_key` for the event loop: large uploads (a 20 MB image takes tens of
+    milliseconds to hash) are hashed on a worker thread.
+    """
+    if len(contents) < CACHE_THREADED_HASH_BYTES:
+        return make_cache_key(contents, class_name, conf, model_version)
+    return await run_in_threadpool(make_cache_key, contents, class_name, conf, model_version)
+
+
+class ResultCache:
+    """
+    Two-tier cache for detection results. The in-memory tier is an LRU bounded by
+    entry count and total size with a per-entry TTL; the optional on-disk tier
+    keeps JSON files under `directory`, survives restarts and is bounded by
+    `disk_max_bytes`. On the event loop, use the `*_async` methods: they only touch
+    the in-memory tier on the loop and do disk reads and writes on a worker thread.
+    Args:
+        max_entries (int): Maximum number of entries kept in memory.
+        max_bytes (int): Maximum total (serialized) size of the in-memory entries.
+        ttl (float): Seconds an entry stays valid, in either tier. 0 disables expiry.
+        directory (str, optional): Root directory of the on-disk tier. Disabled when None.
+        disk_max_bytes (int): Maximum total size of the on-disk tier.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES,
+                 ttl: float = CACHE_TTL, directory: str = CACHE_DIR, disk_max_bytes: int = CACHE_DIR_MAX_BYTES):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self.ttl = ttl
+        self.directory = directory
+        self.disk_max_bytes = max(1, disk_max_bytes)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # Unknown until the first sweep, which the first disk write runs
+        self._disk_bytes = None
+        self._disk_lock = threading.Lock()
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl > 0 and time.time() - stored_at > self.ttl
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str):
+        value = self._get_memory(key)
+        if value is None and self.directory:
+            value = self._disk_hit(key, self._read_disk(key))
+        if value is None:
+            self.misses += 1
+        return value
+
+    async def get_async(self, key: str):
+        value = self._get_memory(key)
+        if value is None and self.directory:
+            value = self._disk_hit(key, await run_in_threadpool(self._read_disk, key))
+        if value is None:
+            self.misses += 1
+        return value
+
+    def put(self, key: str, value):
+        serialized = self._put_memory(key, value)
+        if self.directory:
+            self._write_disk(key, serialized)
+
+    async def put_async(self, key: str, value):
+        serialized = self._put_memory(key, value)
+        if self.directory:
+            await run_in_threadpool(self._write_disk, key, serialized)
+
+    def _get_memory(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, size, stored_at = entry
+        if self._expired(stored_at):
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.memory_hits += 1
+        return value
+
+    def _disk_hit(self, key: str, value):
+        if value is not None:
+            self.hits += 1
+            self.disk_hits += 1
+            self._store(key, value, json.dumps(value), time.time())
+        return value
+
+    def _put_memory(self, key: str, value) -> str:
+        serialized = json.dumps(value, default=str)
+        self._store(key, value, serialized, time.time())
+        return serialized
+
+    def _store(self, key: str, value, serialized: str, stored_at: float):
+        size = len(serialized)
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (value, size, stored_at)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _read_disk(self, key: str):
+        path = self._disk_path(key)
+        try:
+            if self._expired(os.path.getmtime(path)):
+                os.remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        except OSError as e:
+            logger.warning(f"Failed to read cache entry {key}: {e}")
+            return None
+
+    def _write_disk(self, key: str, serialized: str):
+        path = self._disk_path(key)
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Concurrent writes of the same key each get their own temporary file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(serialized)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {key}: {e}")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._disk_lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(serialized)
+            sweep = self._disk_bytes is None or self._disk_bytes > self.disk_max_bytes
+        if sweep:
+            self.sweep_disk()
+
+    def sweep_disk(self):
+        """
+        Removes expired entries from the on-disk tier, then the oldest ones until it
+        is back under 90% of `disk_max_bytes`, so a full tier is not swept on every
+        write. Blocking; runs on the worker thread of the write that found the tier
+        full. Concurrent sweeps are skipped.
+        """
+        if not self.directory or not self._disk_lock.acquire(blocking=False):
+            return
+        try:
+            files = []
+            for folder in os.scandir(self.directory):
+                if not folder.is_dir():
+                    continue
+                for entry in os.scandir(folder.path):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    # Temporary files are only left behind by a crash mid-write
+                    if entry.name.endswith(".tmp"):
+                        if time.time() - stat.st_mtime > 3600:
+                            self._unlink(entry.path)
+                    elif self._expired(stat.st_mtime):
+                        self._unlink(entry.path)
+                    else:
+                        files.append((stat.st_mtime, entry.path, stat.st_size))
+            total = sum(size for _, _, size in files)
+            if total > self.disk_max_bytes:
+                files.sort()
+                target = self.disk_max_bytes * 0.9
+                for _, path, size in files:
+                    if total <= target:
+                        break
+                    self._unlink(path)
+                    total -= size
+                    self.disk_evictions += 1
+            self._disk_bytes = total
+        except OSError as e:
+            logger.warning(f"Failed to sweep the cache directory {self.directory}: {e}")
+        finally:
+            self._disk_lock.release()
+
+    @staticmethod
+    def _unlink(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "evictions": self.evictions,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "disk_tier": self.directory,
+            "disk_bytes": self._disk_bytes,
+            "disk_max_bytes": self.disk_max_bytes,
+            "disk_evictions": self.disk_evictions,
+        }
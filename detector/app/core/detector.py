@@ -1,34 +1,34 @@
-import logging
-import torch
+import asyncio
+from .encoding import Detections
+from .logger import setup_logger
 
-async def predict_and_detect(chosen_model, img, class_name='person', conf=0.5, rectangle_thickness=2, text_thickness=1):
+logger = setup_logger(__name__)
+
+async def predict_and_detect(chosen_model, img, class_name='person', conf=0.5, rectangle_thickness=2, text_thickness=1, executor=None):
     """
     Asynchronously performs object detection on the given image using the specified model.
+    The blocking `predict` call runs on `executor` (or the loop's default executor) so the event loop is not blocked.
     Args:
-        chosen_model: The pre-trained model to use for object detection. 
-                      It should have a `predict` method and a `names` attribute mapping class indices to class names.
+        chosen_model (InferenceEngine): The inference engine to use for object detection (see `core.engine`).
         img: The input image to perform detection on. It can be in a format supported by the model.
         class_name (str, optional): The name of the class to detect. Defaults to 'person'.
         conf (float, optional): The confidence threshold for predictions. Defaults to 0.5.
         rectangle_thickness (int, optional): The thickness of the rectangle drawn around detected objects. Defaults to 2.
         text_thickness (int, optional): The thickness of the text displayed on detected objects. Defaults to 1.
+        executor (concurrent.futures.Executor, optional): Where to run the prediction. Defaults to None.
     Returns:
-        results: The detection results from the model, which may include bounding boxes, confidence scores, 
-                 and other information depending on the model's implementation.
+        list: A single (N, 6) array of x_min, y_min, x_max, y_max, confidence and class index.
     """
-    logger = logging.getLogger(__name__)
-    
     # Get the class index for 'person'
-    class_index = list(chosen_model.names.values()).index(class_name)
+    class_index = chosen_model.class_index(class_name)
     
-    # Ensure the model is explicitly set to GPU mode if available
     try:
-        # Check if GPU is available and set the device accordingly
-        device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        
-        # Perform prediction with the appropriate device
-        results = chosen_model.predict(img, classes=[class_index], conf=conf, device=device)
-        logger.info(f"Detection completed using {device.upper()}")
+        # The engine picked its device once at startup
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(
+            executor, lambda: chosen_model.predict([img], class_index, conf)
+        )
+        logger.debug("Detection completed using %s", chosen_model.device.upper())
         
     except Exception as e:
         logger.error(f"Error during prediction: {str(e)}")
@@ -36,3 +36,39 @@ async def predict_and_detect(chosen_model, img, class_name='person', conf=0.5, r
         raise RuntimeError(f"Model inference failed: {str(e)}")
     
     return results
+
+def predict_batch(chosen_model, imgs, class_name='person', conf=0.5):
+    """
+    Performs object detection on a list of images with a single `predict` call.
+    Args:
+        chosen_model (InferenceEngine): The inference engine to use for object detection (see `core.engine`).
+        imgs (list): The input images, one entry per request in the batch.
+        class_name (str, optional): The name of the class to detect. Defaults to 'person'.
+        conf (float, optional): The confidence threshold for predictions. Defaults to 0.5.
+    Returns:
+        list: One (N, 6) detection array per input image, in the same order as `imgs`.
+    """
+    class_index = chosen_model.class_index(class_name)
+
+    try:
+        results = chosen_model.predict(imgs, class_index, conf)
+        logger.debug("Batch detection of %d image(s) completed using %s", len(imgs), chosen_model.device.upper())
+
+    except Exception as e:
+        logger.error(f"Error during batch prediction: {str(e)}")
+        raise RuntimeError(f"Model inference failed: {str(e)}")
+
+    return results
+
+def format_detections(results, class_name='person', transform=None):
+    """
+    Converts model results for one image into the API's list of bounding-box dictionaries.
+    Args:
+        results: The results returned for a single image by `predict_and_detect` or the batch scheduler.
+        class_name (str, optional): The class name to report on each detection. Defaults to 'person'.
+        transform (dict, optional): The preprocessing transform from `preprocess`; boxes are mapped
+                                    back to original image coordinates when given. Defaults to None.
+    Returns:
+        list: One dictionary per detected box.
+    """
+    return Detections.from_results(results, class_name, transform).to_dicts()
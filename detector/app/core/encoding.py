@@ -0,0 +1,155 @@
+import importlib.util
+import numpy as np
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from .preprocess import restore_boxes
+
+# Detection encodings a client can ask for with its Accept header
+JSON = "application/json"
+# Same envelope, but each image's detections as flat columns instead of one object per box
+COLUMNAR_JSON = "application/vnd.person-detection.columnar+json"
+# Columnar msgpack with boxes and confidences as raw little-endian int32 / float32 buffers
+MSGPACK = "application/msgpack"
+
+_MEDIA_TYPES = {
+    "*/*": JSON,
+    "application/*": JSON,
+    JSON: JSON,
+    COLUMNAR_JSON: COLUMNAR_JSON,
+    MSGPACK: MSGPACK,
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+}
+_HAS_MSGPACK = importlib.util.find_spec("msgpack") is not None
+
+
+class Detections:
+    """
+    The detections of one image as arrays: `boxes` (N, 4) int32 x_min, y_min, x_max,
+    y_max in original image coordinates and `confidence` (N,) float32, all of class
+    `class_name`. Responses are built from the arrays in the encoding the client
+    negotiated, so boxes only become Python objects when plain JSON is asked for.
+    """
+
+    __slots__ = ("boxes", "confidence", "class_name")
+
+    def __init__(self, boxes, confidence, class_name: str = "person"):
+        self.boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+        self.confidence = np.asarray(confidence, dtype=np.float32).reshape(-1)
+        self.class_name = class_name
+
+    def __len__(self) -> int:
+        return len(self.confidence)
+
+    @classmethod
+    def from_results(cls, results, class_name: str = "person", transform=None):
+        """
+        Builds the detections from the model results for one image, as returned by
+        `predict_and_detect` or the batch scheduler, mapped back to the original image.
+        """
+        arrays = [result for result in results if len(result)]
+        if not arrays:
+            return cls(np.empty((0, 4)), np.empty(0), class_name)
+        data = arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+        boxes = data[:, :4]
+        if transform is not None:
+            boxes = restore_boxes(boxes, transform)
+        return cls(boxes.astype(np.int32), data[:, 4], class_name)
+
+    @classmethod
+    def from_payload(cls, payload, class_name: str = "person"):
+        """
+        Reads back any of the encodings below, e.g. an entry of the result cache.
+        Raises:
+            KeyError, TypeError, ValueError: If the payload is not an encoding of detections.
+        """
+        if isinstance(payload, list):
+            boxes = [(d["x_min"], d["y_min"], d["x_max"], d["y_max"]) for d in payload]
+            confidence = [d["confidence"] for d in payload]
+            return cls(boxes, confidence, payload[0]["class_name"] if payload else class_name)
+        if isinstance(payload["boxes"], (bytes, bytearray)):
+            return cls(np.frombuffer(payload["boxes"], dtype="<i4"), np.frombuffer(payload["confidence"], dtype="<f4"),
+                       payload.get("class_name", class_name))
+        return cls(payload["boxes"], payload["confidence"], payload.get("class_name", class_name))
+
+    def to_dicts(self) -> list:
+        return [{
+            "x_min": x_min,
+            "y_min": y_min,
+            "x_max": x_max,
+            "y_max": y_max,
+            "confidence": confidence,
+            "class_name": self.class_name
+        } for (x_min, y_min, x_max, y_max), confidence in zip(self.boxes.tolist(), self.confidence.tolist())]
+
+    def to_columns(self) -> dict:
+        return {
+            "class_name": self.class_name,
+            "count": len(self),
+            "boxes": self.boxes.ravel().tolist(),
+            "confidence": self.confidence.tolist(),
+        }
+
+    def to_buffers(self) -> dict:
+        return {
+            "class_name": self.class_name,
+            "count": len(self),
+            "boxes": self.boxes.astype("<i4", copy=False).tobytes(),
+            "confidence": self.confidence.astype("<f4", copy=False).tobytes(),
+        }
+
+    def encode(self, media_type: str = JSON):
+        if media_type == MSGPACK:
+            return self.to_buffers()
+        if media_type == COLUMNAR_JSON:
+            return self.to_columns()
+        return self.to_dicts()
+
+
+def negotiate(accept: str) -> str:
+    """
+    Picks the encoding for an Accept header: the supported media type with the
+    highest q-value, earliest first on ties. Plain JSON when nothing supported is
+    listed, and instead of msgpack when msgpack is not installed.
+    """
+    best, best_q = JSON, -1.0
+    for item in (accept or "").split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        encoding = _MEDIA_TYPES.get(media_type.lower())
+        if encoding is None or (encoding == MSGPACK and not _HAS_MSGPACK):
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q and q > 0:
+            best, best_q = encoding, q
+    return best
+
+
+def _encode(value, media_type: str):
+    if isinstance(value, Detections):
+        return value.encode(media_type)
+    if isinstance(value, dict):
+        return {key: _encode(item, media_type) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_encode(item, media_type) for item in value]
+    return value
+
+
+def encode_response(content: dict, media_type: str = JSON, status_code: int = 200) -> Response:
+    """
+    Serializes a response body whose `Detections` are encoded as `media_type`.
+    """
+    content = _encode(content, media_type)
+    headers = {"Vary": "Accept"}
+    if media_type == MSGPACK:
+        import msgpack
+
+        return Response(msgpack.packb(content, use_bin_type=True), status_code=status_code, headers=headers,
+                        media_type=MSGPACK)
+    return JSONResponse(content=content, status_code=status_code, headers=headers, media_type=media_type)
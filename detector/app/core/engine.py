@@ -0,0 +1,376 @@
+import os
+import ast
+import time
+import numpy as np
+from .preprocess import letterbox, MODEL_INPUT_SIZE
+from .postprocess import decode_predictions
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# "auto" uses ONNX Runtime directly for .onnx models and ultralytics for anything else
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "auto").lower()
+ENGINE_WARMUP_RUNS = int(os.getenv("ENGINE_WARMUP_RUNS", 1))
+# Batch sizes ("1,8") and image shapes ("1280x720,1920x1080", width x height) the warmup runs; empty
+# batch sizes mean single images and full batches, empty shapes one image of the model input size
+ENGINE_WARMUP_BATCH_SIZES = os.getenv("ENGINE_WARMUP_BATCH_SIZES", "")
+ENGINE_WARMUP_SHAPES = os.getenv("ENGINE_WARMUP_SHAPES", "")
+# 0 lets ONNX Runtime pick (one intra-op thread per physical core)
+ORT_INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", 0))
+ORT_INTER_OP_THREADS = int(os.getenv("ORT_INTER_OP_THREADS", 0))
+ORT_GRAPH_OPT_LEVEL = os.getenv("ORT_GRAPH_OPT_LEVEL", "all").lower()
+ORT_EXECUTION_MODE = os.getenv("ORT_EXECUTION_MODE", "sequential").lower()
+# Comma-separated provider names; empty prefers CUDA when available, then CPU
+ORT_PROVIDERS = os.getenv("ORT_PROVIDERS", "")
+# Quantized/converted variant of MODEL_PATH to load, e.g. "int8" loads yolo12s.int8.onnx
+MODEL_VARIANT = os.getenv("MODEL_VARIANT", "fp32").lower()
+# Serving processes sharing this host (see gunicorn.conf.py); thread counts left at 0 are split across them
+DETECTOR_WORKERS = max(1, int(os.getenv("DETECTOR_WORKERS", 1)))
+# Read at import, i.e. in the gunicorn master, before workers are pinned to their own CPUs
+_AVAILABLE_CPUS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+
+
+def worker_threads(configured: int = 0) -> int:
+    """
+    Intra-op threads for one serving process: `configured` when set, otherwise the
+    available CPUs divided by DETECTOR_WORKERS, so workers do not oversubscribe the
+    cores. With a single worker 0 is kept and the library picks.
+    """
+    if configured > 0 or DETECTOR_WORKERS == 1:
+        return max(0, configured)
+    return max(1, _AVAILABLE_CPUS // DETECTOR_WORKERS)
+
+
+def resolve_model_path(model_path: str, variant: str = MODEL_VARIANT) -> str:
+    """
+    Maps the base model path and a variant name ("fp32", "fp16", "int8", "int8-static", ...)
+    to the file written by `tools/quantize.py` next to the base model.
+    Raises:
+        FileNotFoundError: If the requested variant has not been generated.
+    """
+    if not variant or variant == "fp32":
+        return model_path
+    root, ext = os.path.splitext(model_path)
+    path = f"{root}.{variant}{ext}"
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Model variant '{variant}' not found: {path}")
+    return path
+
+
+def parse_batch_sizes(spec: str) -> list:
+    return sorted({max(1, int(size)) for size in spec.split(",") if size.strip()})
+
+
+def parse_shapes(spec: str) -> list:
+    """
+    Parses "1280x720,1920x1080" into [(1280, 720), (1920, 1080)].
+    Raises:
+        ValueError: If a shape is not WIDTHxHEIGHT.
+    """
+    shapes = []
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        width, sep, height = item.strip().lower().partition("x")
+        if not sep:
+            raise ValueError(f"Invalid warmup shape '{item}', expected WIDTHxHEIGHT")
+        shapes.append((int(width), int(height)))
+    return shapes
+
+
+class InferenceEngine:
+    """
+    Common interface of the inference backends. `predict` takes a list of BGR images
+    and returns, per image, an (N, 6) float32 array of x_min, y_min, x_max, y_max,
+    confidence and class index in that image's pixel coordinates.
+    The device is chosen once when the engine is created.
+    """
+
+    name = "base"
+    # Images per model call when the model has a fixed batch dimension; None when any size works
+    max_batch = None
+
+    def __init__(self, model_path: str):
+        self.model_path = model_path
+        self.names = {}
+        self.device = "cpu"
+        self.input_size = MODEL_INPUT_SIZE
+        # Startup costs: importing the inference library, opening the model, dummy inferences
+        self.import_ms = None
+        self.load_ms = None
+        self.warmup_ms = None
+
+    def class_index(self, class_name: str) -> int:
+        """
+        Raises:
+            ValueError: If the model does not know `class_name`.
+        """
+        return list(self.names.values()).index(class_name)
+
+    def load(self):
+        """
+        Prepares the model for inference in the calling process. Engines are created
+        in the gunicorn master and forked into the workers, so each worker calls this
+        once at startup; state that does not survive a fork is rebuilt here.
+        """
+
+    def release(self):
+        """
+        Frees what `load` would rebuild anyway; called in the gunicorn master before it forks.
+        """
+
+    def predict(self, imgs: list, class_index: int, conf: float) -> list:
+        raise NotImplementedError
+
+    def warmup(self, runs: int = ENGINE_WARMUP_RUNS, batch_sizes: list = None, shapes: list = None):
+        """
+        Runs dummy inferences so lazy allocations and kernel selection happen before
+        the first real request. Each run covers every batch size and image shape
+        (width, height); shapes other than the model input also warm up letterboxing.
+        Batch sizes are capped at a fixed batch dimension, which larger batches are split into.
+        """
+        if runs <= 0:
+            return
+        batch_sizes = batch_sizes or [1]
+        if self.max_batch is not None:
+            batch_sizes = sorted({min(size, self.max_batch) for size in batch_sizes})
+        shapes = shapes or [(self.input_size, self.input_size)]
+        dummies = [np.full((height, width, 3), 114, dtype=np.uint8) for width, height in shapes]
+        started = time.perf_counter()
+        for _ in range(runs):
+            for dummy in dummies:
+                for size in batch_sizes:
+                    self.predict([dummy] * size, 0, 0.5)
+        self.warmup_ms = round((time.perf_counter() - started) * 1000, 3)
+        logger.info(f"{self.name} engine warmed up with {runs} run(s) of batch sizes {batch_sizes} "
+                    f"and shapes {shapes} in {self.warmup_ms} ms")
+
+    def info(self) -> dict:
+        return {
+            "engine": self.name,
+            "model_path": self.model_path,
+            "model_variant": MODEL_VARIANT,
+            "device": self.device,
+            "input_size": self.input_size,
+            "classes": len(self.names),
+            "import_ms": self.import_ms,
+            "load_ms": self.load_ms,
+            "warmup_ms": self.warmup_ms,
+            "pid": os.getpid(),
+        }
+
+
+class UltralyticsEngine(InferenceEngine):
+    """
+    Runs the model through ultralytics `YOLO`. Slower than the native engine, but
+    loads any format ultralytics supports (.pt, .onnx, ...), so it is the fallback.
+    PyTorch weights are loaded before the fork and stay shared (copy-on-write) by the workers.
+    """
+
+    name = "ultralytics"
+
+    def __init__(self, model_path: str):
+        super().__init__(model_path)
+        started = time.perf_counter()
+        import torch
+        from ultralytics import YOLO
+        self.import_ms = round((time.perf_counter() - started) * 1000, 3)
+
+        started = time.perf_counter()
+        self.model = YOLO(model_path)
+        self.load_ms = round((time.perf_counter() - started) * 1000, 3)
+        self.names = dict(self.model.names)
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.threads = 0
+
+    def load(self):
+        import torch
+
+        self.threads = worker_threads()
+        if self.threads:
+            torch.set_num_threads(self.threads)
+
+    def predict(self, imgs: list, class_index: int, conf: float) -> list:
+        results = self.model.predict(imgs, classes=[class_index], conf=conf, device=self.device,
+                                     imgsz=self.input_size, verbose=False)
+        return [result.boxes.data.cpu().numpy().astype(np.float32).reshape(-1, 6) for result in results]
+
+    def info(self) -> dict:
+        data = super().info()
+        data["threads"] = self.threads
+        return data
+
+
+_GRAPH_OPT_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+_EXECUTION_MODES = {
+    "sequential": "ORT_SEQUENTIAL",
+    "parallel": "ORT_PARALLEL",
+}
+
+
+class OnnxRuntimeEngine(InferenceEngine):
+    """
+    Runs an exported YOLO detection model directly on an ONNX Runtime session, with
+    letterboxing, decoding and NMS done in NumPy.
+    Args:
+        model_path (str): Path to the .onnx file.
+        intra_op_threads (int): Threads used inside one operator (0 = ONNX Runtime default).
+        inter_op_threads (int): Threads used across operators in parallel mode (0 = default).
+        graph_opt_level (str): "disable", "basic", "extended" or "all".
+        execution_mode (str): "sequential" or "parallel".
+        providers (str): Comma-separated execution providers; empty picks CUDA when available.
+    """
+
+    name = "onnxruntime"
+
+    def __init__(self, model_path: str, intra_op_threads: int = ORT_INTRA_OP_THREADS,
+                 inter_op_threads: int = ORT_INTER_OP_THREADS, graph_opt_level: str = ORT_GRAPH_OPT_LEVEL,
+                 execution_mode: str = ORT_EXECUTION_MODE, providers: str = ORT_PROVIDERS):
+        super().__init__(model_path)
+        started = time.perf_counter()
+        import onnxruntime as ort
+        self.import_ms = round((time.perf_counter() - started) * 1000, 3)
+
+        if graph_opt_level not in _GRAPH_OPT_LEVELS:
+            raise ValueError(f"Unknown graph optimization level: {graph_opt_level}")
+        if execution_mode not in _EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode: {execution_mode}")
+
+        self._ort = ort
+        self.graph_opt_level = graph_opt_level
+        self.execution_mode = execution_mode
+        self._intra_op_setting = max(0, intra_op_threads)
+        self.intra_op_threads = self._intra_op_setting
+        self.inter_op_threads = max(0, inter_op_threads)
+        self.requested_providers = providers
+        self.session = None
+        self._pid = None
+        # Opened here as well, so a broken model fails (or falls back) before any worker starts
+        self.load()
+
+    def load(self):
+        """
+        Opens the session in the calling process. A session inherited through a fork is
+        replaced: its thread pools stayed behind in the parent. ONNX Runtime copies the
+        weights into each session, so every worker holds its own copy; the model file
+        itself is read from the page cache.
+        """
+        if self.session is not None and self._pid == os.getpid():
+            return
+        started = time.perf_counter()
+        ort = self._ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = worker_threads(self._intra_op_setting)
+        options.inter_op_num_threads = self.inter_op_threads
+        options.graph_optimization_level = getattr(ort.GraphOptimizationLevel, _GRAPH_OPT_LEVELS[self.graph_opt_level])
+        options.execution_mode = getattr(ort.ExecutionMode, _EXECUTION_MODES[self.execution_mode])
+        self.intra_op_threads = options.intra_op_num_threads
+
+        available = ort.get_available_providers()
+        if self.requested_providers:
+            requested = [p.strip() for p in self.requested_providers.split(",") if p.strip()]
+        else:
+            requested = [p for p in ("CUDAExecutionProvider", "CPUExecutionProvider") if p in available]
+        self.session = ort.InferenceSession(self.model_path, sess_options=options, providers=requested)
+        self._pid = os.getpid()
+        self.providers = self.session.get_providers()
+        self.device = "cuda" if "CUDAExecutionProvider" in self.providers else "cpu"
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.output_name = self.session.get_outputs()[0].name
+        self.dtype = np.float16 if model_input.type == "tensor(float16)" else np.float32
+        # A fixed batch dimension (the default export) means images are run one by one
+        self.max_batch = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+        if isinstance(model_input.shape[2], int):
+            self.input_size = model_input.shape[2]
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        if "names" in metadata:
+            self.names = ast.literal_eval(metadata["names"])
+        else:
+            num_classes = self.session.get_outputs()[0].shape[1] - 4
+            self.names = {i: str(i) for i in range(num_classes)}
+        self.load_ms = round((time.perf_counter() - started) * 1000, 3)
+
+    def release(self):
+        self.session = None
+        self._pid = None
+
+    def _prepare(self, imgs: list):
+        batch = np.empty((len(imgs), 3, self.input_size, self.input_size), dtype=self.dtype)
+        transforms = []
+        for i, img in enumerate(imgs):
+            if img.shape[:2] == (self.input_size, self.input_size):
+                ratio, pad = 1.0, (0, 0)
+            else:
+                img, ratio, pad = letterbox(img, self.input_size)
+            # BGR HWC uint8 -> RGB CHW in [0, 1]
+            batch[i] = img[:, :, ::-1].transpose(2, 0, 1)
+            transforms.append((ratio, pad))
+        batch /= 255
+        return batch, transforms
+
+    def _run(self, batch):
+        if self._pid != os.getpid():
+            self.load()
+        if self.max_batch is None or len(batch) <= self.max_batch:
+            return self.session.run([self.output_name], {self.input_name: batch})[0]
+        outputs = [self.session.run([self.output_name], {self.input_name: batch[i:i + self.max_batch]})[0]
+                   for i in range(0, len(batch), self.max_batch)]
+        return np.concatenate(outputs)
+
+    def predict(self, imgs: list, class_index: int, conf: float) -> list:
+        original_sizes = [img.shape[:2] for img in imgs]
+        batch, transforms = self._prepare(imgs)
+        outputs = self._run(batch).astype(np.float32, copy=False)
+
+        results = []
+        for output, (ratio, (pad_x, pad_y)), (height, width) in zip(outputs, transforms, original_sizes):
+            detections = decode_predictions(output, class_index, conf)
+            # Undo the letterbox so boxes are in the caller's image coordinates
+            offset = np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)
+            detections[:, :4] = np.clip((detections[:, :4] - offset) / ratio, 0, [width, height, width, height])
+            results.append(detections)
+        return results
+
+    def info(self) -> dict:
+        data = super().info()
+        data.update({
+            "providers": self.providers,
+            "intra_op_threads": self.intra_op_threads,
+            "inter_op_threads": self.inter_op_threads,
+            "graph_optimization_level": self.graph_opt_level,
+            "execution_mode": self.execution_mode,
+            "max_batch": self.max_batch,
+            "precision": "fp16" if self.dtype == np.float16 else "fp32",
+        })
+        return data
+
+
+def load_engine(model_path: str, kind: str = INFERENCE_ENGINE) -> InferenceEngine:
+    """
+    Creates the inference engine once at startup. With "auto", .onnx models use the
+    native ONNX Runtime engine and fall back to ultralytics if it cannot be created.
+    """
+    if kind not in ("auto", "onnxruntime", "ultralytics"):
+        raise ValueError(f"Unknown inference engine: {kind}")
+
+    if kind == "onnxruntime" or (kind == "auto" and model_path.lower().endswith(".onnx")):
+        try:
+            engine = OnnxRuntimeEngine(model_path)
+            logger.info(f"ONNX Runtime engine loaded {model_path} on {engine.providers}")
+            return engine
+        except Exception as e:
+            if kind == "onnxruntime":
+                raise
+            logger.warning(f"ONNX Runtime engine unavailable ({e}), falling back to ultralytics")
+
+    engine = UltralyticsEngine(model_path)
+    logger.info(f"Ultralytics engine loaded {model_path} on {engine.device.upper()}")
+    return engine
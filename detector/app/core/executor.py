@@ -0,0 +1,85 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 1))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", 64))
+INFERENCE_RETRY_AFTER = int(os.getenv("INFERENCE_RETRY_AFTER", 1))
+
+
+class QueueFullError(Exception):
+    """
+    Raised when the inference pool already holds as many requests as it is allowed to admit.
+    """
+
+    def __init__(self, retry_after: int = INFERENCE_RETRY_AFTER):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+
+class InferencePool:
+    """
+    Runs blocking model calls on a dedicated thread pool so the event loop stays
+    responsive, and bounds how many requests may be waiting for inference at once.
+    Args:
+        workers (int): Number of inference threads.
+        max_pending (int): Maximum number of admitted requests (running or queued).
+        retry_after (int): Seconds clients are told to wait when a request is rejected.
+    """
+
+    def __init__(self, workers: int = INFERENCE_WORKERS, max_pending: int = INFERENCE_QUEUE_SIZE,
+                 retry_after: int = INFERENCE_RETRY_AFTER):
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        self._pending = 0
+        self._admitted = 0
+        self._rejected = 0
+
+    def admit(self, count: int = 1) -> int:
+        """
+        Reserves slots for `count` images, e.g. the extra images of a batch request.
+        A request never needs more than `max_pending` slots, so a batch larger than the
+        queue is admitted once the queue is otherwise empty.
+        Returns:
+            int: The number of slots taken, to pass to `release`.
+        Raises:
+            QueueFullError: When the pool has no room for them.
+        """
+        count = min(max(0, count), self.max_pending)
+        if count and self._pending + count > self.max_pending:
+            self._rejected += 1
+            logger.warning(f"Inference queue full ({self._pending}/{self.max_pending}), rejecting request "
+                           f"for {count} slot(s)")
+            raise QueueFullError(self.retry_after)
+        self._pending += count
+        self._admitted += count
+        return count
+
+    def release(self, count: int = 1):
+        self._pending = max(0, self._pending - count)
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Executes `func(*args, **kwargs)` on an inference thread and awaits its result.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        logger.info("Inference pool shut down")
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+        }
@@ -1,35 +1,217 @@
-import logging
+import os
 import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import datetime
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from .tracing import trace_id
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Per-module overrides, e.g. "core.batcher=DEBUG,core.video=WARNING"; the longest matching prefix wins
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# "json" (one object per line) or "text"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Empty logs to the console only
+LOG_FILE = os.getenv("LOG_FILE", "detector_app.log")
+LOG_FILE_MAX_BYTES = int(os.getenv("LOG_FILE_MAX_BYTES", 10 * 1024 * 1024))
+LOG_FILE_BACKUPS = int(os.getenv("LOG_FILE_BACKUPS", 5))
+# Records waiting to be written; beyond that, new records are dropped instead of blocking requests
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# Share of per-request info logs that are kept, and the most kept per second per module (0 = no limit)
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1.0))
+LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", 0))
+
+_TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+def _module_levels(spec: str) -> dict:
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+_LEVELS = _module_levels(LOG_LEVELS)
+
+
+def level_for(name: str) -> str:
+    matches = [prefix for prefix in _LEVELS if name == prefix or name.startswith(prefix + ".")]
+    return _LEVELS[max(matches, key=len)] if matches else LOG_LEVEL
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record: time, level, logger, message, and the trace id and
+    exception when there is one.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).astimezone().isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "trace_id", None):
+            entry["trace_id"] = record.trace_id
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Thins out records logged through a request logger (see `setup_request_logger`):
+    info and debug records are kept with probability LOG_SAMPLE_RATE and at most
+    LOG_RATE_LIMIT per second per logger. Warnings and errors are always kept.
+    """
+
+    def __init__(self, sample_rate: float = LOG_SAMPLE_RATE, rate_limit: float = LOG_RATE_LIMIT):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.rate_limit = rate_limit
+        self._windows = {}
+        self.sampled_out = 0
+        self.rate_limited = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False) or record.levelno >= logging.WARNING:
+            return True
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return False
+        if self.rate_limit > 0:
+            second = int(time.monotonic())
+            window, count = self._windows.get(record.name, (second, 0))
+            if window != second:
+                window, count = second, 0
+            if count >= self.rate_limit:
+                self.rate_limited += 1
+                return False
+            self._windows[record.name] = (window, count + 1)
+        return True
+
+
+class AsyncQueueHandler(QueueHandler):
+    """
+    Hands records to the writer thread without formatting them: messages are only
+    built (and written) on the listener's thread. The caller's trace id is attached
+    first, since it lives in a context variable. When the queue is full the record
+    is dropped and counted, so logging never blocks a request.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.trace_id = trace_id()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler = None
+_listener = None
+_sampler = None
+_lock = threading.Lock()
+
+
+def _configure():
+    global _handler, _listener, _sampler
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(_TEXT_FORMAT)
+
+    # Console Handler
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(formatter)
+    handlers = [console_handler]
+
+    # File Handler, rotated by size
+    if LOG_FILE:
+        file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS,
+                                           encoding="utf-8")
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+
+    _sampler = SamplingFilter()
+    _handler = AsyncQueueHandler(queue.Queue(maxsize=max(1, LOG_QUEUE_SIZE)))
+    _handler.addFilter(_sampler)
+    _listener = QueueListener(_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Writes out whatever is still queued when the process exits
+    atexit.register(_stop_listener)
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_after_fork():
+    """
+    A forked worker (gunicorn with a preloaded app) inherits the handler but not the
+    writer thread, and the queue may have been locked by it; both are replaced.
+    """
+    global _listener
+    if _handler is None:
+        return
+    _handler.queue = queue.Queue(maxsize=max(1, LOG_QUEUE_SIZE))
+    _listener = QueueListener(_handler.queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
 
 def setup_logger(name: str):
     """
-    Sets up a logger with the specified name. The logger will output log messages
-    to both the console and a file named 'backend_app.log'. The log messages will
-    include the timestamp, logger name, log level, and the message.
+    Sets up a logger with the specified name. Records go through an in-memory queue
+    to a background thread, which writes them to the console and to a size-rotated
+    LOG_FILE as JSON lines (or text, with LOG_FORMAT=text). The level comes from
+    LOG_LEVELS for the module, else LOG_LEVEL.
     Args:
         name (str): The name of the logger.
     Returns:
         logging.Logger: Configured logger instance.
     """
+    with _lock:
+        if _handler is None:
+            _configure()
+
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG) 
-    
-    # Format log
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
-    
-    # Console Handler
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
-    
-    # File Handler
-    file_handler = logging.FileHandler("detector_app.log", encoding="utf-8")
-    file_handler.setFormatter(formatter)
+    logger.setLevel(level_for(name))
 
     # Add handlers if not already added
-    if not logger.handlers:
-        logger.addHandler(console_handler)
-        logger.addHandler(file_handler)
-    
+    if _handler not in logger.handlers:
+        logger.addHandler(_handler)
+
     return logger
+
+
+def setup_request_logger(name: str) -> logging.LoggerAdapter:
+    """
+    A logger for lines written on every request; its info and debug records are
+    sampled and rate limited (LOG_SAMPLE_RATE, LOG_RATE_LIMIT).
+    """
+    return logging.LoggerAdapter(setup_logger(name), {"sampled": True})
+
+
+def logging_stats() -> dict:
+    return {
+        "queued": _handler.queue.qsize() if _handler is not None else 0,
+        "dropped": _handler.dropped if _handler is not None else 0,
+        "sampled_out": _sampler.sampled_out if _sampler is not None else 0,
+        "rate_limited": _sampler.rate_limited if _sampler is not None else 0,
+    }
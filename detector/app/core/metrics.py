@@ -0,0 +1,130 @@
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, Info, CONTENT_TYPE_LATEST, generate_latest
+from fastapi import Response
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Stage latencies span from sub-millisecond cache lookups to multi-second inference on CPU
+_STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_LATENCY = Histogram(
+    "detector_http_request_duration_seconds", "Time spent handling HTTP requests",
+    ["method", "route", "status"], buckets=_STAGE_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge("detector_http_requests_in_flight", "HTTP requests currently being handled")
+STAGE_LATENCY = Histogram(
+    "detector_stage_duration_seconds",
+    "Time spent in each stage of a detection: multipart parsing, cache lookup, decode and letterbox "
+    "(preprocess), waiting for a batch, model inference and box extraction (postprocess)",
+    ["stage"], buckets=_STAGE_BUCKETS,
+)
+BATCH_SIZE = Histogram("detector_batch_size", "Images per batched model call", buckets=(1, 2, 4, 8, 16, 32, 64))
+CACHE_LOOKUPS = Counter("detector_cache_lookups_total", "Result cache lookups by result (hit, miss)", ["result"])
+QUEUE_DEPTH = Gauge("detector_queue_depth", "Work waiting in the detector's internal queues", ["queue"])
+MODEL_INFO = Info("detector_model", "The loaded model and inference engine")
+STARTUP_DURATION = Gauge(
+    "detector_startup_duration_seconds",
+    "Time spent in each startup phase of this process: importing the app, importing the inference library, "
+    "loading the model and warming it up",
+    ["phase"],
+)
+
+
+def observe(stage: str, seconds: float):
+    if METRICS_ENABLED:
+        STAGE_LATENCY.labels(stage).observe(seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    """
+    Records the time spent in the `with` block under `stage`, also when it raises.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def timed_call(stage: str, fn, *args):
+    """
+    Calls `fn(*args)` and records its duration; meant for work handed to a thread pool.
+    """
+    with timed(stage):
+        return fn(*args)
+
+
+def observe_since_start(request, stage: str = "multipart_parse"):
+    """
+    Records the time between the request reaching the app and this call; in a handler
+    with file parameters, that is how long the body took to receive and parse.
+    """
+    started = request.scope.get("metrics.started")
+    if started is not None:
+        observe(stage, time.perf_counter() - started)
+
+
+def set_model_info(info: dict):
+    MODEL_INFO.info({key: str(value) for key, value in info.items() if not isinstance(value, (list, dict))})
+
+
+def route_template(scope) -> str:
+    """
+    Path template of the matched route, e.g. "/api/v1/history/{record_id}".
+    """
+    # Recent FastAPI versions keep included routes unprefixed and the full path beside them
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    if context is not None:
+        return context.path
+    return getattr(scope.get("route"), "path", "unmatched")
+
+
+def queue_gauge(queue: str, fn):
+    """
+    Reports the result of `fn()` as the depth of `queue` every time metrics are scraped.
+    """
+    QUEUE_DEPTH.labels(queue).set_function(fn)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording request latency by route template (not raw path,
+    to keep label cardinality bounded) and the number of requests in flight.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        scope["metrics.started"] = started
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            REQUEST_LATENCY.labels(scope["method"], route_template(scope), str(status)).observe(
+                time.perf_counter() - started
+            )
+
+
+async def metrics_endpoint():
+    """
+    Prometheus text exposition of every metric registered in this process.
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,96 @@
+import os
+import numpy as np
+
+NMS_IOU_THRESHOLD = float(os.getenv("NMS_IOU_THRESHOLD", 0.7))
+NMS_MAX_DETECTIONS = int(os.getenv("NMS_MAX_DETECTIONS", 300))
+# Candidates kept (by score) before NMS, bounding its cost on very cluttered images
+NMS_MAX_CANDIDATES = int(os.getenv("NMS_MAX_CANDIDATES", 30000))
+
+
+def xywh_to_xyxy(boxes):
+    """
+    Converts (N, 4) center-x, center-y, width, height boxes to corner coordinates.
+    """
+    half = boxes[:, 2:4] / 2
+    return np.concatenate((boxes[:, 0:2] - half, boxes[:, 0:2] + half), axis=1)
+
+
+def box_iou(box, boxes):
+    """
+    IoU between one xyxy `box` and every row of the (N, 4) `boxes`.
+    """
+    top_left = np.maximum(box[:2], boxes[:, :2])
+    bottom_right = np.minimum(box[2:4], boxes[:, 2:4])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(area + areas - intersection, 1e-9)
+
+
+def box_ios(box, boxes):
+    """
+    Intersection over the smaller area between one xyxy `box` and every row of the
+    (N, 4) `boxes`. Close to 1 when a box cut off at a tile border lies inside the
+    whole box, where IoU stays low.
+    """
+    top_left = np.maximum(box[:2], boxes[:, :2])
+    bottom_right = np.minimum(box[2:4], boxes[:, 2:4])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(np.minimum(area, areas), 1e-9)
+
+
+def nms(boxes, scores, iou_threshold: float = NMS_IOU_THRESHOLD, max_detections: int = NMS_MAX_DETECTIONS,
+        overlap=box_iou, groups=None):
+    """
+    Greedy non-maximum suppression. Each step suppresses every remaining box that
+    overlaps the current best one in a single vectorized `overlap` computation.
+    Args:
+        overlap (callable): `box_iou` or `box_ios`.
+        groups (numpy.ndarray, optional): (N,) group ids, e.g. the tile of each box. When
+            given, boxes only suppress boxes of other groups.
+    Returns:
+        numpy.ndarray: Indices of the kept boxes, highest score first.
+    """
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size and len(keep) < max_detections:
+        best = order[0]
+        keep.append(best)
+        if order.size == 1:
+            break
+        rest = order[1:]
+        kept = overlap(boxes[best], boxes[rest]) <= iou_threshold
+        if groups is not None:
+            kept |= groups[rest] == groups[best]
+        order = rest[kept]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def decode_predictions(output, class_index: int, conf: float, iou_threshold: float = NMS_IOU_THRESHOLD,
+                       max_detections: int = NMS_MAX_DETECTIONS):
+    """
+    Turns the raw output of a YOLO detection head for one image into final detections.
+    Args:
+        output (numpy.ndarray): (4 + num_classes, num_anchors) array of xywh boxes and class scores.
+        class_index (int): The only class that is kept.
+        conf (float): Confidence threshold.
+    Returns:
+        numpy.ndarray: (N, 6) float32 array of x_min, y_min, x_max, y_max, confidence, class index.
+    """
+    scores = output[4 + class_index]
+    candidates = np.flatnonzero(scores > conf)
+    if candidates.size > NMS_MAX_CANDIDATES:
+        candidates = candidates[np.argpartition(-scores[candidates], NMS_MAX_CANDIDATES)[:NMS_MAX_CANDIDATES]]
+    if not candidates.size:
+        return np.zeros((0, 6), dtype=np.float32)
+
+    boxes = xywh_to_xyxy(output[:4, candidates].T)
+    scores = scores[candidates]
+    keep = nms(boxes, scores, iou_threshold, max_detections)
+    detections = np.empty((keep.size, 6), dtype=np.float32)
+    detections[:, :4] = boxes[keep]
+    detections[:, 4] = scores[keep]
+    detections[:, 5] = class_index
+    return detections
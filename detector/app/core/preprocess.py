@@ -0,0 +1,132 @@
+import os
+import struct
+import cv2
+import numpy as np
+
+MODEL_INPUT_SIZE = int(os.getenv("MODEL_INPUT_SIZE", 640))
+PREPROCESS_REDUCED_DECODE = os.getenv("PREPROCESS_REDUCED_DECODE", "true").lower() in ("1", "true", "yes")
+PREPROCESS_LETTERBOX = os.getenv("PREPROCESS_LETTERBOX", "true").lower() in ("1", "true", "yes")
+
+# IMREAD_REDUCED_* flags let libjpeg decode straight to 1/2, 1/4 or 1/8 resolution
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(contents: bytes):
+    """
+    Reads the width and height from a JPEG header without decoding the image.
+    Returns:
+        tuple: (width, height), or None if `contents` is not a parseable JPEG.
+    """
+    if len(contents) < 4 or contents[:2] != b"\xff\xd8":
+        return None
+    offset = 2
+    length = len(contents)
+    while offset + 4 <= length:
+        if contents[offset] != 0xFF:
+            return None
+        marker = contents[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        segment_length = struct.unpack(">H", contents[offset + 2:offset + 4])[0]
+        if marker in _JPEG_SOF_MARKERS:
+            if offset + 9 > length:
+                return None
+            height, width = struct.unpack(">HH", contents[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + segment_length
+    return None
+
+
+def decode_image(contents: bytes, target_size: int = MODEL_INPUT_SIZE):
+    """
+    Decodes an image, using reduced-resolution JPEG decoding when the image is much
+    larger than the model input (the model would downscale it anyway).
+    Returns:
+        tuple: (image, (scale_x, scale_y)) where the scales map decoded pixel
+               coordinates back to the original image, or (None, None) on failure.
+    """
+    np_img = np.frombuffer(contents, np.uint8)
+    if np_img.size == 0:
+        return None, None
+
+    size = jpeg_size(contents) if PREPROCESS_REDUCED_DECODE else None
+    flag = cv2.IMREAD_COLOR
+    if size is not None:
+        longest = max(size)
+        for factor, reduced_flag in _REDUCED_FLAGS:
+            # Never go below the model input size
+            if longest // factor >= target_size:
+                flag = reduced_flag
+                break
+
+    img = cv2.imdecode(np_img, flag)
+    if img is None:
+        return None, None
+    if size is None or flag == cv2.IMREAD_COLOR:
+        return img, (1.0, 1.0)
+    # EXIF orientation is applied while decoding, so the header size may be transposed
+    if size[0] != size[1] and (img.shape[1] > img.shape[0]) != (size[0] > size[1]):
+        size = (size[1], size[0])
+    return img, (size[0] / img.shape[1], size[1] / img.shape[0])
+
+
+def letterbox(img, new_size: int = MODEL_INPUT_SIZE, color: int = 114):
+    """
+    Resizes `img` to fit a `new_size` x `new_size` square while keeping the aspect
+    ratio, padding the remainder with `color`.
+    Returns:
+        tuple: (padded image, ratio, (pad_x, pad_y))
+    """
+    height, width = img.shape[:2]
+    ratio = min(new_size / height, new_size / width)
+    resized_w, resized_h = int(round(width * ratio)), int(round(height * ratio))
+    if (resized_w, resized_h) != (width, height):
+        interpolation = cv2.INTER_AREA if ratio < 1 else cv2.INTER_LINEAR
+        img = cv2.resize(img, (resized_w, resized_h), interpolation=interpolation)
+
+    pad_x = (new_size - resized_w) // 2
+    pad_y = (new_size - resized_h) // 2
+    canvas = np.full((new_size, new_size, 3), color, dtype=np.uint8)
+    canvas[pad_y:pad_y + resized_h, pad_x:pad_x + resized_w] = img
+    return canvas, ratio, (pad_x, pad_y)
+
+
+def preprocess(contents: bytes, target_size: int = MODEL_INPUT_SIZE):
+    """
+    Decodes and (optionally) letterboxes an upload for the model.
+    Returns:
+        tuple: (model input image, transform) where `transform` is passed to
+               `restore_boxes`, or (None, None) if the image could not be decoded.
+    """
+    img, scale = decode_image(contents, target_size)
+    if img is None:
+        return None, None
+    transform = {
+        "scale": scale,
+        "size": (int(round(img.shape[1] * scale[0])), int(round(img.shape[0] * scale[1]))),
+        "ratio": 1.0,
+        "pad": (0, 0),
+    }
+    if PREPROCESS_LETTERBOX:
+        img, transform["ratio"], transform["pad"] = letterbox(img, target_size)
+    return img, transform
+
+
+def restore_boxes(boxes, transform):
+    """
+    Maps (N, 4) xyxy boxes from model-input coordinates back to the original image,
+    undoing the letterbox padding/resize and any reduced-resolution decode.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    if transform is None:
+        return boxes
+    pad_x, pad_y = transform["pad"]
+    scale_x, scale_y = transform["scale"]
+    width, height = transform["size"]
+    offset = np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)
+    scale = np.array([scale_x, scale_y, scale_x, scale_y], dtype=np.float32) / transform["ratio"]
+    restored = (boxes - offset) * scale
+    np.clip(restored, 0, [width, height, width, height], out=restored)
+    return restored
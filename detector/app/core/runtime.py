@@ -0,0 +1,146 @@
+import os
+import asyncio
+from .engine import (load_engine, parse_batch_sizes, parse_shapes, ENGINE_WARMUP_RUNS, ENGINE_WARMUP_BATCH_SIZES,
+                     ENGINE_WARMUP_SHAPES)
+from .executor import InferencePool, QueueFullError, INFERENCE_RETRY_AFTER
+from .batcher import BatchScheduler
+from .metrics import set_model_info, STARTUP_DURATION
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# true finishes the warmup before the worker takes requests; otherwise it runs right after startup
+ENGINE_WARMUP_WAIT = os.getenv("ENGINE_WARMUP_WAIT", "false").lower() in ("1", "true", "yes")
+# true runs inference requests on the cold model while it warms up; otherwise they get 503 + Retry-After
+DETECT_DURING_WARMUP = os.getenv("DETECT_DURING_WARMUP", "false").lower() in ("1", "true", "yes")
+
+
+class NotReadyError(QueueFullError):
+    """
+    Raised for inference requests that arrive before the model is warmed up.
+    """
+
+    def __init__(self, retry_after: int = INFERENCE_RETRY_AFTER):
+        Exception.__init__(self, "Detector is warming up")
+        self.retry_after = retry_after
+
+
+class DetectorRuntime:
+    """
+    The engine, inference pool and batch scheduler of one detector process, and its
+    startup state. The model is opened by the app's lifespan hook (or once in the
+    gunicorn master, see `preload`) instead of on import, then warmed up; the process
+    is ready once that is done. Every startup phase is timed.
+    Args:
+        model_path (str): The model file, passed to `load_engine`.
+    """
+
+    def __init__(self, model_path: str):
+        self.model_path = model_path
+        self.engine = None
+        self.pool = InferencePool()
+        self.batcher = BatchScheduler(None, self.pool)
+        # pending, loading, warming_up, ready or failed
+        self.state = "pending"
+        self.draining = False
+        self.timings = {}
+        self._warmup_task = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready" and not self.draining
+
+    @property
+    def accepting(self) -> bool:
+        """
+        Whether inference requests are taken: once the warmup is over (a failed warmup
+        leaves the model usable), or while it runs with DETECT_DURING_WARMUP.
+        """
+        return self.state in ("ready", "failed") or (self.state == "warming_up" and DETECT_DURING_WARMUP)
+
+    def record(self, phase: str, ms: float):
+        if ms is None:
+            return
+        self.timings[phase] = ms
+        STARTUP_DURATION.labels(phase).set(ms / 1000)
+
+    def load(self):
+        """
+        Opens the model; blocking. Does nothing when it was preloaded.
+        Raises:
+            RuntimeError: If the model cannot be loaded.
+        """
+        if self.engine is not None:
+            return
+        self.state = "loading"
+        try:
+            self.engine = load_engine(self.model_path)
+        except Exception as e:
+            self.state = "failed"
+            logger.error(f"Error loading YOLO model: {e}")
+            raise RuntimeError("Failed to load YOLO model") from e
+        self.batcher.model = self.engine
+        logger.info("YOLO model loaded successfully")
+
+    def preload(self):
+        """
+        Opens the model in the gunicorn master before it forks, so a broken model stops
+        the server before any worker starts and PyTorch weights are shared by the
+        workers. ONNX Runtime sessions are released: each worker opens its own.
+        """
+        self.load()
+        self.engine.release()
+
+    async def start(self):
+        """
+        Loads the model on the inference pool and starts the batch scheduler, then
+        warms up (awaited with ENGINE_WARMUP_WAIT, in the background otherwise).
+        """
+        await self.pool.run(self.load)
+        # In a forked worker this opens the per-process state, such as the ONNX Runtime session
+        self.state = "loading"
+        await self.pool.run(self.engine.load)
+        self.record("engine_import", self.engine.import_ms)
+        self.record("engine_load", self.engine.load_ms)
+        set_model_info(self.engine.info())
+        await self.batcher.start()
+
+        self._warmup_task = asyncio.create_task(self.warm_up())
+        if ENGINE_WARMUP_WAIT:
+            await self._warmup_task
+
+    async def warm_up(self):
+        """
+        Runs ENGINE_WARMUP_RUNS rounds of dummy inferences at the configured batch sizes
+        (single images and full batches by default) and image shapes.
+        """
+        self.state = "warming_up"
+        try:
+            batch_sizes = parse_batch_sizes(ENGINE_WARMUP_BATCH_SIZES) or sorted({1, self.batcher.max_batch_size})
+            shapes = parse_shapes(ENGINE_WARMUP_SHAPES)
+            await self.pool.run(self.engine.warmup, ENGINE_WARMUP_RUNS, batch_sizes, shapes)
+        except Exception as e:
+            self.state = "failed"
+            logger.error(f"Engine warmup failed: {e}")
+            return
+        self.record("warmup", self.engine.warmup_ms or 0.0)
+        self.record("total", round(sum(ms for phase, ms in self.timings.items() if phase != "total"), 3))
+        set_model_info(self.engine.info())
+        self.state = "ready"
+        logger.info(f"Detector ready, startup took {self.timings['total']} ms ({self.timings})")
+
+    async def stop(self):
+        self.draining = True
+        if self._warmup_task is not None and not self._warmup_task.done():
+            self._warmup_task.cancel()
+        await self.batcher.stop()
+        self.pool.shutdown()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "draining": self.draining,
+            "timings_ms": self.timings,
+            "pid": os.getpid(),
+        }
@@ -0,0 +1,180 @@
+import os
+import cv2
+import numpy as np
+from .preprocess import letterbox, restore_boxes, MODEL_INPUT_SIZE, PREPROCESS_LETTERBOX
+from .postprocess import nms, box_iou, box_ios, NMS_MAX_DETECTIONS
+
+# Defaults of the per-request tiling parameters of `POST /api/v1/detect`
+TILE_SIZE = int(os.getenv("TILE_SIZE", MODEL_INPUT_SIZE))
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", 0.2))
+TILE_SKIP_EMPTY = os.getenv("TILE_SKIP_EMPTY", "true").lower() in ("1", "true", "yes")
+# Tiles whose grayscale standard deviation is below this count as empty (sky, walls, road)
+TILE_EMPTY_STD = float(os.getenv("TILE_EMPTY_STD", 3.0))
+# Also run the whole image, downscaled, so people larger than a tile are still found
+TILE_FULL_FRAME = os.getenv("TILE_FULL_FRAME", "true").lower() in ("1", "true", "yes")
+TILE_MAX_TILES = int(os.getenv("TILE_MAX_TILES", 64))
+# Merging across tiles: intersection over the smaller box (ios) or iou, and its threshold
+TILE_MERGE_METRIC = os.getenv("TILE_MERGE_METRIC", "ios").lower()
+TILE_MERGE_THRESHOLD = float(os.getenv("TILE_MERGE_THRESHOLD", 0.6))
+
+# The emptiness check runs on a copy downscaled by this factor
+_EMPTY_CHECK_FACTOR = 4
+
+
+def tile_grid(width: int, height: int, tile_size: int, overlap: float):
+    """
+    Covers a `width` x `height` image with `tile_size` squares overlapping by the
+    `overlap` fraction of a tile. The last row and column are aligned to the image
+    edge, so every tile is full-sized unless the image is smaller than a tile.
+    Returns:
+        numpy.ndarray: (T, 4) int array of x_min, y_min, x_max, y_max per tile.
+    """
+    stride = max(1, int(tile_size * (1 - overlap)))
+    xs, ys = _starts(width, tile_size, stride), _starts(height, tile_size, stride)
+    x0, y0 = np.meshgrid(xs, ys)
+    x0, y0 = x0.ravel(), y0.ravel()
+    return np.stack((x0, y0, np.minimum(x0 + tile_size, width), np.minimum(y0 + tile_size, height)), axis=1)
+
+
+def _starts(length: int, size: int, stride: int) -> list:
+    if length <= size:
+        return [0]
+    starts = list(range(0, length - size, stride))
+    starts.append(length - size)
+    return starts
+
+
+def empty_tiles(img, tiles, threshold: float = TILE_EMPTY_STD):
+    """
+    Flags tiles without texture from the grayscale standard deviation of each tile,
+    computed for all tiles at once from integral images of a downscaled copy.
+    Returns:
+        numpy.ndarray: (T,) bool array, True for empty tiles.
+    """
+    height, width = img.shape[:2]
+    small_w, small_h = max(1, width // _EMPTY_CHECK_FACTOR), max(1, height // _EMPTY_CHECK_FACTOR)
+    gray = cv2.resize(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), (small_w, small_h), interpolation=cv2.INTER_AREA)
+    sums, squares = cv2.integral2(gray, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+
+    x0 = np.clip(tiles[:, 0] * small_w // width, 0, small_w - 1)
+    y0 = np.clip(tiles[:, 1] * small_h // height, 0, small_h - 1)
+    x1 = np.maximum(tiles[:, 2] * small_w // width, x0 + 1)
+    y1 = np.maximum(tiles[:, 3] * small_h // height, y0 + 1)
+    area = (x1 - x0) * (y1 - y0)
+    total = sums[y1, x1] - sums[y0, x1] - sums[y1, x0] + sums[y0, x0]
+    total_sq = squares[y1, x1] - squares[y0, x1] - squares[y1, x0] + squares[y0, x0]
+    mean = total / area
+    std = np.sqrt(np.maximum(total_sq / area - mean ** 2, 0))
+    return std < threshold
+
+
+def _model_input(img):
+    """
+    Letterboxes one tile (or the whole frame) like `preprocess` does.
+    Returns:
+        tuple: (model input image, transform for `restore_boxes`)
+    """
+    transform = {"scale": (1.0, 1.0), "size": (img.shape[1], img.shape[0]), "ratio": 1.0, "pad": (0, 0)}
+    if PREPROCESS_LETTERBOX:
+        img, transform["ratio"], transform["pad"] = letterbox(img, MODEL_INPUT_SIZE)
+    return img, transform
+
+
+class TiledImage:
+    """
+    An image split into overlapping tiles for sliced inference, so small, distant
+    people are seen at full resolution instead of after downscaling the whole frame
+    to the model input. The tiles (and optionally the whole frame) are run as one
+    batch; `merge` maps their detections back to the image and removes the
+    duplicates found by neighbouring tiles.
+    Args:
+        img (numpy.ndarray): The full-resolution BGR image.
+        tile_size (int): Side of the square tiles, in image pixels.
+        overlap (float): Fraction of a tile shared with its neighbours, in [0, 0.5].
+        skip_empty (bool): Leave out tiles without texture (see `empty_tiles`).
+        full_frame (bool): Also run the whole image, for people larger than a tile.
+    Raises:
+        ValueError: If the image would need more than TILE_MAX_TILES tiles.
+    """
+
+    def __init__(self, img, tile_size: int = TILE_SIZE, overlap: float = TILE_OVERLAP,
+                 skip_empty: bool = TILE_SKIP_EMPTY, full_frame: bool = TILE_FULL_FRAME):
+        height, width = img.shape[:2]
+        self.tile_size = tile_size
+        self.overlap = overlap
+        grid = tile_grid(width, height, tile_size, overlap)
+        if len(grid) > TILE_MAX_TILES:
+            raise ValueError(f"{width}x{height} image needs {len(grid)} tiles of {tile_size} px, "
+                             f"more than TILE_MAX_TILES ({TILE_MAX_TILES})")
+        self.total = len(grid)
+        if skip_empty and len(grid) > 1:
+            grid = grid[~empty_tiles(img, grid)]
+        self.skipped = self.total - len(grid)
+
+        self.images, self.transforms, offsets = [], [], []
+        for x0, y0, x1, y1 in grid.tolist():
+            tile, transform = _model_input(img[y0:y1, x0:x1])
+            self.images.append(tile)
+            self.transforms.append(transform)
+            offsets.append((x0, y0))
+        # A single tile already is the whole frame
+        if full_frame and self.total > 1:
+            frame, transform = _model_input(img)
+            self.images.append(frame)
+            self.transforms.append(transform)
+            offsets.append((0, 0))
+        self.offsets = np.asarray(offsets, dtype=np.float32).reshape(-1, 2)
+
+    def merge(self, results: list, threshold: float = TILE_MERGE_THRESHOLD, metric: str = TILE_MERGE_METRIC):
+        """
+        Maps the detections of every tile back to image coordinates and runs NMS
+        across tiles. Boxes of the same tile were already suppressed by the model's
+        own NMS, so only boxes of different tiles suppress each other.
+        Args:
+            results (list): One (N, 6) detection array per entry of `images`.
+        Returns:
+            numpy.ndarray: (N, 6) float32 detections in original image coordinates.
+        """
+        parts, groups = [], []
+        for index, (result, transform) in enumerate(zip(results, self.transforms)):
+            if not len(result):
+                continue
+            part = np.array(result, dtype=np.float32)
+            offset = np.tile(self.offsets[index], 2)
+            part[:, :4] = restore_boxes(part[:, :4], transform) + offset
+            parts.append(part)
+            groups.append(np.full(len(part), index))
+        if not parts:
+            return np.zeros((0, 6), dtype=np.float32)
+
+        data = np.concatenate(parts)
+        overlap = box_ios if metric == "ios" else box_iou
+        keep = nms(data[:, :4], data[:, 4], threshold, NMS_MAX_DETECTIONS, overlap, np.concatenate(groups))
+        return data[keep]
+
+    def stats(self) -> dict:
+        return {
+            "tile_size": self.tile_size,
+            "overlap": self.overlap,
+            "tiles": self.total,
+            "skipped": self.skipped,
+            "inferences": len(self.images),
+        }
+
+
+def split_image(contents: bytes, tile_size: int = TILE_SIZE, overlap: float = TILE_OVERLAP,
+                skip_empty: bool = TILE_SKIP_EMPTY):
+    """
+    Decodes an upload at full resolution and splits it into tiles.
+    Returns:
+        TiledImage: The tiles, or None if the image could not be decoded.
+    Raises:
+        ValueError: If the image would need more than TILE_MAX_TILES tiles.
+    """
+    np_img = np.frombuffer(contents, np.uint8)
+    if np_img.size == 0:
+        return None
+    img = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    return TiledImage(img, tile_size, overlap, skip_empty)
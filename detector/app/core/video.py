@@ -0,0 +1,196 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+import cv2
+from .detector import format_detections
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+VIDEO_FRAME_STRIDE = int(os.getenv("VIDEO_FRAME_STRIDE", 5))
+VIDEO_MOTION_THRESHOLD = float(os.getenv("VIDEO_MOTION_THRESHOLD", 0.02))
+VIDEO_QUEUE_SIZE = int(os.getenv("VIDEO_QUEUE_SIZE", 16))
+VIDEO_MAX_INFLIGHT = int(os.getenv("VIDEO_MAX_INFLIGHT", 16))
+
+# Pixel intensity change (0-255) that counts as motion, and the size frames are compared at
+_MOTION_PIXEL_DELTA = 25
+_MOTION_SIZE = (160, 90)
+
+_END_OF_STREAM = object()
+
+
+class FrameSampler:
+    """
+    Decides which decoded frames are worth sending to the model.
+    Args:
+        mode (str): "stride" keeps every `stride`-th frame; "motion" looks at every
+                    `stride`-th frame and keeps it only when the fraction of pixels that
+                    changed since the last kept frame reaches `motion_threshold`.
+        stride (int): Frame interval (1 looks at every frame).
+        motion_threshold (float): Fraction of pixels (0-1) that must change in motion mode.
+    """
+
+    def __init__(self, mode: str = "stride", stride: int = VIDEO_FRAME_STRIDE,
+                 motion_threshold: float = VIDEO_MOTION_THRESHOLD):
+        if mode not in ("stride", "motion"):
+            raise ValueError(f"Unknown sampling mode: {mode}")
+        self.mode = mode
+        self.stride = max(1, stride)
+        self.motion_threshold = motion_threshold
+        self._reference = None
+
+    def keep(self, index: int, frame) -> bool:
+        if index % self.stride:
+            return False
+        if self.mode == "stride":
+            return True
+
+        # Motion mode compares a small grayscale thumbnail against the last kept frame
+        small = cv2.cvtColor(cv2.resize(frame, _MOTION_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        if self._reference is None:
+            self._reference = small
+            return True
+        changed = cv2.countNonZero(cv2.threshold(cv2.absdiff(small, self._reference), _MOTION_PIXEL_DELTA, 255,
+                                                 cv2.THRESH_BINARY)[1])
+        if changed / small.size >= self.motion_threshold:
+            self._reference = small
+            return True
+        return False
+
+
+class VideoPipeline:
+    """
+    Streams per-frame people counts for a video file or stream source.
+    Decoding runs on its own thread and feeds a bounded queue; sampled frames are
+    submitted to the batch scheduler with a bounded number in flight; results are
+    yielded in frame order. Decode, inference and output therefore overlap while
+    memory stays constant regardless of video length.
+    Args:
+        source (str): Anything `cv2.VideoCapture` accepts (file path, rtsp:// or http:// MJPEG URL).
+        batcher (BatchScheduler): The scheduler that runs inference.
+        sampler (FrameSampler): Chooses which frames are processed.
+        class_name (str): Class to detect.
+        conf (float): Confidence threshold.
+        max_frames (int, optional): Stop after this many processed frames.
+        include_boxes (bool): Include bounding boxes in every frame event.
+    """
+
+    def __init__(self, source: str, batcher, sampler: FrameSampler, class_name: str = "person",
+                 conf: float = 0.5, max_frames: int = None, include_boxes: bool = False,
+                 queue_size: int = VIDEO_QUEUE_SIZE, max_inflight: int = VIDEO_MAX_INFLIGHT):
+        self.source = source
+        self.batcher = batcher
+        self.sampler = sampler
+        self.class_name = class_name
+        self.conf = conf
+        self.max_frames = max_frames
+        self.include_boxes = include_boxes
+        self.queue_size = max(1, queue_size)
+        self.max_inflight = max(1, max_inflight)
+        self.frames_read = 0
+        self._stop = threading.Event()
+
+    def _decode(self, loop, queue: asyncio.Queue):
+        capture = cv2.VideoCapture(self.source)
+        try:
+            if not capture.isOpened():
+                # Named streams may carry credentials in their URL; only the log gets it
+                logger.error(f"Could not open video source: {self.source}")
+                raise ValueError("Could not open video source")
+            fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+            kept = 0
+            index = 0
+            while not self._stop.is_set():
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                self.frames_read += 1
+                if self.sampler.keep(index, frame):
+                    timestamp_ms = capture.get(cv2.CAP_PROP_POS_MSEC) or (index / fps * 1000 if fps else None)
+                    # Blocks while the queue is full, which throttles decoding to inference speed
+                    asyncio.run_coroutine_threadsafe(queue.put((index, timestamp_ms, frame)), loop).result()
+                    kept += 1
+                    if self.max_frames is not None and kept >= self.max_frames:
+                        break
+                index += 1
+            if not self._stop.is_set():
+                asyncio.run_coroutine_threadsafe(queue.put(_END_OF_STREAM), loop).result()
+        except Exception as e:
+            if not self._stop.is_set():
+                asyncio.run_coroutine_threadsafe(queue.put(e), loop).result()
+        finally:
+            capture.release()
+
+    async def _infer(self, index, timestamp_ms, frame):
+        results = await self.batcher.submit(frame, self.class_name, self.conf)
+        detections = format_detections(results, self.class_name)
+        event = {
+            "event": "frame",
+            "frame": index,
+            "timestamp_ms": round(timestamp_ms, 1) if timestamp_ms is not None else None,
+            "people_count": len(detections),
+        }
+        if self.include_boxes:
+            event["detections"] = detections
+        return event
+
+    async def run(self):
+        """
+        Async generator of frame events, followed by one summary event.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        decoder = threading.Thread(target=self._decode, args=(loop, queue), name="video-decode", daemon=True)
+        inflight = deque()
+        started = time.perf_counter()
+        processed = 0
+        total_people = 0
+        max_people = 0
+
+        decoder.start()
+        try:
+            finished = False
+            while not finished or inflight:
+                # Keep the scheduler fed until the in-flight window is full
+                while not finished and len(inflight) < self.max_inflight:
+                    item = await queue.get()
+                    if item is _END_OF_STREAM:
+                        finished = True
+                        break
+                    if isinstance(item, Exception):
+                        logger.error(f"Video decoding failed for {self.source}: {item}")
+                        yield {"event": "error", "message": str(item)}
+                        finished = True
+                        break
+                    inflight.append(asyncio.create_task(self._infer(*item)))
+                    if queue.empty() and inflight:
+                        break
+
+                if inflight:
+                    event = await inflight.popleft()
+                    processed += 1
+                    total_people += event["people_count"]
+                    max_people = max(max_people, event["people_count"])
+                    yield event
+
+            yield {
+                "event": "summary",
+                "frames_read": self.frames_read,
+                "frames_processed": processed,
+                "max_people": max_people,
+                "avg_people": round(total_people / processed, 3) if processed else 0.0,
+                "elapsed_s": round(time.perf_counter() - started, 3),
+            }
+        finally:
+            self._stop.set()
+            for task in inflight:
+                task.cancel()
+            # Keep draining so a decoder blocked on a full queue can observe the stop flag
+            deadline = time.monotonic() + 5
+            while decoder.is_alive() and time.monotonic() < deadline:
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.sleep(0.01)
+            logger.info(f"Video pipeline finished: {processed} frame(s) processed, {self.frames_read} read")
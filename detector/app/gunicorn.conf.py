@@ -0,0 +1,47 @@
+"""
+Gunicorn settings for serving the detector with several worker processes:
+
+    gunicorn main:app -c gunicorn.conf.py
+
+The app is imported once in the master (`preload_app`), which then opens and checks
+the model a single time (`when_ready`). The workers forked from it share the imported
+libraries and, with the ultralytics engine, the model weights (copy-on-write). Each
+worker opens its own ONNX Runtime session at startup, from the page-cached model file.
+"""
+import os
+
+bind = os.getenv("DETECTOR_BIND", "0.0.0.0:6868")
+workers = max(1, int(os.getenv("DETECTOR_WORKERS", 1)))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Opening the model (and warming it up with ENGINE_WARMUP_WAIT) happens before a worker's first heartbeat
+timeout = int(os.getenv("DETECTOR_WORKER_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("DETECTOR_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+accesslog = None
+
+# Pins each worker to its own slice of the CPUs, so their inference threads never share a core
+CPU_AFFINITY = os.getenv("DETECTOR_CPU_AFFINITY", "false").lower() in ("1", "true", "yes")
+
+
+def when_ready(server):
+    # Runs in the master once the app is imported and before the first worker is forked
+    from api.v1.detect import runtime
+
+    runtime.preload()
+
+
+def pre_fork(server, worker):
+    # Slots freed by dead workers are handed to their replacements
+    taken = {getattr(w, "cpu_slot", None) for w in server.WORKERS.values()}
+    worker.cpu_slot = min(slot for slot in range(workers + 1) if slot not in taken)
+
+
+def post_fork(server, worker):
+    if not CPU_AFFINITY or not hasattr(os, "sched_setaffinity"):
+        return
+    cpus = sorted(os.sched_getaffinity(0))
+    share = max(1, len(cpus) // workers)
+    start = (worker.cpu_slot % workers) * share
+    os.sched_setaffinity(0, cpus[start:start + share] or cpus)
+    server.log.info(f"Worker {worker.pid} pinned to CPUs {cpus[start:start + share] or cpus}")
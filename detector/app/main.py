@@ -1,10 +1,33 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+import time
 
-from api.v1.detect import router as detector_router
+# Importing the app and the libraries it needs is the first phase of the startup breakdown
+_import_started = time.perf_counter()
+
+import os  # noqa: E402
+from contextlib import asynccontextmanager  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.middleware.cors import CORSMiddleware  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from api.v1.detect import router as detector_router, batcher, pool, runtime  # noqa: E402
+from core.executor import QueueFullError  # noqa: E402
+from core.runtime import NotReadyError  # noqa: E402
+from core.models import ResponseFormat  # noqa: E402
+from core.metrics import MetricsMiddleware, metrics_endpoint, queue_gauge  # noqa: E402
+from core.tracing import TracingMiddleware, TRACING_ENABLED  # noqa: E402
+
+runtime.record("import", round((time.perf_counter() - _import_started) * 1000, 3))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The model is loaded here, on the inference threads, rather than on import; under gunicorn
+    # it was opened in the master and this freshly forked worker opens its own session
+    await runtime.start()
+    yield
+    await runtime.stop()
 
 # Init FastAPI
-app = FastAPI(title="Person Detector API")
+app = FastAPI(title="Person Detector API", lifespan=lifespan)
 
 # Setup CORS
 app.add_middleware(
@@ -14,9 +37,68 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+if TRACING_ENABLED:
+    # Added last so it runs first: the metrics and handlers of a request see its trace
+    app.add_middleware(TracingMiddleware)
+
+# Prometheus scrape endpoint; queue depths are read at scrape time
+app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+queue_gauge("batch_queue", lambda: batcher.stats()["queue_depth"])
+queue_gauge("inflight_batches", lambda: batcher.stats()["inflight_batches"])
+queue_gauge("inference_pending", lambda: pool.stats()["pending"])
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    return JSONResponse(
+        content=ResponseFormat(
+            status="error",
+            message="Detector is busy, please retry later",
+            data=None
+        ).dict(),
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(NotReadyError)
+async def not_ready_handler(request: Request, exc: NotReadyError):
+    return JSONResponse(
+        content=ResponseFormat(
+            status="error",
+            message="Detector is warming up, please retry later",
+            data=None
+        ).dict(),
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 app.include_router(detector_router, prefix="/api/v1/detect", tags=["Person Detection"])
 
+@app.get("/live")
+async def live():
+    """
+    Liveness: the worker's event loop is answering.
+    """
+    return {"status": "success", "message": "Detector is alive", "data": {"pid": os.getpid()}}
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness: the model is loaded and warmed up and the worker is not shutting down.
+    Answered by whichever worker received the request.
+    """
+    data = runtime.stats()
+    if runtime.engine is not None:
+        data.update({"engine": runtime.engine.name, "device": runtime.engine.device})
+    return JSONResponse(
+        content=ResponseFormat(
+            status="success" if runtime.ready else "error",
+            message="Detector is ready" if runtime.ready else "Detector is not ready",
+            data=data
+        ).dict(),
+        status_code=200 if runtime.ready else 503
+    )
+
 @app.get("/")
 async def root():
     return {"status": "success", "message": "Welcome to the Person Detection API!", "data": None}
@@ -0,0 +1,59 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# The detector imports its modules as `core.*` from detector/app, like uvicorn does in the image
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, APP_DIR)
+os.environ.setdefault("LOG_FILE", "")
+
+
+class StubEngine:
+    """
+    Stands in for the InferenceEngine: one fixed detection per image, in model input coordinates.
+    """
+
+    name = "stub"
+    device = "cpu"
+
+    def __init__(self):
+        self.batches = []
+
+    def class_index(self, class_name: str) -> int:
+        return 0
+
+    def predict(self, imgs, class_index, conf):
+        self.batches.append(len(imgs))
+        return [np.array([[10, 20, 110, 220, 0.9, class_index]], dtype=np.float32) for _ in imgs]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """
+    A TestClient on the detector app, with the model replaced by `StubEngine` and
+    the runtime reported ready. `client.engine` is the stub.
+    """
+    from fastapi.testclient import TestClient
+    import main
+
+    runtime = main.runtime
+    engine = StubEngine()
+
+    async def start():
+        runtime.engine = engine
+        runtime.batcher.model = engine
+        runtime.state = "ready"
+        await runtime.batcher.start()
+
+    async def stop():
+        # The pool is shared by every test of the session, so it is not shut down
+        await runtime.batcher.stop()
+        runtime.engine = None
+        runtime.state = "pending"
+
+    monkeypatch.setattr(runtime, "start", start)
+    monkeypatch.setattr(runtime, "stop", stop)
+    with TestClient(main.app) as test_client:
+        test_client.engine = engine
+        yield test_client
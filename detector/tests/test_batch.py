@@ -0,0 +1,113 @@
+import io
+import tarfile
+import zipfile
+import cv2
+import numpy as np
+import pytest
+from core.archive import extract_images, is_archive
+
+
+def jpeg(shade: int = 127) -> bytes:
+    return cv2.imencode(".jpg", np.full((120, 160, 3), shade, np.uint8))[1].tobytes()
+
+
+def zip_bytes(members: dict, compression=zipfile.ZIP_DEFLATED) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def tar_bytes(members: dict, mode: str = "w:gz") -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("pack", [zip_bytes, tar_bytes])
+def test_extract_images_keeps_order_and_skips_other_members(pack):
+    contents = pack({"frames/b.jpg": b"B", "readme.txt": b"not an image", "a.PNG": b"A"})
+
+    assert extract_images(contents) == [("b.jpg", b"B"), ("a.PNG", b"A")]
+
+
+@pytest.mark.parametrize("pack", [zip_bytes, tar_bytes])
+def test_extract_images_limits(pack):
+    contents = pack({f"{i}.jpg": bytes(100) for i in range(3)})
+
+    with pytest.raises(ValueError, match="more than 2 images"):
+        extract_images(contents, max_files=2)
+    with pytest.raises(ValueError, match="larger than 99 bytes"):
+        extract_images(contents, max_member_bytes=99)
+    with pytest.raises(ValueError, match="contents are larger than 250 bytes"):
+        extract_images(contents, max_total_bytes=250)
+    assert len(extract_images(contents, max_files=3, max_member_bytes=100, max_total_bytes=300)) == 3
+
+
+def test_extract_images_stops_a_zip_bomb_without_inflating_it():
+    # 64 MB of zeros compress to about 64 KB
+    bomb = zip_bytes({"bomb.jpg": bytes(64 * 1024 * 1024)})
+
+    with pytest.raises(ValueError, match="larger than"):
+        extract_images(bomb, max_member_bytes=1024 * 1024)
+
+
+def test_extract_images_rejects_corrupt_archives():
+    with pytest.raises(ValueError):
+        extract_images(zip_bytes({"a.jpg": b"A"})[:-30] + b"garbage")
+    with pytest.raises(ValueError):
+        extract_images(b"neither zip nor tar")
+
+
+def test_is_archive():
+    assert is_archive("frames.tar.gz")
+    assert is_archive("upload", "application/zip")
+    assert not is_archive("photo.jpg", "image/jpeg")
+
+
+def test_batch_endpoint_keeps_input_order(client):
+    files = [("files", ("first.jpg", jpeg(10), "image/jpeg")),
+             ("files", ("frames.zip", zip_bytes({"second.jpg": jpeg(20), "third.jpg": jpeg(30)}), "application/zip"))]
+
+    response = client.post("/api/v1/detect/batch", files=files)
+
+    assert response.status_code == 200
+    results = response.json()["data"]["results"]
+    assert [result["filename"] for result in results] == ["first.jpg", "second.jpg", "third.jpg"]
+    assert all(len(result["detections"]) == 1 for result in results)
+
+
+def test_batch_endpoint_rejects_oversized_archives(client):
+    from core.archive import ARCHIVE_MAX_MEMBER_BYTES
+
+    bomb = zip_bytes({"bomb.jpg": bytes(ARCHIVE_MAX_MEMBER_BYTES + 1)})
+
+    response = client.post("/api/v1/detect/batch", files={"archive": ("bomb.zip", bomb, "application/zip")})
+
+    assert response.status_code == 400
+    assert f"larger than {ARCHIVE_MAX_MEMBER_BYTES} bytes" in response.json()["message"]
+    assert client.engine.batches == []
+
+
+def test_batch_holds_a_slot_per_image(client):
+    import main
+
+    pool = main.pool
+    # Room for the request's first image but not for the other two
+    taken = pool.admit(pool.max_pending - 2)
+    try:
+        files = [("files", (f"{i}.jpg", jpeg(i), "image/jpeg")) for i in range(3)]
+        rejected = client.post("/api/v1/detect/batch", files=files)
+    finally:
+        pool.release(taken)
+    accepted = client.post("/api/v1/detect/batch", files=files)
+
+    assert rejected.status_code == 503
+    assert "Retry-After" in rejected.headers
+    assert accepted.status_code == 200
+    assert pool.stats()["pending"] == 0
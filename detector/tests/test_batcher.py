@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import numpy as np
+import pytest
+from core.batcher import BatchScheduler
+from core.executor import InferencePool
+
+
+class FakeEngine:
+    """
+    Stands in for an InferenceEngine: each image is a number, and its only detection
+    carries that number as the confidence, so results can be matched to callers.
+    """
+
+    device = "cpu"
+
+    def __init__(self, fail: bool = False, delay: float = 0.0):
+        self.fail = fail
+        self.delay = delay
+        self.calls = []
+        self.release = threading.Event()
+
+    def class_index(self, class_name: str) -> int:
+        return 0
+
+    def predict(self, imgs, class_index, conf):
+        self.calls.append((list(imgs), conf))
+        if self.delay:
+            self.release.wait(self.delay)
+        if self.fail:
+            raise ValueError("model exploded")
+        return [np.array([[0, 0, 1, 1, img, class_index]], dtype=np.float32) for img in imgs]
+
+
+def run_scheduler(engine, scenario, **options):
+    async def main():
+        pool = InferencePool(workers=1, max_pending=64)
+        scheduler = BatchScheduler(engine, pool, **options)
+        await scheduler.start()
+        try:
+            return await scenario(scheduler)
+        finally:
+            await scheduler.stop()
+            pool.shutdown()
+    return asyncio.run(main())
+
+
+def test_requests_within_the_window_share_one_batch():
+    engine = FakeEngine()
+
+    async def scenario(scheduler):
+        return await asyncio.gather(*(scheduler.submit(i) for i in range(4)))
+
+    results = run_scheduler(engine, scenario, max_batch_size=8, window_ms=50)
+
+    assert [call[0] for call in engine.calls] == [[0, 1, 2, 3]]
+    # Every caller only gets the result of its own image
+    assert [result[0][0, 4] for result in results] == [0, 1, 2, 3]
+
+
+def test_batches_are_capped_at_max_batch_size():
+    engine = FakeEngine()
+
+    async def scenario(scheduler):
+        return await scheduler.submit_many(list(range(5)))
+
+    results = run_scheduler(engine, scenario, max_batch_size=2, window_ms=20)
+
+    assert [len(call[0]) for call in engine.calls] == [2, 2, 1]
+    assert [result[0, 4] for result in results] == [0, 1, 2, 3, 4]
+    assert [item for call in engine.calls for item in call[0]] == [0, 1, 2, 3, 4]
+
+
+def test_requests_with_different_thresholds_are_not_mixed():
+    engine = FakeEngine()
+
+    async def scenario(scheduler):
+        return await asyncio.gather(scheduler.submit(1, conf=0.5), scheduler.submit(2, conf=0.25),
+                                    scheduler.submit(3, conf=0.5))
+
+    results = run_scheduler(engine, scenario, max_batch_size=8, window_ms=50)
+
+    assert sorted((call[1], call[0]) for call in engine.calls) == [(0.25, [2]), (0.5, [1, 3])]
+    assert [result[0][0, 4] for result in results] == [1, 2, 3]
+
+
+def test_failed_batch_fails_every_caller():
+    engine = FakeEngine(fail=True)
+
+    async def scenario(scheduler):
+        return await asyncio.gather(scheduler.submit(1), scheduler.submit(2), return_exceptions=True)
+
+    results = run_scheduler(engine, scenario, max_batch_size=8, window_ms=50)
+
+    assert len(engine.calls) == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_queue_grows_into_larger_batches_while_the_worker_is_busy():
+    engine = FakeEngine(delay=5)
+
+    async def scenario(scheduler):
+        first = asyncio.ensure_future(scheduler.submit(0))
+        await asyncio.sleep(0.05)
+        rest = asyncio.ensure_future(asyncio.gather(*(scheduler.submit(i) for i in range(1, 4))))
+        await asyncio.sleep(0.05)
+        stats = scheduler.stats()
+        engine.release.set()
+        await first
+        await rest
+        return stats
+
+    stats = run_scheduler(engine, scenario, max_batch_size=8, window_ms=0)
+
+    assert stats["queue_depth"] == 3
+    assert [call[0] for call in engine.calls] == [[0], [1, 2, 3]]
+
+
+def test_stop_fails_requests_still_queued():
+    engine = FakeEngine(delay=5)
+
+    async def main():
+        pool = InferencePool(workers=1, max_pending=64)
+        scheduler = BatchScheduler(engine, pool, max_batch_size=1, window_ms=0)
+        running = asyncio.ensure_future(scheduler.submit(0))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(scheduler.submit(1))
+        await asyncio.sleep(0.05)
+        engine.release.set()
+        await scheduler.stop()
+        pool.shutdown()
+        return await asyncio.gather(running, queued, return_exceptions=True)
+
+    running, queued = asyncio.run(main())
+
+    assert running[0][0, 4] == 0
+    with pytest.raises(RuntimeError, match="stopped"):
+        raise queued
@@ -0,0 +1,94 @@
+import os
+import asyncio
+import threading
+from core import cache as cache_module
+from core.cache import ResultCache, make_cache_key
+
+
+def detections(count: int) -> list:
+    return [[10, 20, 110, 220, 0.9, 0] for _ in range(count)]
+
+
+def disk_files(directory: str, suffix: str = ".json") -> list:
+    return sorted(name for _, _, names in os.walk(directory) for name in names if name.endswith(suffix))
+
+
+def test_key_depends_on_bytes_and_parameters():
+    key = make_cache_key(b"image", "person", 0.5, "v1")
+
+    assert key == make_cache_key(b"image", "person", 0.5, "v1")
+    assert key != make_cache_key(b"other", "person", 0.5, "v1")
+    assert key != make_cache_key(b"image", "person", 0.6, "v1")
+    assert key != make_cache_key(b"image", "person", 0.5, "v2")
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2, ttl=0)
+    cache.put("a", detections(1))
+    cache.put("b", detections(1))
+    cache.get("a")
+    cache.put("c", detections(1))
+
+    assert cache.get("b") is None
+    assert cache.get("a") == detections(1)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    cache = ResultCache(ttl=10)
+    cache.put("a", detections(1))
+
+    now[0] += 11
+
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    ResultCache(directory=str(tmp_path), ttl=0).put("ab12", detections(2))
+
+    cache = ResultCache(directory=str(tmp_path), ttl=0)
+
+    assert asyncio.run(cache.get_async("ab12")) == detections(2)
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_concurrent_writes_of_one_key_leave_no_temporary_files(tmp_path):
+    cache = ResultCache(directory=str(tmp_path), ttl=0)
+    threads = [threading.Thread(target=cache._write_disk, args=("ab12", f"[{i}]")) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert disk_files(str(tmp_path)) == ["ab12.json"]
+    assert disk_files(str(tmp_path), ".tmp") == []
+    assert cache._read_disk("ab12") in [[i] for i in range(16)]
+
+
+def test_disk_tier_removes_oldest_entries_past_its_cap(tmp_path):
+    entry_bytes = len(ResultCache()._put_memory("x", detections(8)))
+    cache = ResultCache(directory=str(tmp_path), ttl=0, disk_max_bytes=entry_bytes * 4)
+    for i in range(6):
+        key = f"{i:02d}key"
+        cache.put(key, detections(8))
+        # Distinct modification times, oldest first
+        os.utime(cache._disk_path(key), (1000 + i, 1000 + i))
+
+    stats = cache.stats()
+    assert stats["disk_bytes"] <= entry_bytes * 4
+    assert stats["disk_evictions"] >= 2
+    remaining = disk_files(str(tmp_path))
+    assert "05key.json" in remaining and "00key.json" not in remaining
+
+
+def test_sweep_removes_expired_entries(tmp_path):
+    cache = ResultCache(directory=str(tmp_path), ttl=10)
+    cache.put("ab12", detections(1))
+    os.utime(cache._disk_path("ab12"), (0, 0))
+
+    cache.sweep_disk()
+
+    assert disk_files(str(tmp_path)) == []
+    assert cache.stats()["disk_bytes"] == 0
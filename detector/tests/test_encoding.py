@@ -0,0 +1,54 @@
+import json
+import msgpack
+import numpy as np
+import pytest
+from core.encoding import Detections, negotiate, encode_response, JSON, COLUMNAR_JSON, MSGPACK
+
+
+@pytest.fixture
+def detections():
+    return Detections(np.array([[10, 20, 110, 220], [5, 6, 7, 8]]), np.array([0.91, 0.5]), "person")
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, JSON),
+    ("*/*", JSON),
+    ("text/html", JSON),
+    (COLUMNAR_JSON, COLUMNAR_JSON),
+    (f"{MSGPACK}, {COLUMNAR_JSON};q=0.9, application/json;q=0.5", MSGPACK),
+    (f"{MSGPACK};q=0.2, {COLUMNAR_JSON};q=0.9", COLUMNAR_JSON),
+    (f"{MSGPACK};q=0, application/json", JSON),
+    (f"{COLUMNAR_JSON};q=bad, application/json;q=0.1", JSON),
+])
+def test_negotiate(accept, expected):
+    assert negotiate(accept) == expected
+
+
+def decode(response):
+    if response.media_type == MSGPACK:
+        return msgpack.unpackb(response.body, raw=False)
+    return json.loads(response.body)
+
+
+@pytest.mark.parametrize("media_type", [JSON, COLUMNAR_JSON, MSGPACK])
+def test_encode_response_round_trip(detections, media_type):
+    response = encode_response({"data": {"people_count": len(detections), "detections": detections}}, media_type)
+
+    assert response.media_type == media_type
+    assert response.headers["vary"] == "Accept"
+    data = decode(response)["data"]
+    assert data["people_count"] == 2
+    decoded = Detections.from_payload(data["detections"])
+    np.testing.assert_array_equal(decoded.boxes, detections.boxes)
+    np.testing.assert_array_equal(decoded.confidence, detections.confidence)
+    assert decoded.class_name == "person"
+
+
+def test_encode_response_batch_and_empty(detections):
+    empty = Detections(np.empty((0, 4)), np.empty(0))
+    response = encode_response({"data": {"results": [{"detections": detections}, {"detections": empty}]}}, MSGPACK)
+
+    results = decode(response)["data"]["results"]
+    assert len(Detections.from_payload(results[0]["detections"])) == 2
+    assert len(Detections.from_payload(results[1]["detections"])) == 0
+    assert Detections.from_payload([]).boxes.shape == (0, 4)
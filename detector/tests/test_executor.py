@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import cv2
+import numpy as np
+import pytest
+from core.executor import InferencePool, QueueFullError
+
+
+@pytest.fixture
+def pool():
+    pool = InferencePool(workers=2, max_pending=4, retry_after=7)
+    yield pool
+    pool.shutdown()
+
+
+def test_admit_and_release(pool):
+    assert pool.admit() == 1
+    assert pool.admit(2) == 2
+    assert pool.stats()["pending"] == 3
+
+    with pytest.raises(QueueFullError) as rejected:
+        pool.admit(2)
+    assert rejected.value.retry_after == 7
+    assert pool.stats()["rejected"] == 1
+
+    pool.release(2)
+    pool.release()
+    assert pool.stats()["pending"] == 0
+    assert pool.stats()["admitted"] == 3
+
+
+def test_admit_caps_requests_larger_than_the_queue(pool):
+    # A batch larger than the whole queue takes all of it once the queue is empty
+    assert pool.admit(10) == 4
+    with pytest.raises(QueueFullError):
+        pool.admit()
+    pool.release(4)
+    assert pool.admit(0) == 0
+
+
+def test_release_never_goes_negative(pool):
+    pool.release(3)
+    assert pool.stats()["pending"] == 0
+
+
+def test_run_uses_the_inference_threads(pool):
+    async def main():
+        names = await asyncio.gather(*(pool.run(lambda: threading.current_thread().name) for _ in range(4)))
+        return set(names)
+
+    assert all(name.startswith("inference") for name in asyncio.run(main()))
+
+
+def jpeg(width: int = 320, height: int = 240) -> bytes:
+    return cv2.imencode(".jpg", np.full((height, width, 3), 127, np.uint8))[1].tobytes()
+
+
+def test_detect_answers_503_with_retry_after_when_the_pool_is_full(client):
+    import main
+
+    taken = main.pool.admit(main.pool.max_pending)
+    try:
+        response = client.post("/api/v1/detect", files={"file": ("a.jpg", jpeg(), "image/jpeg")})
+    finally:
+        main.pool.release(taken)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(main.pool.retry_after)
+    assert response.json()["status"] == "error"
+    assert client.engine.batches == []
+
+
+def test_detect_releases_its_slot(client):
+    import main
+
+    response = client.post("/api/v1/detect", files={"file": ("b.jpg", jpeg(330), "image/jpeg")})
+
+    assert response.status_code == 200
+    assert len(response.json()["data"]["detections"]) == 1
+    assert main.pool.stats()["pending"] == 0
@@ -0,0 +1,49 @@
+import numpy as np
+from core.postprocess import nms, box_iou, box_ios
+
+
+def test_box_iou_and_ios():
+    box = np.array([0, 0, 10, 10], dtype=np.float32)
+    boxes = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30], [0, 0, 5, 5]], dtype=np.float32)
+
+    np.testing.assert_allclose(box_iou(box, boxes), [1.0, 50 / 150, 0.0, 0.25])
+    # A box inside another overlaps it completely by the smaller area
+    np.testing.assert_allclose(box_ios(box, boxes), [1.0, 0.5, 0.0, 1.0])
+
+
+def test_nms_keeps_best_of_overlapping_boxes():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [50, 50, 60, 60]], dtype=np.float32)
+    scores = np.array([0.8, 0.9, 0.7], dtype=np.float32)
+
+    keep = nms(boxes, scores, iou_threshold=0.5)
+
+    assert keep.tolist() == [1, 2]
+    assert keep.dtype == np.int64
+
+
+def test_nms_respects_max_detections_and_empty_input():
+    boxes = np.array([[0, 0, 10, 10], [20, 0, 30, 10], [40, 0, 50, 10]], dtype=np.float32)
+    scores = np.array([0.5, 0.9, 0.7], dtype=np.float32)
+
+    assert nms(boxes, scores, iou_threshold=0.5, max_detections=2).tolist() == [1, 2]
+    assert nms(np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32)).tolist() == []
+
+
+def test_nms_groups_only_suppress_other_groups():
+    boxes = np.array([[0, 0, 10, 10], [0, 0, 10, 9], [0, 0, 10, 8]], dtype=np.float32)
+    scores = np.array([0.9, 0.8, 0.7], dtype=np.float32)
+
+    # Boxes of the same tile were already suppressed by the model and are kept
+    keep = nms(boxes, scores, iou_threshold=0.5, groups=np.array([0, 0, 1]))
+
+    assert keep.tolist() == [0, 1]
+
+
+def test_nms_with_ios_merges_box_cut_at_tile_border():
+    whole = [0, 0, 100, 200]
+    cut = [0, 0, 100, 60]
+    boxes = np.array([whole, cut], dtype=np.float32)
+    scores = np.array([0.9, 0.8], dtype=np.float32)
+
+    assert nms(boxes, scores, iou_threshold=0.6).tolist() == [0, 1]
+    assert nms(boxes, scores, iou_threshold=0.6, overlap=box_ios).tolist() == [0]
@@ -0,0 +1,59 @@
+import importlib
+import cv2
+import numpy as np
+import pytest
+from core.preprocess import decode_image, jpeg_size, letterbox, preprocess, restore_boxes
+
+# `core` re-exports the `preprocess` function under the module's name
+preprocess_module = importlib.import_module("core.preprocess")
+
+
+def jpeg(width: int, height: int) -> bytes:
+    return cv2.imencode(".jpg", np.full((height, width, 3), 90, np.uint8))[1].tobytes()
+
+
+def test_jpeg_size_reads_the_header():
+    assert jpeg_size(jpeg(1920, 1080)) == (1920, 1080)
+    assert jpeg_size(b"\x89PNG not a jpeg") is None
+
+
+def test_letterbox_keeps_aspect_ratio_and_centres_the_image():
+    img = np.full((300, 600, 3), 255, np.uint8)
+
+    padded, ratio, pad = letterbox(img, 640)
+
+    assert padded.shape == (640, 640, 3)
+    assert ratio == pytest.approx(640 / 600)
+    assert pad == (0, 160)
+    assert (padded[:pad[1]] == 114).all() and (padded[pad[1] + 320:] == 114).all()
+    assert (padded[pad[1]:pad[1] + 320] == 255).all()
+
+
+def test_restore_boxes_undoes_letterbox_and_reduced_decode(monkeypatch):
+    monkeypatch.setattr(preprocess_module, "PREPROCESS_LETTERBOX", True)
+    contents = jpeg(4000, 2000)
+
+    img, transform = preprocess(contents, 640)
+
+    # 4000 px wide decodes at 1/4 (1000 px), then letterboxes to 640 x 320 plus 160 px of padding
+    assert img.shape == (640, 640, 3)
+    assert transform["scale"] == (4.0, 4.0)
+    assert transform["pad"] == (0, 160)
+    model_box = np.array([[64, 160 + 32, 320, 160 + 320]], np.float32)
+    np.testing.assert_allclose(restore_boxes(model_box, transform), [[400, 200, 2000, 2000]], rtol=1e-5)
+
+
+def test_restore_boxes_clips_to_the_original_image():
+    transform = {"scale": (1.0, 1.0), "size": (200, 100), "ratio": 0.5, "pad": (10, 20)}
+
+    restored = restore_boxes([[0, 0, 150, 90]], transform)
+
+    np.testing.assert_allclose(restored, [[0, 0, 200, 100]])
+
+
+def test_small_images_are_decoded_at_full_resolution():
+    img, scale = decode_image(jpeg(320, 240), 640)
+
+    assert img.shape == (240, 320, 3)
+    assert scale == (1.0, 1.0)
+    assert decode_image(b"not an image") == (None, None)
@@ -0,0 +1,39 @@
+import numpy as np
+from core.tiling import tile_grid
+
+
+def covered(tiles, width, height):
+    mask = np.zeros((height, width), dtype=bool)
+    for x0, y0, x1, y1 in tiles.tolist():
+        mask[y0:y1, x0:x1] = True
+    return mask.all()
+
+
+def test_tile_grid_covers_image_with_full_size_tiles():
+    tiles = tile_grid(1920, 1080, 640, 0.2)
+
+    assert tiles.shape == (4 * 2, 4)
+    assert covered(tiles, 1920, 1080)
+    assert ((tiles[:, 2] - tiles[:, 0]) == 640).all()
+    assert ((tiles[:, 3] - tiles[:, 1]) == 640).all()
+    # The last row and column are aligned to the image edge
+    assert tiles[:, 2].max() == 1920 and tiles[:, 3].max() == 1080
+
+
+def test_tile_grid_overlap():
+    tiles = tile_grid(1000, 500, 500, 0.5)
+
+    assert sorted(set(tiles[:, 0].tolist())) == [0, 250, 500]
+    assert set(tiles[:, 1].tolist()) == {0}
+
+
+def test_tile_grid_image_smaller_than_tile():
+    tiles = tile_grid(300, 200, 640, 0.2)
+
+    assert tiles.tolist() == [[0, 0, 300, 200]]
+
+
+def test_tile_grid_zero_overlap_exact_fit():
+    tiles = tile_grid(1280, 640, 640, 0.0)
+
+    assert tiles.tolist() == [[0, 0, 640, 640], [640, 0, 1280, 640]]
@@ -0,0 +1,62 @@
+import os
+import asyncio
+import pytest
+from api.v1 import detect
+
+
+@pytest.fixture
+def allowlist(monkeypatch, tmp_path):
+    named, hosts = detect._parse_stream_allowlist(
+        " lobby = rtsp://cam1.internal/stream , media.example.com,cam2.example.com:8554,")
+    monkeypatch.setattr(detect, "_NAMED_STREAMS", named)
+    monkeypatch.setattr(detect, "_STREAM_HOSTS", hosts)
+    monkeypatch.setattr(detect, "VIDEO_SOURCE_DIR", str(tmp_path / "videos"))
+    os.makedirs(tmp_path / "videos")
+    (tmp_path / "videos" / "clip.mp4").write_bytes(b"video")
+    (tmp_path / "secret.mp4").write_bytes(b"video")
+    return tmp_path
+
+
+def test_parse_stream_allowlist():
+    named, hosts = detect._parse_stream_allowlist("lobby=rtsp://cam1/stream, Media.Example.com ,,")
+
+    assert named == {"lobby": "rtsp://cam1/stream"}
+    assert hosts == {"media.example.com"}
+
+
+def test_named_streams_and_listed_hosts_are_accepted(allowlist):
+    assert detect._resolve_video_source("lobby") == "rtsp://cam1.internal/stream"
+    assert detect._resolve_video_source("https://MEDIA.example.com/live.m3u8") == "https://MEDIA.example.com/live.m3u8"
+    assert detect._resolve_video_source("rtsp://cam2.example.com:8554/a") == "rtsp://cam2.example.com:8554/a"
+    assert detect._resolve_video_source("clip.mp4") == str(allowlist / "videos" / "clip.mp4")
+
+
+@pytest.mark.parametrize("source", [
+    "rtsp://cam1.internal/stream",
+    "http://169.254.169.254/latest/meta-data",
+    "rtsp://cam2.example.com:554/a",
+    "../secret.mp4",
+    "/etc/passwd",
+    "missing.mp4",
+])
+def test_other_sources_are_rejected(allowlist, source):
+    with pytest.raises(ValueError):
+        detect._resolve_video_source(source)
+
+
+def test_disallowed_source_is_a_400_and_frees_its_slots(client, allowlist):
+    response = client.post("/api/v1/detect/video", params={"source": "http://169.254.169.254/"})
+
+    assert response.status_code == 400
+    assert detect.pool.stats()["pending"] == 0
+    assert not detect._video_streams.locked()
+
+
+def test_stream_limit_is_a_503(client, monkeypatch):
+    monkeypatch.setattr(detect, "_video_streams", asyncio.Semaphore(0))
+
+    response = client.post("/api/v1/detect/video", params={"source": "lobby"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(detect.pool.retry_after)
+    assert detect.pool.stats()["pending"] == 0
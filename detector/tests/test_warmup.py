@@ -0,0 +1,45 @@
+import cv2
+import numpy as np
+import pytest
+from core import runtime as runtime_module
+
+
+def jpeg(shade: int = 127) -> bytes:
+    return cv2.imencode(".jpg", np.full((64, 64, 3), shade, np.uint8))[1].tobytes()
+
+
+@pytest.mark.parametrize("state", ["loading", "warming_up"])
+def test_detect_is_a_503_until_warmed_up(client, monkeypatch, state):
+    import main
+
+    monkeypatch.setattr(main.runtime, "state", state)
+
+    response = client.post("/api/v1/detect", files={"file": ("cold.jpg", jpeg(11), "image/jpeg")})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(main.pool.retry_after)
+    assert response.json()["message"] == "Detector is warming up, please retry later"
+    assert client.engine.batches == []
+    assert main.pool.stats()["pending"] == 0
+
+
+def test_failed_warmup_still_serves(client, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main.runtime, "state", "failed")
+
+    response = client.post("/api/v1/detect", files={"file": ("failed.jpg", jpeg(12), "image/jpeg")})
+
+    assert response.status_code == 200
+
+
+def test_detect_during_warmup_opt_out(client, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main.runtime, "state", "warming_up")
+    monkeypatch.setattr(runtime_module, "DETECT_DURING_WARMUP", True)
+
+    response = client.post("/api/v1/detect", files={"file": ("warm.jpg", jpeg(13), "image/jpeg")})
+
+    assert response.status_code == 200
+    assert client.engine.batches == [1]
@@ -0,0 +1,140 @@
+"""
+Compares model variants against the FP32 baseline on sample images.
+
+    python tools/benchmark.py app/model/yolo12s.onnx app/model/yolo12s.int8.onnx app/model/yolo12n.onnx \
+        --images ../experiment ../resource --runs 20 --output benchmark.json
+
+The first model is the baseline. For every model the report lists file size, load
+time, per-image latency (mean/p50/p95), single-stream throughput and how well its
+person detections agree with the baseline's (boxes matched at IoU >= --iou).
+Latency covers `engine.predict` (letterbox, inference, NMS), not JPEG decoding.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from core.engine import OnnxRuntimeEngine  # noqa: E402
+from core.postprocess import box_iou  # noqa: E402
+from quantize import find_images  # noqa: E402
+
+
+def match_detections(reference, candidate, iou_threshold: float) -> int:
+    """
+    Greedily matches candidate boxes to reference boxes, highest confidence first.
+    Returns:
+        int: The number of matched pairs.
+    """
+    if not len(reference) or not len(candidate):
+        return 0
+    unmatched = np.ones(len(reference), dtype=bool)
+    matches = 0
+    for box in candidate[np.argsort(-candidate[:, 4])]:
+        ious = np.where(unmatched, box_iou(box[:4], reference[:, :4]), 0)
+        best = int(np.argmax(ious))
+        if ious[best] >= iou_threshold:
+            unmatched[best] = False
+            matches += 1
+    return matches
+
+
+def benchmark_model(path: str, images: list, runs: int, conf: float, warmup: int):
+    started = time.perf_counter()
+    engine = OnnxRuntimeEngine(path)
+    load_ms = (time.perf_counter() - started) * 1000
+    class_index = engine.class_index("person")
+    engine.warmup(warmup)
+
+    latencies = []
+    detections = []
+    for img in images:
+        result = None
+        for _ in range(runs):
+            started = time.perf_counter()
+            result = engine.predict([img], class_index, conf)[0]
+            latencies.append((time.perf_counter() - started) * 1000)
+        detections.append(result)
+
+    latencies = np.asarray(latencies)
+    report = {
+        "model": path,
+        "size_mb": round(os.path.getsize(path) / 1024 / 1024, 2),
+        "precision": engine.info()["precision"],
+        "load_ms": round(load_ms, 1),
+        "latency_ms_mean": round(float(latencies.mean()), 2),
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 2),
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)), 2),
+        "throughput_ips": round(1000 / float(latencies.mean()), 2),
+    }
+    return report, detections
+
+
+def agreement(baseline: list, candidate: list, iou_threshold: float) -> dict:
+    matched = reference_total = candidate_total = same_count = 0
+    count_errors = []
+    for reference, result in zip(baseline, candidate):
+        matched += match_detections(reference, result, iou_threshold)
+        reference_total += len(reference)
+        candidate_total += len(result)
+        same_count += len(reference) == len(result)
+        count_errors.append(abs(len(reference) - len(result)))
+    precision = matched / candidate_total if candidate_total else 1.0
+    recall = matched / reference_total if reference_total else 1.0
+    return {
+        "box_precision": round(precision, 4),
+        "box_recall": round(recall, 4),
+        "box_f1": round(2 * precision * recall / (precision + recall), 4) if precision + recall else 0.0,
+        "count_exact_match": round(same_count / len(baseline), 4) if baseline else 1.0,
+        "count_mae": round(float(np.mean(count_errors)), 3) if count_errors else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("models", nargs="+", help="Baseline model first, then the variants to compare")
+    parser.add_argument("--images", nargs="+", default=["../experiment", "../resource"])
+    parser.add_argument("--max-images", type=int, default=None)
+    parser.add_argument("--runs", type=int, default=10, help="Timed runs per image")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--conf", type=float, default=0.5)
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU for a box to agree with the baseline")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    paths = find_images(args.images, args.max_images)
+    images = [img for img in (cv2.imread(path, cv2.IMREAD_COLOR) for path in paths) if img is not None]
+    if not images:
+        raise SystemExit(f"No images found in {args.images}")
+
+    reports = []
+    baseline = None
+    for path in args.models:
+        report, detections = benchmark_model(path, images, max(1, args.runs), args.conf, args.warmup)
+        if baseline is None:
+            baseline = detections
+        report["people_detected"] = int(sum(len(d) for d in detections))
+        report.update(agreement(baseline, detections, args.iou))
+        reports.append(report)
+
+    columns = ["model", "precision", "size_mb", "latency_ms_p50", "latency_ms_p95", "throughput_ips",
+               "people_detected", "box_f1", "count_exact_match"]
+    print(f"{len(images)} image(s), {args.runs} run(s) each, baseline: {args.models[0]}")
+    print("| " + " | ".join(columns) + " |")
+    print("|" + "---|" * len(columns))
+    for report in reports:
+        print("| " + " | ".join(str(report[column]) for column in columns) + " |")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"images": len(images), "runs": args.runs, "conf": args.conf, "iou": args.iou,
+                       "results": reports}, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Micro-benchmarks of the detector's per-image stages on sample images.
+
+    python tools/microbench.py app/model/yolo12s.onnx --images ../experiment ../resource \
+        --runs 50 --output microbench.json
+
+Stages measured, each on every image:
+- decode: `cv2.imdecode` of the encoded file at full resolution.
+- preprocess: reduced-resolution decode and letterbox, as done per request.
+- predict_and_detect: the async model call (letterbox, inference, NMS) on the preprocessed image.
+- decode_predictions: confidence filtering and NMS of the raw model output (ONNX Runtime engine only).
+- format_detections: box extraction into the API's dictionaries, mapped back to the original image.
+
+For each stage the report lists mean/p50/p95/p99 latency and throughput. It also
+records the resident memory after the stage and the process peak, in one JSON
+file whose keys stay stable, so reports of two releases can be diffed.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import platform
+import resource
+import argparse
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from core.engine import load_engine, OnnxRuntimeEngine  # noqa: E402
+from core.detector import predict_and_detect, format_detections  # noqa: E402
+from core.postprocess import decode_predictions  # noqa: E402
+from core.preprocess import preprocess  # noqa: E402
+from quantize import find_images  # noqa: E402
+
+
+def rss_mb() -> float:
+    """
+    Current resident set size; falls back to the peak where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024, 1)
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+
+
+def summarize(samples_ms: list) -> dict:
+    samples = np.asarray(samples_ms)
+    mean = float(samples.mean())
+    return {
+        "runs": int(samples.size),
+        "mean_ms": round(mean, 3),
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "p99_ms": round(float(np.percentile(samples, 99)), 3),
+        "ops_per_s": round(1000 / mean, 2) if mean else None,
+    }
+
+
+def measure(func, inputs: list, runs: int, warmup: int) -> dict:
+    """
+    Times `func(item)` `runs` times for every item, after `warmup` untimed calls per item.
+    """
+    samples = []
+    for item in inputs:
+        for _ in range(warmup):
+            func(item)
+        for _ in range(runs):
+            started = time.perf_counter()
+            func(item)
+            samples.append((time.perf_counter() - started) * 1000)
+    report = summarize(samples)
+    report["rss_mb"] = rss_mb()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model", help="Model file, loaded with the same engine selection as the service")
+    parser.add_argument("--images", nargs="+", default=["../experiment", "../resource"])
+    parser.add_argument("--max-images", type=int, default=None)
+    parser.add_argument("--runs", type=int, default=20, help="Timed runs per image and stage")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed runs per image and stage")
+    parser.add_argument("--conf", type=float, default=0.5)
+    parser.add_argument("--class-name", default="person")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    paths = find_images(args.images, args.max_images)
+    encoded = []
+    for path in paths:
+        with open(path, "rb") as f:
+            encoded.append(f.read())
+    if not encoded:
+        raise SystemExit(f"No images found in {args.images}")
+
+    engine = load_engine(args.model)
+    engine.warmup()
+    class_index = engine.class_index(args.class_name)
+    loop = asyncio.new_event_loop()
+    runs, warmup = max(1, args.runs), max(0, args.warmup)
+
+    prepared = [preprocess(contents) for contents in encoded]
+    prepared = [(img, transform) for img, transform in prepared if img is not None]
+    results = [loop.run_until_complete(predict_and_detect(engine, img, args.class_name, args.conf))
+               for img, _ in prepared]
+
+    stages = {
+        "decode": measure(lambda contents: cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR),
+                          encoded, runs, warmup),
+        "preprocess": measure(preprocess, encoded, runs, warmup),
+        "predict_and_detect": measure(
+            lambda item: loop.run_until_complete(predict_and_detect(engine, item[0], args.class_name, args.conf)),
+            prepared, runs, warmup),
+    }
+    if isinstance(engine, OnnxRuntimeEngine):
+        raw = [engine._run(engine._prepare([img])[0]).astype(np.float32, copy=False)[0] for img, _ in prepared]
+        stages["decode_predictions"] = measure(lambda output: decode_predictions(output, class_index, args.conf),
+                                               raw, runs, warmup)
+    stages["format_detections"] = measure(
+        lambda item: format_detections(item[0], args.class_name, item[1]),
+        [(result, transform) for result, (_, transform) in zip(results, prepared)], runs, warmup)
+    loop.close()
+
+    print(f"{len(encoded)} image(s), {runs} run(s) each, engine: {engine.name} on {engine.device}")
+    print("| stage | mean_ms | p50_ms | p95_ms | p99_ms | ops_per_s | rss_mb |")
+    print("|---|---|---|---|---|---|---|")
+    for name, stage in stages.items():
+        print(f"| {name} | {stage['mean_ms']} | {stage['p50_ms']} | {stage['p95_ms']} | {stage['p99_ms']} "
+              f"| {stage['ops_per_s']} | {stage['rss_mb']} |")
+
+    if args.output:
+        report = {
+            "model": args.model,
+            "engine": engine.info(),
+            "images": len(encoded),
+            "runs": runs,
+            "conf": args.conf,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": stages,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
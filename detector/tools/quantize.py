@@ -0,0 +1,168 @@
+"""
+Produces smaller/faster variants of the detector model.
+
+    # Smaller architecture (needs ultralytics and the .pt weights)
+    python tools/quantize.py export yolo12n.pt --imgsz 640
+
+    # FP16 copy of an ONNX model -> yolo12s.fp16.onnx
+    python tools/quantize.py fp16 app/model/yolo12s.onnx
+
+    # INT8, weights only -> yolo12s.int8.onnx
+    python tools/quantize.py int8 app/model/yolo12s.onnx
+
+    # INT8, weights and activations calibrated on sample images -> yolo12s.int8-static.onnx
+    python tools/quantize.py int8 app/model/yolo12s.onnx --static --calib-dir ../experiment ../resource
+
+Variants are written next to the source model with the variant name before the
+extension, which is what the detector's MODEL_VARIANT setting expects.
+"""
+import os
+import sys
+import glob
+import argparse
+import tempfile
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from core.preprocess import letterbox  # noqa: E402
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def variant_path(model_path: str, variant: str) -> str:
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.{variant}{ext}"
+
+
+def find_images(directories: list, limit: int = None) -> list:
+    paths = []
+    for directory in directories:
+        for path in sorted(glob.glob(os.path.join(directory, "**", "*"), recursive=True)):
+            if path.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(path)
+    return paths[:limit] if limit else paths
+
+
+def model_input(model_path: str):
+    import onnxruntime as ort
+
+    session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+    model_input = session.get_inputs()[0]
+    size = model_input.shape[2] if isinstance(model_input.shape[2], int) else 640
+    return model_input.name, size
+
+
+def load_calibration_tensor(path: str, size: int):
+    """
+    Prepares an image exactly like the detector does (letterbox, RGB, CHW, [0, 1]).
+    """
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    img, _, _ = letterbox(img, size)
+    return (img[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255)
+
+
+def export_model(args):
+    from ultralytics import YOLO
+
+    path = YOLO(args.weights).export(format="onnx", imgsz=args.imgsz, dynamic=args.dynamic, simplify=True)
+    print(f"Exported {args.weights} -> {path}")
+
+
+def convert_fp16(args):
+    import onnx
+    from onnxconverter_common import float16
+
+    output = args.output or variant_path(args.model, "fp16")
+    model = float16.convert_float_to_float16(onnx.load(args.model), keep_io_types=False)
+    onnx.save(model, output)
+    print(f"Wrote FP16 model: {output}")
+
+
+def quantize_int8(args):
+    from onnxruntime.quantization import (
+        CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_dynamic, quantize_static
+    )
+
+    if not args.static:
+        output = args.output or variant_path(args.model, "int8")
+        # uint8 weights keep ConvInteger runnable on the CPU execution provider
+        quantize_dynamic(args.model, output, weight_type=QuantType.QUInt8, op_types_to_quantize=args.op_types)
+        print(f"Wrote dynamically quantized INT8 model: {output}")
+        return
+
+    input_name, size = model_input(args.model)
+    images = find_images(args.calib_dir, args.max_images)
+    if not images:
+        raise SystemExit(f"No calibration images found in {args.calib_dir}")
+
+    class ImageReader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(images)
+
+        def get_next(self):
+            for path in self._paths:
+                tensor = load_calibration_tensor(path, size)
+                if tensor is not None:
+                    return {input_name: tensor}
+            return None
+
+    methods = {
+        "minmax": CalibrationMethod.MinMax,
+        "entropy": CalibrationMethod.Entropy,
+        "percentile": CalibrationMethod.Percentile,
+    }
+    output = args.output or variant_path(args.model, "int8-static")
+    with tempfile.TemporaryDirectory() as tmp:
+        # Shape inference + graph cleanup first, as recommended for static quantization
+        source = args.model
+        try:
+            from onnxruntime.quantization.shape_inference import quant_pre_process
+
+            source = os.path.join(tmp, "preprocessed.onnx")
+            quant_pre_process(args.model, source)
+        except Exception as e:
+            print(f"Skipping quantization pre-processing: {e}")
+            source = args.model
+        quantize_static(source, output, ImageReader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                        calibrate_method=methods[args.calib_method], op_types_to_quantize=args.op_types)
+    print(f"Wrote statically quantized INT8 model ({len(images)} calibration image(s)): {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Export ultralytics weights (e.g. a smaller yolo12n.pt) to ONNX")
+    export.add_argument("weights")
+    export.add_argument("--imgsz", type=int, default=640)
+    export.add_argument("--dynamic", action="store_true", help="Export with a dynamic batch axis")
+    export.set_defaults(func=export_model)
+
+    fp16 = commands.add_parser("fp16", help="Convert an ONNX model to FP16 (mainly useful on GPU)")
+    fp16.add_argument("model")
+    fp16.add_argument("--output")
+    fp16.set_defaults(func=convert_fp16)
+
+    int8 = commands.add_parser("int8", help="Quantize an ONNX model to INT8")
+    int8.add_argument("model")
+    int8.add_argument("--output")
+    int8.add_argument("--static", action="store_true", help="Calibrate activations on sample images")
+    int8.add_argument("--calib-dir", nargs="+", default=["../experiment", "../resource"])
+    int8.add_argument("--calib-method", choices=("minmax", "entropy", "percentile"), default="minmax")
+    int8.add_argument("--max-images", type=int, default=200)
+    # The detection head concatenates pixel-scale boxes with 0-1 class scores; quantizing that
+    # tensor with a single scale wipes out the scores, so only the heavy operators are quantized
+    int8.add_argument("--op-types", nargs="+", default=["Conv", "MatMul"], help="Operator types to quantize")
+    int8.set_defaults(func=quantize_int8)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -26,7 +26,7 @@ export default function DetectionResult({ result }) {
           <h3 className="text-lg font-semibold mb-2">Visualized Result</h3>
           <div className="border rounded p-1">
             <img 
-              src={`${process.env.NEXT_PUBLIC_API_URL}${result.result_image_url}`} 
+              src={`${process.env.NEXT_PUBLIC_API_URL}${result.result_image_url}?size=preview`} 
               alt="Detection Result" 
               className="w-full h-auto rounded"
             />
@@ -56,7 +56,7 @@ export default function HistoryTable({
         <table className="min-w-full bg-white rounded-lg overflow-hidden">
           <thead className="bg-gray-100">
             <tr>
-              {['ID', 'Date', 'Filename', 'People Count'].map(header => (
+              {['ID', 'Image', 'Date', 'Filename', 'People Count'].map(header => (
                 <th key={header} className="py-3 px-4 text-left text-xs font-semibold text-gray-600 uppercase tracking-wider border-b">
                   {header}
                 </th>
@@ -64,9 +64,17 @@ export default function HistoryTable({
             </tr>
           </thead>
           <tbody className="divide-y divide-gray-200">
-            {history.map(({ id, timestamp, original_filename, people_count }) => (
+            {history.map(({ id, timestamp, original_filename, people_count, result_image_url }) => (
               <tr key={id} className="hover:bg-gray-50 transition-colors duration-150">
                 <td className="py-3 px-4 text-sm font-medium text-gray-900">{id}</td>
+                <td className="py-2 px-4">
+                  <img
+                    src={`/api/images/${result_image_url.split('/').pop()}?size=thumb`}
+                    alt={original_filename}
+                    loading="lazy"
+                    className="h-12 w-16 object-cover rounded"
+                  />
+                </td>
                 <td className="py-3 px-4 text-sm text-gray-600">{new Date(timestamp).toLocaleString()}</td>
                 <td className="py-3 px-4 text-sm text-gray-600 truncate max-w-[200px]">{original_filename}</td>
                 <td className="py-3 px-4 text-center">
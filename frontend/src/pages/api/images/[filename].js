@@ -8,7 +8,7 @@ export const config = {
 };
 
 export default async function handler(req, res) {
-  const { filename } = req.query;
+  const { filename, size } = req.query;
   
   if (req.method !== 'GET') {
     return res.status(405).json({ error: 'Method not allowed' });
@@ -18,11 +18,27 @@ export default async function handler(req, res) {
     // Construct backend URL using environment variable
     const apiUrl = process.env.BACKEND_API_URL || 'http://backend_api:8386/api/v1/detect';
     const baseUrl = apiUrl.split('/api/v1/detect')[0]; // Extract base URL
-    const imageUrl = `${baseUrl}/api/v1/detect/images/${filename}`;
+    const query = size ? `?size=${encodeURIComponent(size)}` : '';
+    const imageUrl = `${baseUrl}/api/v1/detect/images/${encodeURIComponent(filename)}${query}`;
     
     console.log(`Proxying image request to: ${imageUrl}`);
     
-    const response = await fetch(imageUrl);
+    // Forward the browser's validators so unchanged images come back as 304
+    const conditionalHeaders = {};
+    ['if-none-match', 'if-modified-since'].forEach((name) => {
+      if (req.headers[name]) conditionalHeaders[name] = req.headers[name];
+    });
+    const response = await fetch(imageUrl, { headers: conditionalHeaders });
+
+    // Copy caching headers from the backend response
+    ['etag', 'last-modified', 'cache-control'].forEach((name) => {
+      const value = response.headers.get(name);
+      if (value) res.setHeader(name, value);
+    });
+
+    if (response.status === 304) {
+      return res.status(304).end();
+    }
     
     if (!response.ok) {
       throw new Error(`Failed to retrieve image: ${response.status} ${response.statusText}`);
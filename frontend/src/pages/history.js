@@ -1,4 +1,4 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import Head from 'next/head';
 import Link from 'next/link';
 import HistoryTable from '../components/HistoryTable';
@@ -19,6 +19,8 @@ export default function History() {
     dateFrom: '',
     dateTo: '',
   });
+  // Cursor of each page already reached, keyed by the query it belongs to
+  const cursors = useRef({});
 
   const fetchHistory = useCallback(async () => {
     setLoading(true);
@@ -34,6 +36,11 @@ export default function History() {
         if (value) params.append(key.replace(/([A-Z])/g, '_$1').toLowerCase(), value);
       });
 
+      // Pages reached by paging forward use the cursor, which stays fast on deep pages
+      const querySignature = JSON.stringify({ pageSize, filters });
+      const cursor = cursors.current[`${querySignature}:${page}`];
+      if (cursor) params.append('cursor', cursor);
+
       const [historyRes, countRes] = await Promise.all([
         fetch(`http://localhost:8386/api/v1/history?${params}`),
         fetch(`http://localhost:8386/api/v1/history/count?${params}`)
@@ -44,6 +51,10 @@ export default function History() {
       const historyResponse = await historyRes.json();
       const countResponse = await countRes.json();
 
+      if (historyResponse.next_cursor) {
+        cursors.current[`${querySignature}:${page + 1}`] = historyResponse.next_cursor;
+      }
+
       setHistory(historyResponse.data);
       setFilteredHistory(historyResponse.data);
       setTotalRecords(countResponse.data.count);